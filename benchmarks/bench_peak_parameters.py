@@ -0,0 +1,274 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Benchmarks for peak_parameters.py.
+
+Synthetic terrain with known peaks (a sum of Gaussian hills plus noise) is
+generated for each raster size, and the full PeakAnalyst -> Exporter
+pipeline is run on it with the in-process engine and raster validation.
+GRASS is replaced by the in-memory stand-in in benchmarks/standin, so no
+GRASS session is needed.
+
+Every case runs in its own process, so that its peak resident set size can
+be measured. Wall time, peak RSS and the time spent in each processing stage
+are written as JSON, which can be compared across commits:
+
+    python benchmarks/bench_peak_parameters.py --sizes 1000 2000 \
+        --output before.json
+    python benchmarks/bench_peak_parameters.py --sizes 1000 2000 \
+        --output after.json
+    python benchmarks/bench_peak_parameters.py --compare before.json after.json
+'''
+
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import resource
+import argparse
+import platform
+import tempfile
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+REPOSITORY = os.path.dirname(HERE)
+SCRIPT = os.path.join(REPOSITORY, 'peak_parameters.py')
+# Cell size of the synthetic terrain in map units
+RESOLUTION = 10.0
+
+def default_options():
+    '''
+    Reads the default options and flags from the GRASS header of
+    peak_parameters.py, so that new options never break the benchmarks.
+    @return options, flags: dictionaries as returned by grass.parser()
+    '''
+
+    with open(SCRIPT) as script:
+        header = script.read()
+    options = {}
+    for block in re.findall(r'#%Option\n(.*?)#%End', header, re.S):
+        key = re.search(r'#% key: (\S+)', block).group(1)
+        answer = re.search(r'#% answer: (.*)', block)
+        options[key] = answer.group(1).strip() if answer else ''
+    flags = {}
+    for block in re.findall(r'#%Flag\n(.*?)#%End', header, re.S):
+        flags[re.search(r'#% key: (\S+)', block).group(1)] = False
+    return options, flags
+
+def synthetic_terrain(size, peaks, seed):
+    '''
+    Generates a square elevation model of Gaussian hills plus noise.
+    @return dem, coordinates: The elevations and the (x, y) map coordinates
+                              of the hill tops
+    '''
+
+    import numpy
+    random = numpy.random.RandomState(seed)
+    dem = random.normal(0.0, 0.5, (size, size)).astype(numpy.float32)
+    dem += 500
+    rows = random.uniform(0, size, peaks)
+    cols = random.uniform(0, size, peaks)
+    heights = random.uniform(50, 300, peaks)
+    sigmas = random.uniform(5, 40, peaks)
+    for row, col, height, sigma in zip(rows, cols, heights, sigmas):
+        # Only add each hill where it is noticeably above zero
+        row0 = max(int(row - 4 * sigma), 0)
+        row1 = min(int(row + 4 * sigma) + 1, size)
+        col0 = max(int(col - 4 * sigma), 0)
+        col1 = min(int(col + 4 * sigma) + 1, size)
+        y, x = numpy.mgrid[row0:row1, col0:col1]
+        dem[row0:row1, col0:col1] += (height * numpy.exp(
+            -((y + 0.5 - row) ** 2 + (x + 0.5 - col) ** 2) /
+            (2 * sigma ** 2))).astype(numpy.float32)
+    coordinates = list(zip((cols * RESOLUTION).tolist(),
+                           ((size - rows) * RESOLUTION).tolist()))
+    return dem, coordinates
+
+def run_case(case):
+    '''
+    Runs one benchmark case in the current process.
+    @return result: The case plus its measurements
+    '''
+
+    sys.path.insert(0, REPOSITORY)
+    sys.path.insert(0, os.path.join(HERE, 'standin'))
+    import numpy
+    import grass.script as grass
+    import peak_parameters
+
+    dem, coordinates = synthetic_terrain(case['size'],
+                                         case['peaks'],
+                                         case['seed'])
+    grass.set_region(case['size'], case['size'], RESOLUTION)
+    grass.add_raster('dem', dem)
+    grass.add_points('peaks', coordinates)
+    del dem
+
+    options, flags = default_options()
+    export_directory = tempfile.mkdtemp()
+    options.update({'dem': 'dem',
+                    'peaks': 'peaks',
+                    'export_directory': export_directory,
+                    'window_sizes': case['windows'],
+                    'slope_thresholds': case['slopes'],
+                    'engine': 'numpy',
+                    'validation': 'raster',
+                    'workers': '1',
+                    'cache_directory': ''})
+    options.update(case['options'])
+    flags.update({'t': True, 'f': True, 'n': True, 's': True})
+
+    start = time.time()
+    analyst = peak_parameters.PeakAnalyst(options, flags)
+    analyst.sweep()
+    sweep_end = time.time()
+    # Keep the exporter's table out of the benchmark output
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        peak_parameters.Exporter(analyst.results, flags, options)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+    end = time.time()
+    shutil.rmtree(export_directory, ignore_errors=True)
+
+    stages = dict(analyst.timings)
+    stages['export'] = end - sweep_end
+    summary = analyst.results.metric('summarize')
+    result = dict(case)
+    result.update({
+        'wall_time': end - start,
+        # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss /
+                       (1024.0 ** 2 if sys.platform == 'darwin' else 1024.0),
+        'stages': stages,
+        'best_summary': float(numpy.nanmax(summary)),
+        'modules': len(grass.calls)})
+    return result
+
+def run_in_subprocess(case):
+    '''
+    Runs one benchmark case in a fresh interpreter.
+    '''
+
+    output = subprocess.check_output([sys.executable,
+                                      os.path.abspath(__file__),
+                                      '--case',
+                                      json.dumps(case)])
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+def git_commit():
+    '''
+    Returns the commit of the repository, or None outside of git.
+    '''
+
+    try:
+        output = subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                         cwd=REPOSITORY,
+                                         stderr=subprocess.STDOUT)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return output.decode().strip()
+
+def case_key(case):
+    return (case['size'], case['mode'], case['windows'], case['slopes'],
+            case['peaks'])
+
+def compare(before_path, after_path):
+    '''
+    Prints the change of wall time and peak RSS between two result files.
+    '''
+
+    with open(before_path) as before_file:
+        before = json.load(before_file)
+    with open(after_path) as after_file:
+        after = json.load(after_file)
+    previous = dict((case_key(case), case) for case in before['cases'])
+    print('Comparing ' + str(before['commit'])[:10] + ' with ' +
+          str(after['commit'])[:10])
+    print('size'.ljust(8) + 'mode'.ljust(14) + 'time (s)'.rjust(22) +
+          'peak RSS (MB)'.rjust(24))
+    for case in after['cases']:
+        old = previous.get(case_key(case))
+        if old is None:
+            continue
+        print(str(case['size']).ljust(8) + case['mode'].ljust(14) +
+              ('%.2f -> %.2f (x%.2f)' % (old['wall_time'],
+                                         case['wall_time'],
+                                         case['wall_time'] /
+                                         old['wall_time'])).rjust(22) +
+              ('%.0f -> %.0f (x%.2f)' % (old['peak_rss_mb'],
+                                         case['peak_rss_mb'],
+                                         case['peak_rss_mb'] /
+                                         old['peak_rss_mb'])).rjust(24))
+
+# Options of PeakAnalyst used by each benchmark mode, as functions of the
+# raster size. Tiles are half the raster on a side, so every size is split
+# into four tiles.
+MODES = {'grid': lambda size: {'sweep': 'grid'},
+         'incremental': lambda size: {'sweep': 'incremental'},
+         'tiled': lambda size: {'sweep': 'grid',
+                                'tile_size': str(max(size // 2, 1))}}
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the peak_parameters.py pipeline on '
+                    'synthetic terrain.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 2000],
+                        help='raster sizes in cells per side')
+    parser.add_argument('--modes', nargs='+', default=['grid', 'incremental'],
+                        choices=sorted(MODES),
+                        help='ways of sweeping the parameters')
+    parser.add_argument('--windows', default='3,5,9,19,39,69',
+                        help='window sizes separated by commas')
+    parser.add_argument('--slopes', default='1-10:1',
+                        help='slope thresholds separated by commas')
+    parser.add_argument('--peaks', type=int, default=None,
+                        help='number of hills (default: 50 per million '
+                             'cells)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='JSON file for the results')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'),
+                        help='compare two result files and exit')
+    parser.add_argument('--case', help=argparse.SUPPRESS)
+    arguments = parser.parse_args()
+
+    if arguments.case:
+        print(json.dumps(run_case(json.loads(arguments.case))))
+        return
+    if arguments.compare:
+        compare(*arguments.compare)
+        return
+
+    results = {'commit': git_commit(),
+               'python': platform.python_version(),
+               'machine': platform.machine(),
+               'cases': []}
+    for size in arguments.sizes:
+        for mode in arguments.modes:
+            peaks = arguments.peaks
+            if peaks is None:
+                peaks = max(int(50 * size * size / 1e6), 1)
+            case = {'size': size,
+                    'mode': mode,
+                    'windows': arguments.windows,
+                    'slopes': arguments.slopes,
+                    'peaks': peaks,
+                    'seed': arguments.seed,
+                    'options': MODES[mode](size)}
+            result = run_in_subprocess(case)
+            results['cases'].append(result)
+            sys.stderr.write('%5d %-12s %8.2f s %8.0f MB\n' %
+                             (size, mode, result['wall_time'],
+                              result['peak_rss_mb']))
+    if arguments.output:
+        with open(arguments.output, 'w') as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+    else:
+        print(json.dumps(results, indent=2, sort_keys=True))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+'''
+A minimal, in-memory stand-in for grass.script, used by the benchmarks to
+run PeakAnalyst without a GRASS session.
+
+Only what the in-process path (engine=numpy, validation=raster) needs is
+available: rasters and point maps are kept in dictionaries, the region is a
+dictionary, and g.region can select a block of it for tiled reads. Calls to
+any other GRASS module are fatal errors. The module functions are those of
+a MemorySession, which shares its implementation with the sessions of
+peak_parameters_standalone.py.
+'''
+
+import peak_parameters_standalone
+
+class MemorySession(peak_parameters_standalone.Session):
+    '''
+    A Session on rasters and point maps kept in dictionaries, covering a
+    region set with set_region(). The names of all modules called are kept
+    in calls, in order.
+    '''
+
+    def __init__(self):
+        peak_parameters_standalone.Session.__init__(self)
+        self.rasters = {}
+        self.points = {}
+        self.calls = []
+        self.bounds = {}
+
+    def extent(self):
+        return dict(self.bounds)
+
+    def read_block(self, name, row0, row1, col0, col1):
+        return self.rasters[name][row0:row1, col0:col1].copy()
+
+    def read_points(self, name):
+        return self.points[name]
+
+    def write_raster(self, name, data):
+        self.rasters[name] = data
+
+    def remove_rasters(self, names):
+        for name in names:
+            self.rasters.pop(name, None)
+
+    def run_command(self, module, **kwargs):
+        self.calls.append(module)
+        return peak_parameters_standalone.Session.run_command(self,
+                                                              module,
+                                                              **kwargs)
+
+    def read_command(self, module, **kwargs):
+        self.calls.append(module)
+        return peak_parameters_standalone.Session.read_command(self,
+                                                               module,
+                                                               **kwargs)
+
+    def pipe_command(self, module, **kwargs):
+        self.calls.append(module)
+        return peak_parameters_standalone.Session.pipe_command(self,
+                                                               module,
+                                                               **kwargs)
+
+    def gisenv(self):
+        env = peak_parameters_standalone.Session.gisenv(self)
+        env.update({'LOCATION_NAME': 'standin', 'MAPSET': 'standin'})
+        return env
+
+_session = MemorySession()
+# Maps of the stand-in session
+rasters = _session.rasters
+points = _session.points
+# Names of all modules called, in order
+calls = _session.calls
+
+def set_region(rows, cols, resolution, north=None, west=0.0):
+    '''
+    Sets the region of the stand-in session.
+    '''
+
+    if north is None:
+        north = rows * resolution
+    _session.bounds.clear()
+    _session.bounds.update({'n': float(north),
+                            's': float(north - rows * resolution),
+                            'w': float(west),
+                            'e': float(west + cols * resolution),
+                            'nsres': float(resolution),
+                            'ewres': float(resolution),
+                            'rows': rows,
+                            'cols': cols})
+    _session.block = None
+
+def add_raster(name, data):
+    '''
+    Adds a raster map covering the whole region.
+    '''
+
+    rasters[name] = data
+
+def add_points(name, coordinates):
+    '''
+    Adds a vector map of points given as (x, y) pairs.
+    '''
+
+    points[name] = list(coordinates)
+
+region = _session.region
+run_command = _session.run_command
+read_command = _session.read_command
+pipe_command = _session.pipe_command
+use_temp_region = _session.use_temp_region
+del_temp_region = _session.del_temp_region
+find_file = _session.find_file
+gisenv = _session.gisenv
+tempfile = _session.tempfile
+message = _session.message
+warning = _session.warning
+fatal = _session.fatal
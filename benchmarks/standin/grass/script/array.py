@@ -0,0 +1,9 @@
+'''
+Stand-in for grass.script.array, reading and writing the in-memory rasters
+of the stand-in session.
+'''
+
+from grass import script as grass
+
+# A NumPy array of the current region, or of the selected block of it
+array = grass._session.array.array
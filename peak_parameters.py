@@ -42,280 +42,3527 @@
 #% description: Leave morphometric maps in mapset
 #% guisection: Optional
 #%End
+#%Flag
+#% key: x
+#% description: Invalidate cached results of this data set before running
+#% guisection: Optional
+#%End
+#%Flag
+#% key: c
+#% description: Check the NumPy engine against r.param.scale
+#% guisection: Optional
+#%End
+#%Flag
+#% key: r
+#% description: Report how the summary index of pyramid windows differs from full resolution
+#% guisection: Optional
+#%End
+#%Flag
+#% key: p
+#% description: Profile GRASS module calls and write a trace to the export directory
+#% guisection: Optional
+#%End
+#%Flag
+#% key: m
+#% description: Low-memory mode: fit in single precision and keep peak masks bit-packed (engine=numpy, validation=raster)
+#% guisection: Optional
+#%End
+
+#%Option
+#% key: dem
+#% description: The input elevation map, or several maps tuned together in a batch
+#% gisprompt: old,cell,raster
+#% multiple: yes
+#% required: no
+#%End
+#%Option
+#% key: dem_pattern
+#% type: string
+#% description: Pattern of elevation maps tuned together in a batch (e.g. tile_*)
+#% required: no
+#%End
+#%Option
+#% key: peaks
+#% description: A vector map of training peaks as points
+#% gisprompt: old,vector
+#% required: yes
+#%End
+#%Option
+#% key: window_sizes
+#% type: string
+#% description: A list of integer window sizes separated by commas
+#% required: yes
+#% answer: 3, 5, 9, 19, 39, 69
+#%End
+#%Option
+#% key: slope_thresholds
+#% type: string
+#% description: A list of slope thresholds separated by commas. Ranges are given as start-stop:step
+#% required: yes
+#% answer: 1, 2, 3, 4, 5, 6, 7, 8, 9, 10
+#%End
+#%Option
+#% key: export_directory
+#% type: string
+#% description: The directory to export CSVs to.
+#% required: yes
+#% gisprompt: old,dbase,dbase
+#%End
+#%Option
+#% key: formats
+#% type: string
+#% description: Formats the results are exported in
+#% options: csv,npz,parquet
+#% descriptions: csv;One wide CSV per error value and metric;npz;NumPy archive of all error values;parquet;Parquet table of all combinations in long format (requires PyArrow)
+#% multiple: yes
+#% answer: csv,npz
+#% required: no
+#% guisection: Optional
+#%End
+#%Option
+#% key: engine
+#% type: string
+#% description: The engine used to classify terrain features
+#% options: grass,numpy
+#% answer: grass
+#% required: no
+#% guisection: Optional
+#%End
+#%Option
+#% key: validation
+#% type: string
+#% description: How classified peaks are compared with the training peaks
+#% options: vector,raster
+#% answer: vector
+#% required: no
+#% guisection: Validation measurements
+#%End
+#%Option
+#% key: connectivity
+#% type: integer
+#% description: Neighbours joining peak cells into one peak area with raster validation (4 matches the areas of r.to.vect)
+#% options: 4,8
+#% answer: 8
+#% required: no
+#% guisection: Validation measurements
+#%End
+#%Option
+#% key: match_radius
+#% type: double
+#% description: Distance in map units within which a training peak matches a peak area (0 for exact matching)
+#% answer: 0
+#% required: no
+#% guisection: Validation measurements
+#%End
+#%Option
+#% key: search
+#% type: string
+#% description: Evaluate the whole grid or search its range coarse to fine
+#% options: grid,refine
+#% answer: grid
+#% required: no
+#% guisection: Optional
+#%End
+#%Option
+#% key: budget
+#% type: integer
+#% description: Maximum number of combinations evaluated by a refining search
+#% answer: 30
+#% required: no
+#% guisection: Optional
+#%End
+#%Option
+#% key: sweep
+#% type: string
+#% description: How slope thresholds are swept for each window size
+#% options: grid,incremental
+#% answer: grid
+#% required: no
+#% guisection: Optional
+#%End
+#%Option
+#% key: tile_size
+#% type: integer
+#% description: Process the elevation model in tiles of this many rows and columns (0 for no tiles)
+#% answer: 0
+#% required: no
+#% guisection: Optional
+#%End
+#%Option
+#% key: pyramid_window
+#% type: integer
+#% description: Classify windows larger than this on a downsampled elevation model (0 for full resolution only)
+#% answer: 0
+#% required: no
+#% guisection: Optional
+#%End
+#%Option
+#% key: pyramid_factor
+#% type: integer
+#% description: Factor by which the elevation model is downsampled for pyramid windows
+#% answer: 2
+#% required: no
+#% guisection: Optional
+#%End
+#%Option
+#% key: workers
+#% type: integer
+#% description: Number of worker processes sweeping the parameters
+#% answer: 1
+#% required: no
+#% guisection: Optional
+#%End
+#%Option
+#% key: concurrent_modules
+#% type: integer
+#% description: Number of GRASS modules run at once by an asyncio scheduler (0 to run them one after another, engine=grass only)
+#% answer: 0
+#% required: no
+#% guisection: Optional
+#%End
+#%Option
+#% key: min_summary
+#% type: double
+#% description: Stop evaluating larger slope thresholds of a window once its summary index falls below this value (needs concurrent_modules)
+#% required: no
+#% guisection: Optional
+#%End
+#%Option
+#% key: cache_directory
+#% type: string
+#% description: Directory of a result cache shared between runs
+#% required: no
+#% guisection: Optional
+#%End
+#%Option
+#% key: mask_directory
+#% type: string
+#% description: Directory of a store of peak masks, so that new training peaks are evaluated without classifying the elevation model again
+#% required: no
+#% guisection: Optional
+#%End
+#%Option
+#% key: cache_size
+#% type: integer
+#% description: Maximum number of combinations kept in the result cache
+#% answer: 10000
+#% required: no
+#% guisection: Optional
+#%End
+#%Option
+#% key: fit_cache
+#% type: integer
+#% description: Number of window sizes whose fitted surfaces the NumPy engine keeps in memory
+#% answer: 1
+#% required: no
+#% guisection: Optional
+#%End
+
+#%Rules
+#% required: dem, dem_pattern
+#%End
+
+import os
+import csv
+import asyncio
+import glob
+import json
+import time
+import uuid
+import heapq
+import hashlib
+import sqlite3
+import shutil
+import tempfile
+import importlib
+import itertools
+import contextlib
+import collections
+import multiprocessing
+
+import numpy
+from numpy.lib.stride_tricks import sliding_window_view
+
+# SciPy is only needed for raster validation.
+try:
+    from scipy import ndimage
+except ImportError:
+    ndimage = None
+
+class LazyGrass(object):
+    '''
+    Stands in for grass.script until one of its functions is used, so that
+    runs on files outside of a GRASS session (see use_session()) never
+    import it.
+    '''
+
+    def __getattr__(self, name):
+        global grass
+        module = importlib.import_module('grass.script')
+        # A tracer may hold on to the proxy, which keeps working
+        if grass is self:
+            grass = module
+        return getattr(module, name)
+
+grass = LazyGrass()
+
+def use_session(session):
+    '''
+    Runs the module on session instead of grass.script. A session provides
+    the functions of grass.script that the NumPy engine with raster
+    validation needs, an array attribute standing in for grass.script.array
+    and a true standalone attribute (see peak_parameters_standalone.py).
+    '''
+
+    global grass
+    grass = session
+
+def standalone_session():
+    '''
+    Returns the session used instead of grass.script, or None.
+    '''
+
+    session = grass.module if isinstance(grass, GrassTracer) else grass
+    if isinstance(session, LazyGrass):
+        return None
+    if not getattr(session, 'standalone', False):
+        return None
+    return session
+
+def raster_arrays():
+    '''
+    Returns the module that reads and writes rasters as NumPy arrays:
+    grass.script.array, or its stand-in in a standalone session.
+    '''
+
+    session = standalone_session()
+    if session is not None:
+        return session.array
+    from grass.script import array
+    return array
+
+# Feature codes as written by r.param.scale method=feature
+PLANAR, PIT, CHANNEL, PASS, RIDGE, PEAK = range(1, 7)
+# Error values counted for every found peak map
+ERROR_VALUES = ['true positives', 'false positives', 'false negatives']
+# Metrics derived from the error values when summarizing
+DERIVED_METRICS = ['precision', 'recall', 'f1']
+# Finest slope threshold spacing of a refining search, in degrees
+SEARCH_SLOPE_STEP = 0.1
+# Smallest window for which summed-area tables replace direct convolution
+SAT_MIN_WINDOW = 15
+# Rasters of fitted surface parameters returned by FeatureClassifier.fit()
+FIT_PARAMETERS = ['slope', 'crosc', 'maxic', 'minic']
+# Row and column offsets of the neighbours joining peak cells into patches,
+# by connectivity
+NEIGHBOURS = {4: [(-1, 0), (0, -1), (0, 1), (1, 0)],
+              8: [(-1, -1), (-1, 0), (-1, 1), (0, -1),
+                  (0, 1), (1, -1), (1, 0), (1, 1)]}
+# Cells fitted, classified or labeled at once in low-memory mode
+LOW_MEMORY_BAND_CELLS = 1 << 20
+# Functions of grass.script that are timed by a GrassTracer
+TRACED_FUNCTIONS = ['run_command', 'read_command', 'write_command',
+                    'parse_command', 'pipe_command']
+# Name of the trace file written to the export directory
+TRACE_FILE = 'grass_trace.json'
+# Name of the pyramid report written to the export directory
+PYRAMID_FILE = 'pyramid_difference.csv'
+# Names of the result files written to the export directory besides the
+# wide CSVs
+STREAM_FILE = 'results.csv'
+NPZ_FILE = 'results.npz'
+PARQUET_FILE = 'results.parquet'
+
+def parse_error_values(flags):
+    '''
+    Parses flag dictionary from GRASS parser into text descriptions
+    @return error_values: A list of error values 
+    '''
+    # Append error flags to error values list
+    error_values = []
+    for error_flag in flags.keys():
+        # Skip flags that do not select error values
+        if error_flag not in 'tfns':
+            continue
+        if flags[error_flag]:
+            error_values.append(error_flag) # Replace error values from flags with readable strings
+    
+    if 't' in error_values:
+        error_values.remove('t')
+        error_values.append('true positives')
+    if 'f' in error_values:
+        error_values.remove('f')
+        error_values.append('false positives')
+    if 'n' in error_values:
+        error_values.remove('n')
+        error_values.append('false negatives')
+    if 's' in error_values:
+        error_values.remove('s')
+        error_values.append('summarize')
+    return error_values
+
+def running_moments(array, window, max_power, block=1024):
+    '''
+    Calculates sums of u^p * array over every complete window along the rows
+    of a 2D array, where u is the column offset from the central cell and p
+    runs from 0 to max_power.
+
+    The sums are taken from prefix sums (one row of a summed-area table per
+    power), so the cost per cell does not depend on the window size. To keep
+    the prefix sums from losing precision on wide rasters, they are built
+    block by block with column indices counted from the start of the block.
+
+    Returns a list of arrays with one column per complete window.
+    '''
+
+    half = window // 2
+    rows, columns = array.shape
+    output_columns = columns - window + 1
+    results = [numpy.empty((rows, max(output_columns, 0)))
+               for power in range(max_power + 1)]
+    for start in range(0, max(output_columns, 0), block):
+        stop = min(start + block, output_columns)
+        chunk = array[:, start:stop + window - 1]
+        # Offsets of the chunk's columns from the first window's centre
+        offsets = numpy.arange(chunk.shape[1], dtype=numpy.float64) - half
+        # Window sums of offset^k * array for every window in the block
+        sums = []
+        weighted = chunk.astype(numpy.float64)
+        for power in range(max_power + 1):
+            prefix = numpy.zeros((rows, chunk.shape[1] + 1))
+            numpy.cumsum(weighted, axis=1, out=prefix[:, 1:])
+            sums.append(prefix[:, window:] - prefix[:, :-window])
+            weighted = weighted * offsets
+        # Shift the offsets to each window's own centre:
+        # sum (offset - i)^p z = sum_k C(p, k) (-i)^(p - k) sum offset^k z
+        shift = -numpy.arange(stop - start, dtype=numpy.float64)
+        for power in range(max_power + 1):
+            total = numpy.zeros((rows, stop - start))
+            for k in range(power + 1):
+                coefficient = (binomial(power, k) *
+                               shift ** (power - k))
+                total += coefficient * sums[k]
+            results[power][:, start:stop] = total
+    return results
+
+def binomial(n, k):
+    '''
+    Returns the binomial coefficient n over k.
+    '''
+
+    result = 1
+    for i in range(k):
+        result = result * (n - i) // (i + 1)
+    return result
+
+class FeatureClassifier(object):
+    '''
+    An in-process version of the quadratic surface fit and feature
+    classification performed by r.param.scale.
+
+    The elevation model is held in memory as a NumPy array, so it only has to
+    be read once for all window sizes and slope thresholds. As in
+    r.param.scale, the surface
+
+        z = ax^2 + by^2 + cxy + dx + ey + f
+
+    is fitted by unweighted least squares to every window, with x and y
+    measured in map units from the central cell. Cells closer than half a
+    window to the edge of the map, or whose window contains null cells, are
+    not classified.
+
+    In single precision (dtype float32), the centered elevation model and
+    the fitted parameters are stored as float32, and windows are fitted in
+    bands of about band_cells cells, so that the double precision window
+    sums only ever cover one band. The sums themselves stay in double
+    precision, because the curvatures are differences of large sums that
+    would lose most of their digits in float32. Compared with double
+    precision, and so with r.param.scale:
+
+    - rounding the elevations to float32 and removing their mean moves each
+      centered elevation by at most e = 2^-24 (max|z| + max|z - mean|),
+    - the fitted parameters are linear in the elevations, so the slope of a
+      window moves by at most e sqrt(2) sum|w_d| radians, and maxic and
+      minic by at most res e (sum|w_a+b| + hypot(sum|w_a-b|, sum|w_c|)),
+      where the w are the least squares weights of the window cells. For
+      window sizes 3, 5 and 9 these come to 81, 49 and 27 degrees times
+      e/res, and 4.9, 1.4 and 0.42 times e/res. On a 1 m model with 3600 m
+      of relief, the curvatures of window size 3 can move by 1.6e-3, more
+      than the default curvature tolerance of 1e-4,
+    - slopes and curvatures are then rounded to 2^-24 of their magnitude,
+
+    so a cell can only change its class if its slope lies that close to the
+    slope threshold, or one of its curvatures that close to the curvature
+    tolerance. rounding_bounds() gives the bounds for a window size. crosc
+    divides by the gradient and has no such bound, but it only separates
+    ridges from channels on sloped cells, which are never peaks.
+    '''
+
+    def __init__(self,
+                 dem,
+                 resolution,
+                 curvature_tolerance=0.0001,
+                 moments='auto',
+                 dtype=numpy.float64,
+                 band_cells=None):
+        '''
+        Inputs:
+            dem: 2D array of elevations, null cells as NaN
+            resolution: float (east-west cell size in map units)
+            curvature_tolerance: float (as for r.param.scale)
+            moments: string (convolve sums every window directly, sat uses
+                             summed-area tables, auto picks sat for windows
+                             of at least SAT_MIN_WINDOW cells)
+            dtype: NumPy float type of the elevations and fitted parameters
+            band_cells: int (number of cells fitted at once, None to fit
+                             the whole raster at once)
+        '''
+
+        self.resolution = float(resolution)
+        self.curvature_tolerance = curvature_tolerance
+        self.dtype = numpy.dtype(dtype)
+        self.band_cells = band_cells
+        dem = numpy.asarray(dem, dtype=self.dtype)
+        # The fitted curvatures and slope do not depend on the absolute
+        # elevation, so the mean is removed to keep the sums small.
+        self.valid = numpy.isfinite(dem)
+        mean = dem[self.valid].mean(dtype=numpy.float64)
+        self.dem = numpy.where(self.valid, 
+                               dem - self.dtype.type(mean), 
+                               self.dtype.type(0))
+        # Largest rounding error of a centered elevation
+        self.rounding = 0.0
+        if self.valid.any():
+            self.rounding = (float(numpy.finfo(self.dtype).eps) / 2 *
+                             (float(numpy.abs(dem[self.valid]).max()) +
+                              float(numpy.abs(self.dem).max())))
+        self.shape = dem.shape
+        self.moments = moments
+
+    def share(self, path):
+        '''
+        Writes the centered elevation model and its valid cells to .npy
+        files starting with path, for attach() in other processes.
+        '''
+
+        numpy.save(path + '_dem.npy', self.dem)
+        numpy.save(path + '_valid.npy', self.valid)
+        numpy.save(path + '_rounding.npy', numpy.array(self.rounding))
+
+    @classmethod
+    def attach(cls,
+               path,
+               resolution,
+               curvature_tolerance=0.0001,
+               moments='auto',
+               band_cells=None):
+        '''
+        Makes a classifier on the arrays written by share(). They are
+        memory-mapped read-only, so all processes attached to the same files
+        share one copy of the elevation model in the page cache.
+        '''
+
+        classifier = cls.__new__(cls)
+        classifier.resolution = float(resolution)
+        classifier.curvature_tolerance = curvature_tolerance
+        classifier.dem = numpy.load(path + '_dem.npy', mmap_mode='r')
+        classifier.valid = numpy.load(path + '_valid.npy', mmap_mode='r')
+        classifier.shape = classifier.dem.shape
+        classifier.moments = moments
+        classifier.dtype = classifier.dem.dtype
+        classifier.band_cells = band_cells
+        classifier.rounding = float(numpy.load(path + '_rounding.npy'))
+        return classifier
+
+    def rounding_bounds(self, window):
+        '''
+        Bounds how far the rounding of the centered elevation model can move
+        the fitted slope (degrees) and the maxic and minic curvatures of a
+        window size. See the class docstring.
+        '''
+
+        half = window // 2
+        res = self.resolution
+        offsets = numpy.arange(-half, half + 1, dtype=numpy.float64)
+        u, v = numpy.meshgrid(offsets, offsets)
+        # Least squares weights of the window cells, as in fit_band()
+        sum_u2 = (offsets ** 2).sum()
+        sum_u4 = (offsets ** 4).sum()
+        n = float(window * window)
+        sum_x2 = window * sum_u2 * res ** 2
+        sum_x4 = window * sum_u4 * res ** 4
+        sum_x2y2 = sum_u2 ** 2 * res ** 4
+        d = u * res / sum_x2
+        c = u * v * res ** 2 / sum_x2y2
+        a_minus_b = (u * u - v * v) * res ** 2 / (sum_x4 - sum_x2y2)
+        a_plus_b = (((u * u + v * v) * res ** 2 - 2 * sum_x2 / n) /
+                    (sum_x4 + sum_x2y2 - 2 * sum_x2 ** 2 / n))
+        slope = numpy.degrees(self.rounding * numpy.sqrt(2) *
+                              numpy.abs(d).sum())
+        curvature = res * self.rounding * (
+            numpy.abs(a_plus_b).sum() +
+            numpy.hypot(numpy.abs(a_minus_b).sum(), numpy.abs(c).sum()))
+        return float(slope), float(curvature)
+
+    def window_moments(self, window, row0=0, row1=None):
+        '''
+        Calculates the moment sums of the elevations within every complete
+        window of a band of rows, by default all of them.
+
+        Returns a dictionary with the sums of z, u*z, v*z, u*v*z, u^2*z and
+        v^2*z, where u and v are the column and row offsets from the central
+        cell, plus the number of valid cells in each window. Every array only
+        covers cells with a complete window.
+        '''
+
+        dem = self.dem[row0:row1]
+        valid = self.valid[row0:row1]
+        if (self.moments == 'sat' or
+            (self.moments == 'auto' and window >= SAT_MIN_WINDOW)):
+            return self.summed_moments(dem, valid, window)
+        return self.convolved_moments(dem, valid, window)
+
+    def summed_moments(self, dem, valid, window):
+        '''
+        Calculates the window moment sums from summed-area tables, so the cost
+        per cell does not depend on the window size.
+
+        The tables are built separably: running sums along the rows give the
+        row moments, and running sums of those along the columns give the
+        window moments. See running_moments() for how precision is kept.
+        '''
+
+        horizontal = running_moments(dem, window, 2)
+        count = running_moments(valid.astype(numpy.float64), window, 0)
+
+        def vertical(array, power):
+            # Transpose so that the running sums run down the columns
+            return [m.T for m in running_moments(array.T, window, power)]
+
+        z, vz, vvz = vertical(horizontal[0], 2)
+        uz, uvz = vertical(horizontal[1], 1)
+        uuz, = vertical(horizontal[2], 0)
+        return {'n': vertical(count[0], 0)[0],
+                'z': z,
+                'uz': uz,
+                'vz': vz,
+                'uvz': uvz,
+                'uuz': uuz,
+                'vvz': vvz}
+
+    def convolved_moments(self, dem, valid, window):
+        '''
+        Calculates the window moment sums using separable, vectorized window
+        convolutions. The cost per cell grows with the window size, but the
+        sums are exact, which matters most for small windows.
+        '''
+
+        half = window // 2
+        offsets = numpy.arange(-half, half + 1, dtype=numpy.float64)
+        kernels = [numpy.ones(window), offsets, offsets ** 2]
+        # Sum along the rows first, then along the columns.
+        rows = sliding_window_view(dem, window, axis=1)
+        horizontal = [rows.dot(kernel) for kernel in kernels]
+
+        def vertical(array, kernel):
+            return sliding_window_view(array, window, axis=0).dot(kernel)
+
+        count = sliding_window_view(valid.astype(numpy.float64),
+                                    window, axis=1).sum(axis=-1)
+        return {'n': vertical(count, kernels[0]),
+                'z': vertical(horizontal[0], kernels[0]),
+                'uz': vertical(horizontal[1], kernels[0]),
+                'vz': vertical(horizontal[0], kernels[1]),
+                'uvz': vertical(horizontal[1], kernels[1]),
+                'uuz': vertical(horizontal[2], kernels[0]),
+                'vvz': vertical(horizontal[0], kernels[2])}
+
+    def fit(self, window):
+        '''
+        Fits the quadratic surface for a window size.
+
+        Returns a dictionary of full sized rasters with the parameters
+        r.param.scale uses to classify features: slope (degrees), crosc,
+        maxic and minic. Unclassified cells are NaN.
+        '''
+
+        if window < 3 or window % 2 == 0:
+            raise ValueError('Window size must be an odd integer >= 3.')
+        half = window // 2
+        rows, columns = self.shape
+        # Rows of cells with a complete window
+        core_rows = rows - window + 1
+        band = core_rows
+        if self.band_cells:
+            # Bands overlap by a window less one row, which is recomputed
+            band = max(self.band_cells // columns, window)
+        parameters = None
+        for row0 in range(0, core_rows, band):
+            row1 = min(row0 + band, core_rows)
+            core = self.fit_band(window, row0, row1 + window - 1)
+            # Allocated after the first band, so that the full rasters never
+            # add up with the sums of a whole raster fitted at once
+            if parameters is None:
+                parameters = dict((name, numpy.full(self.shape, 
+                                                    numpy.nan,
+                                                    dtype=self.dtype))
+                                  for name in core)
+            for name in core:
+                parameters[name][row0 + half:row1 + half, 
+                                 half:columns - half] = core[name]
+            del core
+        if parameters is None:
+            parameters = dict((name, numpy.full(self.shape, 
+                                                numpy.nan,
+                                                dtype=self.dtype))
+                              for name in FIT_PARAMETERS)
+        return parameters
+
+    def fit_band(self, window, row0, row1):
+        '''
+        Fits the quadratic surface for a window size to the cells with a
+        complete window within rows row0 to row1.
+
+        Returns a dictionary of double precision rasters of slope, crosc,
+        maxic and minic, covering the cells with a complete window.
+        '''
+
+        moments = self.window_moments(window, row0, row1)
+        half = window // 2
+        res = self.resolution
+        # Sums of the coordinate powers over a complete window. These are
+        # the same for every cell, which decouples the normal equations.
+        offsets = numpy.arange(-half, half + 1, dtype=numpy.float64)
+        sum_u2 = (offsets ** 2).sum()
+        sum_u4 = (offsets ** 4).sum()
+        n = float(window * window)
+        sum_x2 = window * sum_u2 * res ** 2
+        sum_x4 = window * sum_u4 * res ** 4
+        sum_x2y2 = sum_u2 ** 2 * res ** 4
+        # Rows run southwards, so y = -v * res.
+        d = moments['uz'] * res / sum_x2
+        e = -moments['vz'] * res / sum_x2
+        c = -moments['uvz'] * res ** 2 / sum_x2y2
+        a_minus_b = ((moments['uuz'] - moments['vvz']) * res ** 2 /
+                     (sum_x4 - sum_x2y2))
+        a_plus_b = (((moments['uuz'] + moments['vvz']) * res ** 2 -
+                     2 * sum_x2 * moments['z'] / n) /
+                    (sum_x4 + sum_x2y2 - 2 * sum_x2 ** 2 / n))
+        a = (a_plus_b + a_minus_b) / 2
+        b = (a_plus_b - a_minus_b) / 2
+        del moments['z'], moments['uz'], moments['vz'], moments['uvz']
+
+        gradient = d * d + e * e
+        slope = numpy.degrees(numpy.arctan(numpy.sqrt(gradient)))
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            crosc = (res * -2.0 * (b * d * d + a * e * e - c * d * e) /
+                     gradient)
+        root = numpy.sqrt((a - b) ** 2 + c * c)
+        maxic = res * (-a - b + root)
+        minic = res * (-a - b - root)
+
+        incomplete = moments['n'] < n
+        parameters = {}
+        for name, core in [('slope', slope), ('crosc', crosc),
+                           ('maxic', maxic), ('minic', minic)]:
+            core[incomplete] = numpy.nan
+            parameters[name] = core
+        return parameters
+
+    def classify(self, parameters, slope_threshold):
+        '''
+        Classifies fitted surface parameters into r.param.scale features.
+
+        Returns an integer raster of feature codes, with 0 for unclassified
+        cells.
+        '''
+
+        tolerance = self.curvature_tolerance
+        slope = parameters['slope']
+        crosc = parameters['crosc']
+        maxic = parameters['maxic']
+        minic = parameters['minic']
+        features = numpy.zeros(self.shape, dtype=numpy.int32)
+        with numpy.errstate(invalid='ignore'):
+            sloped = slope > slope_threshold
+            flat = slope <= slope_threshold
+            # Sloping cells are classified by their cross-sectional curvature
+            features[sloped] = PLANAR
+            features[sloped & (crosc > tolerance)] = RIDGE
+            features[sloped & (crosc < -tolerance)] = CHANNEL
+            # Flat cells are classified by their maximum and minimum curvature
+            features[flat] = PLANAR
+            features[flat & (minic < -tolerance)] = CHANNEL
+            features[flat & (minic < -tolerance) &
+                     (maxic < -tolerance)] = PIT
+            convex = flat & (maxic > tolerance)
+            features[convex] = RIDGE
+            features[convex & (minic < -tolerance)] = PASS
+            features[convex & (minic > tolerance)] = PEAK
+        return features
+
+    def packed_peaks(self, parameters, slope_threshold):
+        '''
+        Classifies only the peak cells of fitted surface parameters, band by
+        band, without an integer raster of all features.
+        @return peaks: PackedMask of the cells classified as PEAK
+        '''
+
+        tolerance = self.curvature_tolerance
+        rows, columns = self.shape
+        band = rows
+        if self.band_cells:
+            band = max(self.band_cells // columns, 1)
+        bits = numpy.empty((rows, -(-columns // 8)), dtype=numpy.uint8)
+        for row0 in range(0, rows, band):
+            row1 = min(row0 + band, rows)
+            with numpy.errstate(invalid='ignore'):
+                # Flat cells with a convex maximum and minimum curvature
+                peaks = ((parameters['slope'][row0:row1] <= slope_threshold) &
+                         (parameters['maxic'][row0:row1] > tolerance) &
+                         (parameters['minic'][row0:row1] > tolerance))
+            bits[row0:row1] = numpy.packbits(peaks, axis=1)
+        return PackedMask(bits, self.shape)
+
+def parse_slope_thresholds(thresholds):
+    '''
+    Parses a comma separated list of slope thresholds. Entries with a colon,
+    of the form start-stop:step, are expanded into ranges including stop;
+    other entries are numbers, which may have exponents. Integral values
+    are returned as integers, so map names and headers stay unchanged.
+    Malformed or negative entries are fatal errors.
+    @return slope_thresholds: A list of numbers
+    '''
+
+    slope_thresholds = []
+    for entry in thresholds.split(','):
+        entry = entry.strip()
+        try:
+            if ':' in entry:
+                bounds, step = entry.split(':')
+                # The bounds are split at the first minus that is neither a
+                # sign nor part of an exponent, as in 1e-3-5e-3:1e-3
+                minus = [i for i, char in enumerate(bounds) if char == '-' and
+                         i > 0 and bounds[i - 1] not in 'eE']
+                if not minus:
+                    raise ValueError(entry)
+                start = float(bounds[:minus[0]])
+                stop = float(bounds[minus[0] + 1:])
+                step = float(step)
+                if not step > 0 or stop < start:
+                    raise ValueError(entry)
+                count = int(round((stop - start) / step)) + 1
+                values = [start + i * step for i in range(count)]
+            else:
+                values = [float(entry)]
+        except ValueError:
+            grass.fatal('Could not read the slope thresholds ' + entry + 
+                        '. Give numbers, or ranges as start-stop:step ' + 
+                        'with a positive step.')
+        if not numpy.all(numpy.isfinite(values)) or min(values) < 0:
+            grass.fatal('Slope thresholds must be finite and not ' + 
+                        'negative: ' + entry)
+        for value in values:
+            # Remove floating point noise from the range steps
+            value = round(value, 10)
+            if value == int(value):
+                value = int(value)
+            slope_thresholds.append(value)
+    return slope_thresholds
+
+def sweep_slope_thresholds(parameters,
+                           slope_thresholds,
+                           training_peaks,
+                           curvature_tolerance=0.0001,
+                           connectivity=8):
+    '''
+    Counts the error values of one window for a list of slope thresholds in
+    a single pass.
+
+    A cell is a peak if its slope is at most the threshold and both its
+    maximum and minimum curvature are convex. Raising the threshold
+    therefore only ever adds peak cells. The convex cells are sorted by
+    slope once and added as the threshold rises, and the connected
+    patches are maintained with a union-find structure that also keeps the
+    true positives and false positives up to date. The threshold at which
+    each training peak is first covered is found beforehand, so false
+    negatives are counted by binary search. This makes fine threshold steps
+    about as cheap as a single threshold.
+
+    Inputs:
+        parameters: fitted surface parameters from FeatureClassifier.fit()
+        slope_thresholds: list of slope thresholds in degrees
+        training_peaks: TrainingPeaks of the same raster
+        curvature_tolerance: float (as for r.param.scale)
+        connectivity: int (4 or 8 neighbours joining peak cells)
+    @return errors: Dictionary of error value dictionaries keyed by slope
+                    threshold
+    '''
+
+    slope = parameters['slope']
+    rows, columns = slope.shape
+    with numpy.errstate(invalid='ignore'):
+        candidates = ((parameters['maxic'] > curvature_tolerance) &
+                      (parameters['minic'] > curvature_tolerance) &
+                      (slope <= max(slope_thresholds)))
+    # Slope at which the cells holding training peaks are first covered by
+    # a peak cell within the match radius, and the number of peaks on each
+    candidate_slope = numpy.where(candidates, slope, numpy.inf)
+    covered_at = numpy.full(len(training_peaks.cells), numpy.inf)
+    for valid, near_rows, near_cols in training_peaks.neighbourhood(
+            training_peaks.cell_rows,
+            training_peaks.cell_cols,
+            slope.shape):
+        covered_at[valid] = numpy.minimum(covered_at[valid],
+                                          candidate_slope[near_rows,
+                                                          near_cols])
+    del candidate_slope
+    order = numpy.argsort(covered_at, kind='mergesort')
+    covered_at = covered_at[order]
+    covered_counts = numpy.concatenate(
+        [[0], numpy.cumsum(training_peaks.counts[order])])
+    cells = numpy.flatnonzero(candidates)
+    del candidates
+    slopes = slope.ravel()[cells]
+    order = numpy.argsort(slopes, kind='mergesort')
+    cells = cells[order]
+    slopes = slopes[order]
+    del order
+    # Cells that find a training peak when they are part of a patch
+    finds = training_peaks.near().ravel()
+    neighbours = NEIGHBOURS[connectivity]
+    parent = {}
+    has_peak = {}
+
+    def find(cell):
+        while parent[cell] != cell:
+            parent[cell] = parent[parent[cell]]
+            cell = parent[cell]
+        return cell
+
+    patches = 0
+    found = 0
+    position = 0
+    errors = {}
+    for slope_threshold in sorted(slope_thresholds):
+        stop = int(numpy.searchsorted(slopes, slope_threshold, side='right'))
+        added = cells[position:stop]
+        for cell, finds_peak in zip(added.tolist(), finds[added].tolist()):
+            parent[cell] = cell
+            patches += 1
+            has_peak[cell] = finds_peak
+            if finds_peak:
+                found += 1
+            row, col = divmod(cell, columns)
+            for row_shift, col_shift in neighbours:
+                neighbour_row = row + row_shift
+                neighbour_col = col + col_shift
+                if not (0 <= neighbour_row < rows and 
+                        0 <= neighbour_col < columns):
+                    continue
+                neighbour = neighbour_row * columns + neighbour_col
+                if neighbour not in parent:
+                    continue
+                root = find(cell)
+                other = find(neighbour)
+                if root == other:
+                    continue
+                # Merge two patches into one
+                parent[other] = root
+                patches -= 1
+                if has_peak[root] and has_peak[other]:
+                    found -= 1
+                has_peak[root] = has_peak[root] or has_peak[other]
+        position = stop
+        covered = covered_counts[numpy.searchsorted(covered_at,
+                                                    slope_threshold,
+                                                    side='right')]
+        errors[slope_threshold] = {
+            'true positives': found,
+            'false positives': patches - found,
+            'false negatives': len(training_peaks) - int(covered)}
+    return errors
+
+def summary_index(tp, fp, fn):
+    '''
+    Calculates the summary index of error values: the sensitivity minus the
+    ratio of false positives to all training peaks (see
+    Exporter.summarize()). Works on numbers and arrays alike.
+    '''
+
+    tp = numpy.asarray(tp, dtype=numpy.float64)
+    existing = tp + fn
+    # Without any training peaks, the counts are not divided
+    existing = numpy.where(existing == 0, 1, existing)
+    result = (tp - fp) / existing
+    if result.ndim == 0:
+        return float(result)
+    return result
+
+def axis_index(axis):
+    '''
+    Maps the entries of an axis list to their indices. Duplicates map to
+    their first index, as with list.index().
+    '''
+
+    index = {}
+    for i, entry in enumerate(axis):
+        index.setdefault(entry, i)
+    return index
+
+def format_matrix(matrix, format, missing=''):
+    '''
+    Formats a numeric matrix as strings in one vectorized step. NaN entries
+    are replaced by missing.
+    '''
+
+    invalid = numpy.isnan(matrix)
+    cells = numpy.char.mod(format, numpy.where(invalid, 0, matrix))
+    return numpy.where(invalid, missing, cells)
+
+def map_name(*parts):
+    '''
+    Joins parts into a legal GRASS map name.
+    '''
+
+    return '_'.join(str(part) for part in parts).replace('.', 'p')
+
+class FitCache(object):
+    '''
+    Keeps the fitted surface parameters of a FeatureClassifier so that each
+    window size is only fitted once for all slope thresholds.
+
+    At most max_windows fits are kept. The fit of a window is evicted as soon
+    as all slope thresholds expected for it have been classified, and the
+    least recently used fit is evicted when the cache is full.
+    '''
+
+    def __init__(self, classifier, max_windows=1):
+        self.classifier = classifier
+        self.max_windows = max(max_windows, 1)
+        self.fits = collections.OrderedDict()
+        self.pending = {}
+
+    def expect(self, window, slope_thresholds):
+        '''
+        Registers slope thresholds that will be classified for a window.
+        '''
+
+        self.pending.setdefault(window, set()).update(slope_thresholds)
+
+    def get(self, window):
+        '''
+        Returns the fitted parameters for a window, fitting it if necessary.
+        '''
+
+        if window in self.fits:
+            parameters = self.fits.pop(window)
+        else:
+            # Make room before fitting so the new rasters are not allocated
+            # on top of a full cache
+            while len(self.fits) >= self.max_windows:
+                self.fits.popitem(last=False)
+            parameters = self.fit(window)
+        self.fits[window] = parameters
+        return parameters
+
+    def fit(self, window):
+        '''
+        Fits a window with the classifier.
+        '''
+
+        return self.classifier.fit(window)
+
+    def done(self, window, slope_threshold):
+        '''
+        Marks a slope threshold as classified and evicts the window's fit if
+        no thresholds are left for it. Fits of windows without expected
+        thresholds are only evicted when the cache is full.
+        '''
+
+        if window not in self.pending:
+            return
+        remaining = self.pending[window]
+        remaining.discard(slope_threshold)
+        if not remaining:
+            del self.pending[window]
+            self.fits.pop(window, None)
+
+def downsample(dem, valid, factor):
+    '''
+    Averages an elevation model over blocks of factor x factor cells. Blocks
+    at the bottom and right edges are filled up by repeating the last row or
+    column. Blocks with any null cell are null (NaN).
+    '''
+
+    rows = -(-dem.shape[0] // factor) * factor
+    cols = -(-dem.shape[1] // factor) * factor
+    padding = ((0, rows - dem.shape[0]), (0, cols - dem.shape[1]))
+    blocks = (rows // factor, factor, cols // factor, factor)
+    mean = numpy.pad(dem, padding, mode='edge').reshape(blocks).mean(
+        axis=(1, 3))
+    complete = numpy.pad(valid, padding, mode='edge').reshape(blocks).all(
+        axis=(1, 3))
+    return numpy.where(complete, mean, numpy.nan)
+
+def upsample(array, factor, shape):
+    '''
+    Maps a downsampled raster back to a full resolution raster of shape by
+    repeating every cell factor x factor times.
+    '''
+
+    return numpy.repeat(numpy.repeat(array, factor, axis=0), 
+                        factor, 
+                        axis=1)[:shape[0], :shape[1]]
+
+class PyramidFits(FitCache):
+    '''
+    A FitCache that fits windows larger than min_window on a copy of the
+    elevation model downsampled by an integer factor, with a
+    correspondingly smaller window. The fitted parameters are mapped back to
+    full resolution, so they are classified and validated like all others.
+
+    Large windows mostly capture coarse landforms, and the fit on the
+    downsampled model takes about factor^2 times less work.
+    '''
+
+    def __init__(self, classifier, max_windows, factor, min_window):
+        FitCache.__init__(self, classifier, max_windows)
+        self.factor = factor
+        self.min_window = min_window
+        self.coarse = FeatureClassifier(
+            downsample(classifier.dem, classifier.valid, factor),
+            classifier.resolution * factor,
+            classifier.curvature_tolerance,
+            classifier.moments,
+            classifier.dtype,
+            classifier.band_cells)
+
+    def coarse_window(self, window):
+        '''
+        Returns the odd window size on the downsampled elevation model that
+        is closest to covering the same area as window, or None if window is
+        fitted at full resolution.
+        '''
+
+        if window <= self.min_window:
+            return None
+        coarse = int(round((window / float(self.factor) - 1) / 2)) * 2 + 1
+        return max(coarse, 3)
+
+    def fit(self, window):
+        coarse_window = self.coarse_window(window)
+        if coarse_window is None:
+            return self.classifier.fit(window)
+        parameters = self.coarse.fit(coarse_window)
+        for name in parameters:
+            parameters[name] = upsample(parameters[name], 
+                                        self.factor, 
+                                        self.classifier.shape)
+        return parameters
+
+def label_patches(mask, connectivity=8):
+    '''
+    Labels the 8-connected, or 4-connected, patches of a boolean raster.
+    @return labels, patches: Integer raster of patch labels (0 outside of
+                             patches) and the number of patches
+    '''
+
+    structure = numpy.zeros((3, 3), dtype=bool)
+    for row_shift, col_shift in NEIGHBOURS[connectivity] + [(0, 0)]:
+        structure[row_shift + 1, col_shift + 1] = True
+    return ndimage.label(mask, structure=structure)
+
+class TrainingPeaks(object):
+    '''
+    Training peak points in raster coordinates of the current region.
+
+    The points are indexed once by the cell they fall on: the distinct cells
+    are kept in row-major order with the number of points on each, so that
+    every evaluation looks up each occupied cell once and the points of a
+    block of rows are found by binary search.
+
+    With a match radius, a training peak matches a peak area if any cell of
+    the area lies within the radius of the peak's cell. The cells within the
+    radius of any training peak are found once per run with a distance
+    transform of the occupied cells (see near()).
+    '''
+
+    def __init__(self, x, y, region, match_radius=0):
+        '''
+        Inputs:
+            x, y: coordinate sequences of the training peaks
+            region: dictionary of region settings as returned by
+                    grass.region()
+            match_radius: float (distance in map units within which a
+                                 training peak matches, 0 for exact matching)
+        '''
+
+        self.x = numpy.asarray(x, dtype=numpy.float64)
+        self.y = numpy.asarray(y, dtype=numpy.float64)
+        self.rows = numpy.floor((region['n'] - self.y) /
+                                region['nsres']).astype(numpy.int64)
+        self.cols = numpy.floor((self.x - region['w']) /
+                                region['ewres']).astype(numpy.int64)
+        # Peaks outside of the region can never be found
+        self.inside = ((self.rows >= 0) & (self.rows < region['rows']) &
+                       (self.cols >= 0) & (self.cols < region['cols']))
+        self.outside = int((~self.inside).sum())
+        # Cell index: distinct cells holding peaks inside the region and the
+        # number of peaks on each
+        self.columns = int(region['cols'])
+        self.cells, self.counts = numpy.unique(
+            self.rows[self.inside] * self.columns + self.cols[self.inside],
+            return_counts=True)
+        self.cell_rows, self.cell_cols = numpy.divmod(self.cells,
+                                                      self.columns)
+        self.shape = (int(region['rows']), self.columns)
+        self.resolution = (region['nsres'], region['ewres'])
+        self.match_radius = float(match_radius)
+        # Offsets of the cells whose centres lie within the match radius
+        self.reach = (int(self.match_radius // region['nsres']),
+                      int(self.match_radius // region['ewres']))
+        row_shifts, col_shifts = numpy.mgrid[-self.reach[0]:self.reach[0] + 1,
+                                             -self.reach[1]:self.reach[1] + 1]
+        within = ((row_shifts * region['nsres']) ** 2 + 
+                  (col_shifts * region['ewres']) ** 2 <= 
+                  self.match_radius ** 2)
+        self.offsets = list(zip(row_shifts[within].tolist(),
+                                col_shifts[within].tolist()))
+        self.near_cells = None
+
+    def __len__(self):
+        return len(self.x)
+
+    def near(self, row0=0, row1=None, col0=0, col1=None):
+        '''
+        Marks the cells of a block, by default the whole raster, within the
+        match radius of a training peak. Without a match radius these are the
+        cells holding training peaks. The whole raster is only computed once.
+        @return near: Boolean raster of the block
+        '''
+
+        whole = row1 is None
+        if whole:
+            if self.near_cells is not None:
+                return self.near_cells
+            row1, col1 = self.shape
+        # Include the peaks within the radius of the block
+        top = max(row0 - self.reach[0], 0)
+        bottom = min(row1 + self.reach[0], self.shape[0])
+        left = max(col0 - self.reach[1], 0)
+        right = min(col1 + self.reach[1], self.shape[1])
+        rows, cols, counts = self.in_block(top, bottom, left, right)
+        near = numpy.zeros((bottom - top, right - left), dtype=bool)
+        near[rows, cols] = True
+        if self.match_radius > 0 and len(rows):
+            near = ndimage.distance_transform_edt(
+                ~near, 
+                sampling=self.resolution) <= self.match_radius
+        near = near[row0 - top:row1 - top, col0 - left:col1 - left]
+        if whole:
+            self.near_cells = near
+        return near
+
+    def neighbourhood(self, rows, cols, shape):
+        '''
+        Yields the cells within the match radius of a list of cells, one
+        offset at a time.
+        @return valid, rows, cols: For every offset, which of the cells have
+                                   a neighbour within a raster of shape and
+                                   the coordinates of those neighbours
+        '''
+
+        for row_shift, col_shift in self.offsets:
+            shifted_rows = rows + row_shift
+            shifted_cols = cols + col_shift
+            valid = ((shifted_rows >= 0) & (shifted_rows < shape[0]) &
+                     (shifted_cols >= 0) & (shifted_cols < shape[1]))
+            yield valid, shifted_rows[valid], shifted_cols[valid]
+
+    def covered(self, mask, rows, cols):
+        '''
+        Checks which cells of a list have a cell of mask within the match
+        radius.
+        @return covered: Boolean array
+        '''
+
+        covered = numpy.zeros(len(rows), dtype=bool)
+        for valid, near_rows, near_cols in self.neighbourhood(rows,
+                                                              cols,
+                                                              mask.shape):
+            covered[valid] |= mask[near_rows, near_cols]
+        return covered
+
+    def in_block(self, row0, row1, col0, col1):
+        '''
+        Finds the occupied cells within a block of rows and columns.
+        @return rows, cols, counts: Block coordinates of the cells and the
+                                    number of peaks on each
+        '''
+
+        start, stop = numpy.searchsorted(self.cells,
+                                         [row0 * self.columns,
+                                          row1 * self.columns])
+        cols = self.cell_cols[start:stop]
+        within = (cols >= col0) & (cols < col1)
+        return (self.cell_rows[start:stop][within] - row0,
+                cols[within] - col0,
+                self.counts[start:stop][within])
+
+    @classmethod
+    def from_vector(cls, peaks, match_radius=0, clip=False):
+        '''
+        Reads training peaks from a GRASS vector map of points. If clip is
+        set, only the peaks inside the current region are kept.
+        '''
+
+        x = []
+        y = []
+        points = grass.read_command('v.out.ascii',
+                                    input=peaks,
+                                    format='point')
+        for line in points.splitlines():
+            if not line.strip():
+                continue
+            fields = line.split('|')
+            x.append(float(fields[0]))
+            y.append(float(fields[1]))
+        region = grass.region()
+        training_peaks = cls(x, y, region, match_radius)
+        if clip:
+            training_peaks = cls(training_peaks.x[training_peaks.inside],
+                                 training_peaks.y[training_peaks.inside],
+                                 region,
+                                 match_radius)
+        return training_peaks
+
+class PeakPatches(object):
+    '''
+    The peak areas of a raster peak mask, reduced to what is needed to count
+    error values: the number of connected patches, the number of patches
+    that found a training peak and which training peaks were found.
+
+    r.to.vect never joins cells that only touch at a corner into one area.
+    With 4-connectivity and without a match radius, the counts therefore
+    follow v.select with peak areas made by r.to.vect. With the default
+    8-connectivity, diagonally touching cells form one patch, so there can
+    be fewer true and false positives than with vector validation.
+    '''
+
+    def __init__(self, mask, training_peaks, connectivity=8):
+        '''
+        Labels the patches of mask and looks up the label under every cell
+        holding training peaks once.
+        '''
+
+        labels, self.patches = label_patches(mask, connectivity)
+        rows = training_peaks.cell_rows
+        cols = training_peaks.cell_cols
+        if training_peaks.match_radius > 0:
+            # Labels of the patch cells within the radius of a peak
+            hits = labels[training_peaks.near()]
+            self.covered = training_peaks.covered(mask, rows, cols)
+        else:
+            # Label of the patch under each occupied cell, 0 for none
+            hits = labels[rows, cols]
+            self.covered = hits > 0
+        self.found = len(numpy.unique(hits[hits > 0]))
+        self.counts = training_peaks.counts
+        self.outside = training_peaks.outside
+
+    def errors(self):
+        '''
+        Counts all error values at once.
+        @return errors: Dictionary of counts keyed by error value
+        '''
+
+        true_positives = self.true_positives()
+        return {'true positives': true_positives,
+                'false positives': int(self.patches) - true_positives,
+                'false negatives': self.false_negatives()}
+
+    def true_positives(self):
+        '''
+        Counts patches that contain a training peak, or lie within the match
+        radius of one.
+        '''
+
+        return self.found
+
+    def false_negatives(self):
+        '''
+        Counts training peaks that are not contained in a patch.
+        '''
+
+        return int(self.counts[~self.covered].sum()) + self.outside
+
+class PatchStitcher(object):
+    '''
+    Counts the error values of a peak mask that is classified tile by tile.
+
+    Tiles are added in rows of tiles ("bands") from left to right. Each
+    tile's patches are labeled on their own and given global ids, and
+    patches touching across a tile border are joined with a union-find
+    structure, so a patch spanning several tiles is counted once. Only the
+    last row of the previous band and the last column of the previous tile
+    are kept, besides one entry per patch.
+    '''
+
+    def __init__(self, columns, training_peaks, connectivity=8):
+        '''
+        Inputs:
+            columns: int (number of columns of the whole raster)
+            training_peaks: TrainingPeaks of the whole raster
+            connectivity: int (4 or 8 neighbours joining peak cells)
+        '''
+
+        self.columns = columns
+        self.connectivity = connectivity
+        # Shifts of the cells joined across a border, diagonals for 8
+        self.shifts = (-1, 0, 1) if connectivity == 8 else (0,)
+        # Union-find parents and training peak flags by patch id. Id 0 marks
+        # cells outside of patches.
+        self.parent = [0]
+        self.has_peak = [False]
+        # Ids along the last row of the previous band and the current band
+        self.above = numpy.zeros(columns, dtype=numpy.int64)
+        self.below = numpy.zeros(columns, dtype=numpy.int64)
+        # Ids along the last column of the previous tile in the band
+        self.left = None
+        # Training peaks outside the region are never found
+        self.missed = training_peaks.outside
+
+    def find(self, patch):
+        '''
+        Returns the root id of a patch.
+        '''
+
+        parent = self.parent
+        while parent[patch] != patch:
+            parent[patch] = parent[parent[patch]]
+            patch = parent[patch]
+        return patch
+
+    def join(self, ids, neighbours):
+        '''
+        Joins the patches of two parallel arrays of ids of touching cells.
+        '''
+
+        touching = (ids > 0) & (neighbours > 0)
+        for patch, neighbour in set(zip(ids[touching].tolist(),
+                                        neighbours[touching].tolist())):
+            root = self.find(patch)
+            other = self.find(neighbour)
+            if root != other:
+                self.parent[other] = root
+
+    def add_tile(self, mask, col0, near, missed):
+        '''
+        Adds the next tile of the current band.
+
+        Inputs:
+            mask: boolean peak mask of the tile without halo
+            col0: int (first column of the tile in the raster)
+            near: boolean raster of the tile cells that find a training peak
+                  (see TrainingPeaks.near())
+            missed: int (number of training peaks on the tile that are not
+                         covered by the peak mask)
+        '''
+
+        labels, patches = label_patches(mask, self.connectivity)
+        offset = len(self.parent)
+        self.parent.extend(range(offset, offset + patches))
+        self.has_peak.extend([False] * patches)
+        ids = numpy.where(labels > 0, labels + (offset - 1), 0)
+        del labels
+        hits = ids[near]
+        self.missed += missed
+        for patch in numpy.unique(hits[hits > 0]).tolist():
+            self.has_peak[patch] = True
+        rows, width = ids.shape
+        col1 = col0 + width
+        # Join the first row with the band above
+        for shift in self.shifts:
+            start = max(col0 + shift, 0)
+            stop = min(col1 + shift, self.columns)
+            self.join(ids[0, start - shift - col0:stop - shift - col0],
+                      self.above[start:stop])
+        # Join the first column with the previous tile
+        if self.left is not None:
+            for shift in self.shifts:
+                start = max(shift, 0)
+                stop = min(rows + shift, rows)
+                self.join(ids[start - shift:stop - shift, 0],
+                          self.left[start:stop])
+        self.left = ids[:, -1].copy()
+        self.below[col0:col1] = ids[-1]
+
+    def end_band(self):
+        '''
+        Finishes the current band of tiles.
+        '''
+
+        self.above, self.below = self.below, self.above
+        self.below[:] = 0
+        self.left = None
+
+    def errors(self):
+        '''
+        Counts all error values of the stitched mask.
+        @return errors: Dictionary of counts keyed by error value
+        '''
+
+        roots = set()
+        found = set()
+        for patch in range(1, len(self.parent)):
+            root = self.find(patch)
+            roots.add(root)
+            if self.has_peak[patch]:
+                found.add(root)
+        return {'true positives': len(found),
+                'false positives': len(roots) - len(found),
+                'false negatives': self.missed}
+
+class PackedMask(object):
+    '''
+    A boolean raster packed row by row with numpy.packbits, eight cells to a
+    byte, as kept by the low-memory mode.
+    '''
+
+    def __init__(self, bits, shape):
+        '''
+        Inputs:
+            bits: 2D uint8 array of the packed rows
+            shape: (rows, columns) of the unpacked raster
+        '''
+
+        self.bits = bits
+        self.shape = tuple(shape)
+
+    @classmethod
+    def pack(cls, mask):
+        return cls(numpy.packbits(mask, axis=1), mask.shape)
+
+    def rows(self, row0, row1):
+        '''
+        Unpacks a band of rows.
+        @return mask: Boolean raster of the rows
+        '''
+
+        return numpy.unpackbits(self.bits[row0:row1], 
+                                axis=1, 
+                                count=self.shape[1]).view(bool)
+
+    def unpack(self):
+        return self.rows(0, self.shape[0])
+
+    def patches(self, training_peaks, band_rows=None, connectivity=8):
+        '''
+        Labels the peak patches band by band with a PatchStitcher, so that
+        only a band of rows, widened by the match radius, is ever unpacked.
+        @return stitcher: PatchStitcher whose errors() are those of the
+                          whole mask
+        '''
+
+        rows, columns = self.shape
+        if band_rows is None:
+            band_rows = max(LOW_MEMORY_BAND_CELLS // columns, 1)
+        reach_rows = training_peaks.reach[0]
+        stitcher = PatchStitcher(columns, training_peaks, connectivity)
+        for row0 in range(0, rows, band_rows):
+            row1 = min(row0 + band_rows, rows)
+            # The band and the rows within the match radius of it
+            top = max(row0 - reach_rows, 0)
+            mask = self.rows(top, min(row1 + reach_rows, rows))
+            point_rows, point_cols, point_counts = training_peaks.in_block(
+                row0, row1, 0, columns)
+            covered = training_peaks.covered(mask, 
+                                             point_rows + row0 - top, 
+                                             point_cols)
+            stitcher.add_tile(mask[row0 - top:row1 - top],
+                              0,
+                              training_peaks.near(row0, row1, 0, columns),
+                              int(point_counts[~covered].sum()))
+            stitcher.end_band()
+        return stitcher
+
+class GrassTracer(object):
+    '''
+    Stands in for the grass.script module and records the duration,
+    parameters and output size of every GRASS module it runs, tagged with
+    the combination being processed.
+
+    Tracing is switched on by replacing the module level grass with a
+    GrassTracer (see install_tracer()), so untraced runs do not pay for it.
+    '''
+
+    def __init__(self, module):
+        self.module = module
+        # Complete events in the Chrome trace event format
+        self.events = []
+        self.tags = {}
+
+    def __getattr__(self, name):
+        function = getattr(self.module, name)
+        if name not in TRACED_FUNCTIONS:
+            return function
+
+        def traced(*args, **kwargs):
+            start = time.time()
+            output = None
+            try:
+                output = function(*args, **kwargs)
+                return output
+            finally:
+                parameters = dict((key, str(value)) for key, value in 
+                                  kwargs.items())
+                # pipe_command returns as soon as the module is started, so
+                # only the start is timed and the output is not known.
+                if isinstance(output, (str, bytes)):
+                    parameters['output_bytes'] = len(output)
+                self.record(args[0] if args else kwargs.get('prog', '?'),
+                            name,
+                            start,
+                            time.time(),
+                            parameters)
+        return traced
+
+    def record(self, name, category, start, end, parameters=None):
+        '''
+        Adds a complete event with the current tags to the trace.
+        '''
+
+        event_args = dict(self.tags)
+        event_args.update(parameters or {})
+        self.events.append({'name': name,
+                            'cat': category,
+                            'ph': 'X',
+                            'ts': start * 1e6,
+                            'dur': (end - start) * 1e6,
+                            'pid': os.getpid(),
+                            'tid': 0,
+                            'args': event_args})
+
+    def drain(self):
+        '''
+        Returns the events recorded so far and starts a new trace.
+        '''
+
+        events = self.events
+        self.events = []
+        return events
+
+    def write(self, path):
+        '''
+        Writes the trace as a Chrome trace file, which can be opened in
+        chrome://tracing or https://ui.perfetto.dev.
+        '''
+
+        with open(path, 'w') as trace_file:
+            json.dump({'traceEvents': self.events,
+                       'displayTimeUnit': 'ms'},
+                      trace_file)
+
+    def summary(self):
+        '''
+        Sums up the recorded GRASS module calls by module.
+        @return summary: List of (module, calls, total seconds, maximum
+                         seconds) sorted by total time
+        '''
+
+        modules = collections.OrderedDict()
+        for event in self.events:
+            if event['cat'] == 'stage':
+                continue
+            calls, total, longest = modules.get(event['name'], (0, 0.0, 0.0))
+            seconds = event['dur'] / 1e6
+            modules[event['name']] = (calls + 1,
+                                      total + seconds,
+                                      max(longest, seconds))
+        return sorted([(module,) + modules[module] for module in modules],
+                      key=lambda row: row[2],
+                      reverse=True)
+
+def install_tracer():
+    '''
+    Starts tracing the GRASS module calls of this process.
+    @return tracer: The GrassTracer now used as grass
+    '''
+
+    global grass
+    # A forked worker inherits the tracer of its parent
+    if isinstance(grass, GrassTracer):
+        grass = grass.module
+    grass = GrassTracer(grass)
+    return grass
+
+class ModuleScheduler(object):
+    '''
+    Runs GRASS modules as asyncio subprocesses, at most limit of them at
+    once. Module chains of several combinations awaiting it overlap, so
+    that one combination's r.param.scale runs while another one waits for
+    v.select.
+
+    Modules waiting for a free slot are started by priority rather than in
+    the order they were requested. Chains pass the stage of each module,
+    and later stages go first, so started chains are finished before new
+    ones are classified.
+
+    Cancelling a chain kills the module it is waiting for.
+    '''
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.running = 0
+        # Heap of (priority, order, future) of the modules waiting for a
+        # slot
+        self.waiting = []
+        self.order = itertools.count()
+
+    async def acquire(self, priority):
+        '''
+        Waits for a free slot. Slots are handed out in order of priority,
+        then in order of request.
+        '''
+
+        if self.running < self.limit and not self.waiting:
+            self.running += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiting, (priority, next(self.order), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            # A slot that was handed over just before is passed on
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        '''
+        Hands a slot over to the first waiting module, or frees it.
+        '''
+
+        while self.waiting:
+            future = heapq.heappop(self.waiting)[-1]
+            # Cancelled modules are left in the heap until they come up
+            if not future.done():
+                future.set_result(None)
+                return
+        self.running -= 1
+
+    async def run(self, combination, stage, module, **kwargs):
+        '''
+        Runs a GRASS module with parameters as for grass.run_command(), as
+        the given stage of a combination's chain. Traced calls are tagged
+        with the (window, slope threshold) combination.
+        @return output: The standard output of the module
+        '''
+
+        command = grass.make_command(module, quiet=True, **kwargs)
+        # Later stages first, then lower combinations
+        await self.acquire((-stage, combination))
+        try:
+            start = time.time()
+            process = await asyncio.create_subprocess_exec(
+                *command,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE)
+            try:
+                output, errors = await process.communicate()
+            except asyncio.CancelledError:
+                if process.returncode is None:
+                    process.kill()
+                    await process.wait()
+                raise
+            end = time.time()
+        finally:
+            self.release()
+        if isinstance(grass, GrassTracer):
+            parameters = dict((key, str(value)) for key, value in 
+                              kwargs.items())
+            parameters.update({'window': combination[0],
+                               'slope_threshold': combination[1],
+                               'output_bytes': len(output)})
+            grass.record(module, 'run_command', start, end, parameters)
+        if process.returncode != 0:
+            grass.fatal(module + ' failed: ' + 
+                        errors.decode(errors='replace').strip())
+        return output.decode()
+
+class PeakAnalyst(object):
+    '''
+    A geographical object that finds peaks according to specified parameters
+    and compares them with a validation data set.
+    '''
+    
+    def __init__(self, 
+                 options,
+                 flags,
+                 clip_peaks=False):
+        '''
+        Initializes peak analyst with the window sizes and slope thresholds to
+        be used in the analysis. Adjusts regional settings to match rasters
+        to be analyzed. Inputs are received and parsed from GUI.
+        
+        Inputs:
+            window_sizes: int list
+            slope_thresholds: number list
+            flags: dictionary of binary values.
+                   t - true positives
+                   f - false negatives
+                   n - false negatives
+                   s - summarize
+                   c - check NumPy engine against r.param.scale
+                   x - invalidate cached results and stored masks of this
+                       data set
+                   p - trace GRASS module calls (in sweep() workers)
+                   m - low-memory mode: fit in float32 band by band and
+                       evaluate bit-packed peak masks
+            engine: string (grass runs r.param.scale for every combination,
+                            numpy classifies in process)
+            fit_cache: int (number of fitted windows the NumPy engine keeps)
+            workers: int (number of processes sweeping the parameters)
+            concurrent_modules: int (number of GRASS modules run at once by
+                                     a ModuleScheduler, 0 for none)
+            min_summary: float (summary index below which the larger slope
+                                thresholds of a window are not evaluated,
+                                empty to evaluate all of them)
+            validation: string (vector counts peak areas with v.select,
+                                raster labels peak patches in the raster)
+            match_radius: float (distance in map units within which a
+                                 training peak matches a peak area, raster
+                                 validation only)
+            connectivity: int (4 or 8 neighbours joining peak cells into
+                               one peak area, raster validation only)
+            cache_directory: string (directory of the result cache, empty to
+                                     disable it)
+            cache_size: int (maximum number of cached combinations)
+            mask_directory: string (directory of the mask store, empty to
+                                    disable it, raster validation only)
+            tile_size: int (rows and columns of the tiles the elevation model
+                            is processed in, 0 to process it at once)
+            sweep: string (grid evaluates every combination on its own,
+                           incremental evaluates all slope thresholds of a
+                           window in one pass)
+            pyramid_window: int (windows larger than this are classified on
+                                 a downsampled elevation model, 0 for none)
+            pyramid_factor: int (downsampling factor of pyramid windows)
+            search: string (grid evaluates all combinations, refine searches
+                            the range of the combinations coarse to fine)
+            budget: int (maximum number of combinations evaluated by a
+                         refining search)
+            dem: string (name of GRASS elevation model to be analyzed. Must be
+                         in same mapset)
+            peaks: string (name of GRASS vector points showing peaks. Later,
+                           this could be expanded to allow the use of polygons
+                           as peaks)
+            clip_peaks: bool (only count training peaks inside the region,
+                              as for the tiles of a BatchAnalyst)
+            results: results container object
+        '''
+        
+        # The input is a string of integers divided by commas. Split it into
+        # a list and convert all values to integers.
+        self.window_sizes = options['window_sizes'].split(',')
+        for i in range(len(self.window_sizes)):
+            self.window_sizes[i] = int(self.window_sizes[i])
+        # Slope thresholds may be fractional and may be given as ranges.
+        self.slope_thresholds = parse_slope_thresholds(
+            options['slope_thresholds'])
+        self.error_values = parse_error_values(flags)
+        self.dem = options['dem']
+        self.peaks = options['peaks']
+        self.engine = options['engine'] or 'grass'
+        self.check_engine = flags['c']
+        self.fit_cache = int(options['fit_cache'] or 1)
+        self.workers = int(options['workers'] or 1)
+        self.concurrent_modules = int(options['concurrent_modules'] or 0)
+        self.min_summary = None
+        if options['min_summary']:
+            self.min_summary = float(options['min_summary'])
+        self.leave_maps = flags['l']
+        self.low_memory = flags['m']
+        if self.low_memory:
+            self.fit_dtype = numpy.float32
+            self.band_cells = LOW_MEMORY_BAND_CELLS
+        else:
+            self.fit_dtype = numpy.float64
+            self.band_cells = None
+        self.options = options
+        self.flags = flags
+        # Unique prefix for the maps and temporary files of this analyst
+        self.prefix = 'pp_' + uuid.uuid4().hex[:8]
+        self.reclass_rules = None
+        self.fits = None
+        # Seconds spent in each processing stage
+        self.timings = collections.defaultdict(float)
+        self.validation = options['validation'] or 'vector'
+        self.match_radius = float(options['match_radius'] or 0)
+        self.connectivity = int(options['connectivity'] or 8)
+        self.clip_peaks = clip_peaks
+        self.training_peaks = None
+        self.training_count = None
+        if self.validation == 'raster' and ndimage is None:
+            grass.fatal('Raster validation requires SciPy.')
+        if self.match_radius > 0 and self.validation != 'raster':
+            grass.fatal('A match radius requires validation=raster.')
+        self.cache = None
+        # ResultStream that recorded combinations are written to, if any
+        self.stream = None
+        self.tile_size = int(options['tile_size'] or 0)
+        self.sweep_mode = options['sweep'] or 'grid'
+        self.search_mode = options['search'] or 'grid'
+        self.budget = int(options['budget'] or 30)
+        self.pyramid_window = int(options['pyramid_window'] or 0)
+        self.pyramid_factor = int(options['pyramid_factor'] or 2)
+        # Error values of every evaluated combination, and the seconds it
+        # took to compute those that were timed
+        self.evaluated = {}
+        self.runtimes = {}
+        if self.sweep_mode == 'incremental' and (self.engine != 'numpy' or
+                                                 self.validation != 'raster'):
+            grass.fatal('Incremental sweeps require engine=numpy and ' + 
+                        'validation=raster.')
+        if self.tile_size > 0 and (self.engine != 'numpy' or
+                                   self.validation != 'raster'):
+            grass.fatal('Tiled processing requires engine=numpy and ' + 
+                        'validation=raster.')
+        if self.pyramid_window > 0 and (self.engine != 'numpy' or
+                                        self.tile_size > 0):
+            grass.fatal('Pyramid mode requires engine=numpy and no tiles.')
+        if self.pyramid_window > 0 and self.pyramid_factor < 2:
+            grass.fatal('The pyramid factor must be at least 2.')
+        if self.concurrent_modules > 0 and (self.engine != 'grass' or
+                                            self.validation != 'vector'):
+            grass.fatal('Concurrent modules require engine=grass and ' + 
+                        'validation=vector.')
+        if self.concurrent_modules > 0 and self.workers > 1:
+            grass.fatal('Use either workers or concurrent modules.')
+        if self.min_summary is not None and self.concurrent_modules == 0:
+            grass.fatal('A summary floor requires concurrent modules.')
+        if self.low_memory and (self.engine != 'numpy' or 
+                                self.validation != 'raster'):
+            grass.fatal('Low-memory mode requires engine=numpy and ' + 
+                        'validation=raster.')
+        # Set region to raster
+        grass.run_command('g.region', raster=self.dem)
+        self.dem_digest = None
+        if options['cache_directory']:
+            self.cache = ResultCache(options['cache_directory'],
+                                     self.dataset_key(),
+                                     int(options['cache_size'] or 10000))
+            if flags['x']:
+                self.cache.invalidate()
+        self.mask_directory = options['mask_directory']
+        self.masks = None
+        if self.mask_directory and self.validation != 'raster':
+            grass.fatal('A mask store requires validation=raster.')
+        if self.mask_directory and flags['x']:
+            self.get_masks().invalidate()
+        # Initialize results container. All error values are counted in the
+        # same pass, so the container always holds all of them.
+        self.results = ResultsContainer(self.window_sizes,
+                                        self.slope_thresholds,
+                                        ERROR_VALUES)
+    
+
+    def find_peak_map(self, window, slope_threshold):
+        '''
+        Classifies features for a single window size and slope threshold and
+        converts the areas classified as peaks into a vector map.
+
+        Map names are prefixed with the analyst's unique prefix, so several
+        runs or workers can work in the same mapset.
+
+        The caller deletes the vector map once it is counted, unless maps
+        are to be left in the mapset (see process_combination()). With
+        raster validation, the peaks are labeled as patches in the raster
+        domain instead and no vector map is made.
+        @return peak_vectors: Name of the vector map of peak areas, or
+                              PeakPatches with raster validation
+        '''
+
+        if self.validation == 'raster':
+            mask = self.peak_mask(window, slope_threshold)
+            training = self.get_training_peaks()
+            with self.stage('label'):
+                if isinstance(mask, PackedMask):
+                    return mask.patches(training, 
+                                        connectivity=self.connectivity)
+                return PeakPatches(mask, training, self.connectivity)
+        self.write_reclass_rules()
+        feature_map = map_name(self.prefix, window, slope_threshold)
+        self.classify_features(window, slope_threshold, feature_map)
+        with self.stage('vectorize'):
+            # Use r.reclass to extract the peaks as rasters.
+            peak_raster = feature_map + '_peaks'
+            grass.run_command('r.reclass',
+                              input=feature_map,
+                              output=peak_raster,
+                              rules=self.reclass_rules)
+            # Use r.to.vect to turn the peaks into areas.
+            peak_vectors = 'p_' + peak_raster
+            grass.run_command('r.to.vect',
+                              input=peak_raster,
+                              output=peak_vectors,
+                              type='area')
+        if not self.leave_maps:
+            # Delete the geomorphometry map and raster peak map.
+            for raster in [peak_raster, feature_map]:
+                grass.run_command('g.remove', 
+                                  flags='f', 
+                                  type='raster', 
+                                  name=raster)
+        return peak_vectors
+
+    def classify_features(self, 
+                          window, 
+                          slope_threshold, 
+                          feature_map, 
+                          write=True):
+        '''
+        Classifies features for a window size and slope threshold with the
+        selected engine.
+
+        The GRASS engine always writes the feature map. The NumPy engine
+        only writes it if write is set.
+        @return features: Feature raster from the NumPy engine, otherwise None
+        '''
+
+        if self.engine == 'numpy':
+            fits = self.get_fits()
+            with self.stage('fit'):
+                parameters = fits.get(window)
+            with self.stage('classify'):
+                features = fits.classifier.classify(parameters,
+                                                    slope_threshold)
+            fits.done(window, slope_threshold)
+            if write:
+                self.write_features(features, feature_map)
+            if self.check_engine:
+                self.compare_features(features,
+                                      window,
+                                      slope_threshold)
+            return features
+        # Use r.param.scale to produce peak maps.
+        with self.stage('classify'):
+            grass.run_command('r.param.scale',
+                              input=self.dem,
+                              output=feature_map,
+                              slope_tolerance=slope_threshold,
+                              size=window,
+                              method='feature')
+        return None
+
+    def peak_mask(self, window, slope_threshold):
+        '''
+        Returns a boolean raster of the cells classified as peaks for a window
+        size and slope threshold. In low-memory mode, the raster is returned
+        as a PackedMask.
+        '''
+
+        masks = self.get_masks()
+        if masks is not None:
+            with self.stage('read'):
+                mask = masks.get(window, slope_threshold)
+            if mask is not None:
+                if self.low_memory:
+                    return mask
+                return mask.unpack()
+        if self.low_memory and not (self.leave_maps or self.check_engine):
+            # Only the peaks are classified, without a feature raster
+            fits = self.get_fits()
+            with self.stage('fit'):
+                parameters = fits.get(window)
+            with self.stage('classify'):
+                mask = fits.classifier.packed_peaks(parameters, 
+                                                    slope_threshold)
+            fits.done(window, slope_threshold)
+            if masks is not None:
+                masks.put(window, slope_threshold, mask)
+            return mask
+        feature_map = map_name(self.prefix, window, slope_threshold)
+        features = self.classify_features(window,
+                                          slope_threshold,
+                                          feature_map,
+                                          write=self.leave_maps)
+        if features is None:
+            features = self.read_features(feature_map)
+            if not self.leave_maps:
+                grass.run_command('g.remove', 
+                                  flags='f', 
+                                  type='raster', 
+                                  name=feature_map)
+        mask = features == PEAK
+        if masks is not None or self.low_memory:
+            packed = PackedMask.pack(mask)
+            if masks is not None:
+                masks.put(window, slope_threshold, packed)
+            if self.low_memory:
+                return packed
+        return mask
+
+    def get_training_peaks(self):
+        '''
+        Returns the training peaks in raster coordinates, reading them the
+        first time they are needed.
+        '''
+
+        if self.training_peaks is None:
+            self.training_peaks = TrainingPeaks.from_vector(self.peaks,
+                                                            self.match_radius,
+                                                            self.clip_peaks)
+        return self.training_peaks
+
+    def write_reclass_rules(self):
+        '''
+        Makes the reclass table that eliminates all features except for
+        peaks, unless it was already written.
+        '''
+
+        if self.reclass_rules is None:
+            self.reclass_rules = grass.tempfile()
+            with open(self.reclass_rules, 'w') as reclass:
+                reclass.write('0 thru 5 = NULL\n' + 
+                              '* = *\n' + 
+                              'end\n')
+
+    def remove_reclass_rules(self):
+        '''
+        Deletes the reclass table if one was written.
+        '''
+
+        if self.reclass_rules is not None:
+            os.remove(self.reclass_rules)
+            self.reclass_rules = None
+
+    def get_fits(self):
+        '''
+        Returns the NumPy engine's fit cache, reading the elevation model the
+        first time it is needed.
+        '''
+
+        if self.fits is None:
+            # Read the elevation model once for all combinations and fit
+            # each window only once for all slope thresholds. Workers attach
+            # to the copy shared by the parent (see map_workers()).
+            if self.dem in shared_dems:
+                classifier = FeatureClassifier.attach(
+                    shared_dems[self.dem],
+                    grass.region()['ewres'],
+                    band_cells=self.band_cells)
+            else:
+                classifier = FeatureClassifier(self.read_dem(),
+                                               grass.region()['ewres'],
+                                               dtype=self.fit_dtype,
+                                               band_cells=self.band_cells)
+                self.check_rounding(classifier, min(self.window_sizes))
+            if self.pyramid_window > 0:
+                self.fits = PyramidFits(classifier, 
+                                        self.fit_cache,
+                                        self.pyramid_factor,
+                                        self.pyramid_window)
+            else:
+                self.fits = FitCache(classifier, self.fit_cache)
+        return self.fits
+
+    def pyramid_report(self):
+        '''
+        Evaluates the combinations of windows classified on the downsampled
+        elevation model once more at full resolution.
+        @return rows: A list of (window, slope threshold, pyramid summary,
+                      full resolution summary, pyramid seconds, full
+                      resolution seconds) tuples. Seconds are None for
+                      combinations that were not timed.
+        '''
+
+        windows = [window for window in self.window_sizes 
+                   if window > self.pyramid_window]
+        combinations = [(window, slope_threshold) 
+                        for window in windows
+                        for slope_threshold in self.slope_thresholds]
+        options = dict(self.options)
+        options['pyramid_window'] = '0'
+        # The full resolution results must not mix with the pyramid ones
+        options['cache_directory'] = ''
+        options['mask_directory'] = ''
+        full = PeakAnalyst(options, self.flags, self.clip_peaks)
+        full.evaluate_combinations(combinations)
+        rows = []
+        for combination in combinations:
+            pyramid = self.evaluated.get(combination)
+            if pyramid is None:
+                continue
+            reference = full.evaluated[combination]
+            rows.append(combination + 
+                        (summary_index(*[pyramid[error_value] 
+                                         for error_value in ERROR_VALUES]),
+                         summary_index(*[reference[error_value] 
+                                         for error_value in ERROR_VALUES]),
+                         self.runtimes.get(combination),
+                         full.runtimes.get(combination)))
+        return rows
+
+    def sweep(self):
+        '''
+        Finds and evaluates peaks for all combinations of window size and
+        slope threshold, and writes the error values to the results container
+        as soon as each combination is done.
+        '''
+
+        self.evaluate_combinations([(window, slope_threshold)
+                                    for window in self.window_sizes
+                                    for slope_threshold in 
+                                    self.slope_thresholds])
+
+    def evaluate_combinations(self, combinations):
+        '''
+        Finds and evaluates peaks for a list of (window, slope threshold)
+        combinations and records their error values.
+
+        Combinations found in the result cache are not computed again. The
+        others are processed tile by tile, incrementally, in a pool of
+        worker processes or one after another, depending on the settings.
+        '''
+
+        tasks = self.stored(self.uncached(combinations))
+        if not tasks:
+            return
+        if self.tile_size > 0:
+            self.sweep_tiled(tasks)
+        elif self.sweep_mode == 'incremental':
+            self.sweep_incremental(tasks)
+        elif self.concurrent_modules > 0:
+            self.sweep_async(tasks)
+        elif self.workers > 1:
+            self.sweep_parallel(tasks)
+        else:
+            if self.engine == 'numpy':
+                # Evict each window's fit once its thresholds are done
+                for window, slope_threshold in tasks:
+                    self.get_fits().expect(window, [slope_threshold])
+            for window, slope_threshold in tasks:
+                self.record(*self.process_combination(window,
+                                                      slope_threshold))
+            self.remove_reclass_rules()
+
+    def uncached(self, combinations):
+        '''
+        Records the error values of the combinations found in the result
+        cache.
+        @return tasks: The (window, slope threshold) combinations that still
+                       have to be computed
+        '''
+
+        tasks = []
+        for window, slope_threshold in combinations:
+            errors = None
+            if self.cache is not None:
+                errors = self.cache.get(window, slope_threshold)
+            if errors is None:
+                tasks.append((window, slope_threshold))
+            else:
+                self.record(window, slope_threshold, errors)
+        return tasks
+
+    def search(self):
+        '''
+        Searches for the window size and slope threshold with the best
+        summary index (see Exporter.summarize()) by coarse-to-fine grid
+        refinement instead of evaluating the whole grid.
+
+        The search covers the range of the given window sizes and slope
+        thresholds. It starts with a 3 x 3 grid spanning the range, then
+        repeatedly evaluates a 3 x 3 grid around the best combination found
+        so far, halving the grid spacing each round. It stops when the
+        budget of evaluations is used up or the spacing reaches two cells
+        and SEARCH_SLOPE_STEP degrees.
+
+        Afterwards, the results container holds every evaluated combination.
+        @return window, slope_threshold, summary: The best combination found
+        '''
+
+        low_window = min(self.window_sizes)
+        high_window = max(self.window_sizes)
+        low_slope = min(self.slope_thresholds)
+        high_slope = max(self.slope_thresholds)
+
+        def snap_window(window):
+            # Windows must be odd and within the searched range
+            window = int(round(min(max(window, low_window), high_window)))
+            if window % 2 == 0:
+                window = window + 1 if window < high_window else window - 1
+            return max(window, 3)
+
+        def snap_slope(slope_threshold):
+            # Slope thresholds are multiples of SEARCH_SLOPE_STEP within the
+            # searched range, whose bounds are kept as given
+            slope_threshold = (round(slope_threshold / SEARCH_SLOPE_STEP) *
+                               SEARCH_SLOPE_STEP)
+            slope_threshold = min(max(slope_threshold, low_slope), high_slope)
+            # Remove floating point noise of the step
+            slope_threshold = round(slope_threshold, 10)
+            if slope_threshold == int(slope_threshold):
+                slope_threshold = int(slope_threshold)
+            return slope_threshold
+
+        def score(combination):
+            errors = self.evaluated[combination]
+            return Exporter.summarize(errors['true positives'],
+                                      errors['false positives'],
+                                      errors['false negatives'])
+
+        window_spacing = (high_window - low_window) / 2.0
+        slope_spacing = (high_slope - low_slope) / 2.0
+        window_center = (high_window + low_window) / 2.0
+        slope_center = (high_slope + low_slope) / 2.0
+        while True:
+            candidates = []
+            for window_shift in (-1, 0, 1):
+                for slope_shift in (-1, 0, 1):
+                    combination = (
+                        snap_window(window_center + 
+                                    window_shift * window_spacing),
+                        snap_slope(slope_center + 
+                                   slope_shift * slope_spacing))
+                    if (combination not in self.evaluated and
+                        combination not in candidates):
+                        candidates.append(combination)
+            candidates = candidates[:self.budget - len(self.evaluated)]
+            self.evaluate_combinations(candidates)
+            best = max(self.evaluated, key=score)
+            window_center, slope_center = best
+            window_spacing /= 2.0
+            slope_spacing /= 2.0
+            if (len(self.evaluated) >= self.budget or
+                (window_spacing < 2 and slope_spacing < SEARCH_SLOPE_STEP)):
+                break
+            # Keep refining as long as the spacing still moves the grid
+            if window_spacing < 2:
+                window_spacing = 0
+            if slope_spacing < SEARCH_SLOPE_STEP:
+                slope_spacing = 0
+        # Report every evaluated combination in the results container
+        windows = sorted(set(combination[0] 
+                             for combination in self.evaluated))
+        slope_thresholds = sorted(set(combination[1] 
+                                      for combination in self.evaluated))
+        self.results = ResultsContainer(windows, 
+                                        slope_thresholds, 
+                                        ERROR_VALUES)
+        for (window, slope_threshold), errors in self.evaluated.items():
+            for error_value in ERROR_VALUES:
+                self.results.add_error(window,
+                                       slope_threshold,
+                                       error_value,
+                                       errors[error_value])
+        return best[0], best[1], score(best)
+
+    def sweep_incremental(self, tasks):
+        '''
+        Finds and evaluates peaks for a list of (window, slope threshold)
+        combinations, evaluating all slope thresholds of a window in a single
+        incremental pass (see sweep_slope_thresholds()).
+        '''
+
+        fits = self.get_fits()
+        training = self.get_training_peaks()
+        windows = []
+        for window, slope_threshold in tasks:
+            if window not in windows:
+                windows.append(window)
+        for window in windows:
+            slope_thresholds = [task[1] for task in tasks if task[0] == window]
+            fits.expect(window, slope_thresholds)
+            start = time.time()
+            with self.stage('fit'):
+                parameters = fits.get(window)
+            with self.stage('evaluate'):
+                errors = sweep_slope_thresholds(
+                    parameters,
+                    slope_thresholds,
+                    training,
+                    fits.classifier.curvature_tolerance,
+                    self.connectivity)
+            del parameters
+            # The thresholds of a window share its time
+            seconds = (time.time() - start) / len(slope_thresholds)
+            for slope_threshold in slope_thresholds:
+                fits.done(window, slope_threshold)
+                self.record(window, 
+                            slope_threshold, 
+                            errors[slope_threshold], 
+                            seconds)
+
+    def sweep_tiled(self, tasks):
+        '''
+        Finds and evaluates peaks for a list of (window, slope threshold)
+        combinations tile by tile, so that memory use is set by the tile size
+        rather than the size of the elevation model.
+
+        Each tile is read once with a halo of half the largest window, so
+        that the windows of all its cells are complete. With a match radius,
+        the halo is widened by the radius, so that the peak cells within the
+        radius of the tile's training peaks are classified too. Every
+        combination is
+        classified and labeled on the tile, and the patches are joined
+        across tile borders by a PatchStitcher, so the counts are the same as
+        for the whole raster.
+        '''
+
+        start = time.time()
+        region = grass.region()
+        rows = region['rows']
+        columns = region['cols']
+        size = self.tile_size
+        windows = sorted(set(task[0] for task in tasks))
+        training = self.get_training_peaks()
+        reach_rows, reach_cols = training.reach
+        halo = max(windows) // 2 + max(training.reach)
+        stitchers = {}
+        for task in tasks:
+            stitchers[task] = PatchStitcher(columns, 
+                                            training, 
+                                            self.connectivity)
+        # Tiles are read by changing a temporary region, which leaves the
+        # user's region untouched.
+        grass.use_temp_region()
+        try:
+            for row0 in range(0, rows, size):
+                row1 = min(row0 + size, rows)
+                for col0 in range(0, columns, size):
+                    col1 = min(col0 + size, columns)
+                    # The halo is clipped at the edges of the raster, where
+                    # cells stay unclassified just as for the whole raster.
+                    top = max(row0 - halo, 0)
+                    bottom = min(row1 + halo, rows)
+                    left = max(col0 - halo, 0)
+                    right = min(col1 + halo, columns)
+                    classifier = FeatureClassifier(
+                        self.read_dem_block(region, top, bottom, left, right),
+                        region['ewres'],
+                        dtype=self.fit_dtype)
+                    self.check_rounding(classifier, windows[0])
+                    core = (slice(row0 - top, row1 - top),
+                            slice(col0 - left, col1 - left))
+                    # The tile and the cells within the match radius of it
+                    near_top = max(row0 - reach_rows, 0)
+                    near_left = max(col0 - reach_cols, 0)
+                    reach = (slice(near_top - top,
+                                   min(row1 + reach_rows, rows) - top),
+                             slice(near_left - left,
+                                   min(col1 + reach_cols, columns) - left))
+                    near = training.near(row0, row1, col0, col1)
+                    # Training peaks within the tile, in coordinates of the
+                    # cells within reach
+                    point_rows, point_cols, point_counts = training.in_block(
+                        row0, row1, col0, col1)
+                    point_rows += row0 - near_top
+                    point_cols += col0 - near_left
+                    for window in windows:
+                        with self.stage('fit'):
+                            parameters = classifier.fit(window)
+                        for task in tasks:
+                            if task[0] != window:
+                                continue
+                            with self.stage('classify'):
+                                features = classifier.classify(parameters,
+                                                               task[1])
+                            with self.stage('label'):
+                                covered = training.covered(
+                                    features[reach] == PEAK,
+                                    point_rows,
+                                    point_cols)
+                                stitchers[task].add_tile(
+                                    features[core] == PEAK,
+                                    col0,
+                                    near,
+                                    int(point_counts[~covered].sum()))
+                        del parameters
+                for stitcher in stitchers.values():
+                    stitcher.end_band()
+        finally:
+            grass.del_temp_region()
+        # All combinations are computed together and share the time
+        seconds = (time.time() - start) / len(tasks)
+        for task in tasks:
+            with self.stage('evaluate'):
+                errors = stitchers[task].errors()
+            self.record(task[0], task[1], errors, seconds)
+
+    def sweep_async(self, tasks):
+        '''
+        Finds and evaluates peaks for a list of (window, slope threshold)
+        combinations with the GRASS engine, overlapping the module chains of
+        several combinations on a ModuleScheduler.
+
+        With a summary floor, a window's slope thresholds are started from
+        the lowest up, and once a combination's summary index falls below
+        the floor, the window's larger thresholds are not started, or
+        cancelled if they already are. They are left out of the results and
+        the maps of cancelled ones are deleted.
+        '''
+
+        # Shared by all combinations, so made before any of them starts
+        self.write_reclass_rules()
+        self.count_training_peaks()
+        try:
+            skipped, cancelled = asyncio.run(self.evaluate_async(tasks))
+        finally:
+            self.remove_reclass_rules()
+        for window, slope_threshold in cancelled:
+            feature_map = map_name(self.prefix, window, slope_threshold)
+            peak_vectors = 'p_' + feature_map + '_peaks'
+            grass.run_command('g.remove', 
+                              flags='f',
+                              type='raster',
+                              name=feature_map + '_peaks,' + feature_map,
+                              quiet=True)
+            grass.run_command('g.remove', 
+                              flags='f',
+                              type='vector',
+                              name=','.join([peak_vectors,
+                                             peak_vectors + '_tp',
+                                             peak_vectors + '_found']),
+                              quiet=True)
+        if skipped:
+            grass.message('Skipped ' + str(len(skipped)) + ' combinations ' +
+                          'below the summary floor.')
+
+    async def evaluate_async(self, tasks):
+        '''
+        Runs process_combination_async() for the combinations and records
+        the results as they come in.
+
+        At most concurrent_modules combinations are in flight, so that the
+        scheduler always has a few chains to overlap, but combinations are
+        only classified shortly before they can be evaluated. With a summary
+        floor, a window's next slope threshold is only started once the
+        chain of the previous one reaches the evaluation. A window whose
+        summary index falls below the floor starts no more thresholds, and
+        its larger thresholds in flight are cancelled, so at most one of
+        them has been classified in vain.
+        @return skipped, cancelled: The combinations left out because of the
+                                    summary floor, and those of them that
+                                    were cancelled after they were started
+        '''
+
+        scheduler = ModuleScheduler(self.concurrent_modules)
+        # Slope thresholds that were not started yet, by window
+        queued = collections.OrderedDict()
+        for window, slope_threshold in sorted(tasks):
+            queued.setdefault(window, []).append(slope_threshold)
+        # Combinations in flight by their futures
+        running = {}
+        # Windows whose last started chain did not reach the evaluation yet
+        classifying = set()
+        progress = asyncio.Event()
+        skipped = []
+        cancelled = []
+
+        def evaluating(window, slope_threshold):
+            classifying.discard(window)
+            progress.set()
+
+        def start():
+            while len(running) < self.concurrent_modules:
+                windows = [window for window in queued 
+                           if window not in classifying]
+                if not windows:
+                    return
+                window = windows[0]
+                slope_threshold = queued[window].pop(0)
+                if not queued[window]:
+                    del queued[window]
+                if self.min_summary is not None:
+                    classifying.add(window)
+                future = asyncio.ensure_future(
+                    self.process_combination_async(scheduler,
+                                                   window,
+                                                   slope_threshold,
+                                                   evaluating))
+                running[future] = (window, slope_threshold)
+
+        try:
+            start()
+            while running:
+                waiter = asyncio.ensure_future(progress.wait())
+                done, _ = await asyncio.wait(
+                    list(running) + [waiter],
+                    return_when=asyncio.FIRST_COMPLETED)
+                waiter.cancel()
+                progress.clear()
+                for future in done:
+                    if future is waiter:
+                        continue
+                    window, slope_threshold = running.pop(future)
+                    classifying.discard(window)
+                    if future.cancelled():
+                        continue
+                    window, slope_threshold, errors, seconds = future.result()
+                    self.record(window, slope_threshold, errors, seconds)
+                    if (self.min_summary is None or
+                        summary_index(*[errors[error_value] for error_value
+                                        in ERROR_VALUES]) >= self.min_summary):
+                        continue
+                    # The floor rules out the window's larger thresholds
+                    skipped.extend((window, larger) 
+                                   for larger in queued.pop(window, []))
+                    for other, combination in running.items():
+                        if (combination[0] == window and
+                            combination[1] > slope_threshold and
+                            other.cancel()):
+                            skipped.append(combination)
+                            cancelled.append(combination)
+                start()
+        except:
+            for future in running:
+                future.cancel()
+            await asyncio.gather(*running, return_exceptions=True)
+            raise
+        return sorted(skipped), sorted(cancelled)
+
+    async def process_combination_async(self, 
+                                        scheduler, 
+                                        window, 
+                                        slope_threshold,
+                                        evaluating=None):
+        '''
+        Runs the GRASS module chain of find_peak_map() and evaluate_map() for
+        a single combination on a scheduler. The three counts of the
+        evaluation are independent and run concurrently. evaluating is
+        called with the window and slope threshold once the peak areas are
+        made and the evaluation begins.
+        @return window, slope_threshold, a dictionary of counts keyed by
+                error value and the seconds it took
+        '''
+
+        start = time.time()
+        combination = (window, slope_threshold)
+        feature_map = map_name(self.prefix, window, slope_threshold)
+        peak_raster = feature_map + '_peaks'
+        peak_vectors = 'p_' + peak_raster
+        await scheduler.run(combination,
+                            0,
+                            'r.param.scale',
+                            input=self.dem,
+                            output=feature_map,
+                            slope_tolerance=slope_threshold,
+                            size=window,
+                            method='feature')
+        await scheduler.run(combination,
+                            1,
+                            'r.reclass',
+                            input=feature_map,
+                            output=peak_raster,
+                            rules=self.reclass_rules)
+        await scheduler.run(combination,
+                            2,
+                            'r.to.vect',
+                            input=peak_raster,
+                            output=peak_vectors,
+                            type='area')
+        if evaluating is not None:
+            evaluating(window, slope_threshold)
+        if not self.leave_maps:
+            await scheduler.run(combination,
+                                3,
+                                'g.remove',
+                                flags='f',
+                                type='raster',
+                                name=peak_raster + ',' + feature_map)
+        true_positives, found, areas = await asyncio.gather(
+            self.count_selected_async(scheduler,
+                                      combination,
+                                      peak_vectors,
+                                      self.peaks,
+                                      peak_vectors + '_tp'),
+            self.count_selected_async(scheduler,
+                                      combination,
+                                      self.peaks,
+                                      peak_vectors,
+                                      peak_vectors + '_found'),
+            self.count_features_async(scheduler, combination, peak_vectors))
+        if not self.leave_maps:
+            await scheduler.run(combination, 
+                                7,
+                                'g.remove', 
+                                flags='f', 
+                                type='vector', 
+                                name=peak_vectors)
+        errors = {'true positives': true_positives,
+                  'false positives': areas - true_positives,
+                  'false negatives': self.count_training_peaks() - found}
+        return window, slope_threshold, errors, time.time() - start
+
+    async def count_features_async(self, scheduler, combination, vector):
+        '''
+        Counts the features of a vector map on a scheduler, see
+        count_features().
+        '''
+
+        output = await scheduler.run(combination,
+                                     5,
+                                     'v.db.select',
+                                     map=vector,
+                                     columns='cat',
+                                     flags='c')
+        return len(output.splitlines())
+
+    async def count_selected_async(self, 
+                                   scheduler, 
+                                   combination, 
+                                   ainput, 
+                                   binput, 
+                                   output):
+        '''
+        Selects and counts features on a scheduler, see count_selected().
+        '''
+
+        await scheduler.run(combination,
+                            4,
+                            'v.select',
+                            ainput=ainput,
+                            binput=binput,
+                            output=output,
+                            operator='overlap')
+        count = await self.count_features_async(scheduler, 
+                                                combination, 
+                                                output)
+        await scheduler.run(combination, 
+                            6,
+                            'g.remove', 
+                            flags='f', 
+                            type='vector', 
+                            name=output)
+        return count
+
+    def sweep_parallel(self, tasks):
+        '''
+        Finds and evaluates peaks for a list of (window, slope threshold)
+        combinations in a pool of worker processes.
+
+        Every worker runs in its own temporary mapset in the current
+        location, so that maps and temporary files of concurrent tasks never
+        collide. The mapsets are deleted afterwards unless maps are to be
+        left in the mapset.
+        '''
+
+        for result in self.map_workers(sweep_task, self.window_tasks(tasks)):
+            self.record(*result)
+
+    def window_tasks(self, tasks):
+        '''
+        Groups (window, slope threshold) combinations into the tasks of
+        sweep() workers. The NumPy engine fits each window once per worker,
+        so all thresholds of a window are sent to the same worker, whatever
+        combinations are left. With the GRASS engine, every combination is
+        a task of its own.
+        @return tasks: A list of (window, slope thresholds) tuples
+        '''
+
+        if self.engine != 'numpy':
+            return [(window, [slope_threshold]) 
+                    for window, slope_threshold in tasks]
+        windows = collections.OrderedDict()
+        for window, slope_threshold in tasks:
+            windows.setdefault(window, []).append(slope_threshold)
+        return list(windows.items())
+
+    def map_workers(self, function, tasks, analysts=None):
+        '''
+        Runs a task function for a list of tasks in a pool of worker
+        processes (see sweep_parallel()), in any order. Every task returns
+        a list of results. The stage timings of the workers are added to
+        those of this analyst.
+
+        With the NumPy engine, the elevation models of the analysts (by
+        default only this one) are written once to scratch files in the
+        workspace, which the workers memory-map read-only instead of reading
+        their own copies. Memory use then stays flat as workers are added.
+        @return results: Iterator over the results of all tasks
+        '''
+
+        # Workers cannot see maps in each other's mapsets, so inputs are
+        # referred to by their fully qualified names.
+        worker_options = dict(self.options)
+        worker_options['dem'] = grass.find_file(self.dem,
+                                                element='cell')['fullname']
+        worker_options['peaks'] = grass.find_file(self.peaks,
+                                                  element='vector')['fullname']
+        worker_options['workers'] = '1'
+        # Only the parent process uses the result cache
+        worker_options['cache_directory'] = ''
+        # The parent already invalidated the stored masks
+        worker_flags = dict(self.flags)
+        worker_flags['x'] = False
+        workspace = tempfile.mkdtemp(prefix=self.prefix)
+        shared = {}
+        pool = None
+        try:
+            if self.engine == 'numpy':
+                for index, analyst in enumerate(analysts or [self]):
+                    fullname = grass.find_file(analyst.dem,
+                                               element='cell')['fullname']
+                    shared[fullname] = os.path.join(workspace, 
+                                                    'dem' + str(index))
+                    analyst.share_dem(shared[fullname])
+            pool = multiprocessing.Pool(self.workers,
+                                        init_worker,
+                                        (worker_options,
+                                         worker_flags,
+                                         workspace,
+                                         self.prefix,
+                                         self.clip_peaks,
+                                         standalone_session(),
+                                         shared))
+            for results, events, timings in pool.imap_unordered(function, 
+                                                                tasks):
+                # Merge the GRASS calls traced and the stages timed by the
+                # worker
+                if events:
+                    grass.events.extend(events)
+                for name in timings:
+                    self.timings[name] += timings[name]
+                for result in results:
+                    yield result
+            pool.close()
+        except:
+            if pool is not None:
+                pool.terminate()
+            raise
+        finally:
+            if pool is not None:
+                pool.join()
+            shutil.rmtree(workspace, ignore_errors=True)
+            self.remove_worker_mapsets()
+
+    def share_dem(self, path):
+        '''
+        Writes the elevation model prepared for the NumPy engine to scratch
+        files for worker processes (see FeatureClassifier.share()).
+        '''
+
+        if self.fits is not None:
+            self.fits.classifier.share(path)
+            return
+        # The region may have been changed by the analysts of other tiles
+        grass.run_command('g.region', raster=self.dem)
+        classifier = FeatureClassifier(self.read_dem(), 
+                                       grass.region()['ewres'],
+                                       dtype=self.fit_dtype)
+        self.check_rounding(classifier, min(self.window_sizes))
+        classifier.share(path)
+
+    def check_rounding(self, classifier, window):
+        '''
+        Stops in low-memory mode if rounding the elevation model to float32
+        could move the curvatures of a window size, and of all larger ones,
+        by more than the curvature tolerance (see
+        FeatureClassifier.rounding_bounds()). Peaks could then differ from
+        those of r.param.scale by more than the tolerance allows.
+        '''
+
+        if not self.low_memory:
+            return
+        curvature = classifier.rounding_bounds(window)[1]
+        if curvature > classifier.curvature_tolerance:
+            grass.fatal('Low-memory mode could move the curvatures of ' + 
+                        'window size ' + str(window) + ' by up to ' + 
+                        '%.2g' % curvature + ', more than the curvature ' + 
+                        'tolerance of ' + 
+                        '%g' % classifier.curvature_tolerance + 
+                        '. Run without -m or with larger window sizes.')
+
+    def record(self, window, slope_threshold, errors, seconds=None):
+        '''
+        Writes the error values of a combination to the results container,
+        the result cache and the result stream. seconds is the time it took
+        to compute the combination, None if it was not timed or cached.
+        '''
+
+        self.evaluated[(window, slope_threshold)] = errors
+        if seconds is not None:
+            self.runtimes[(window, slope_threshold)] = seconds
+        # Combinations off the grid are only evaluated by search()
+        if (window in self.window_sizes and 
+            slope_threshold in self.slope_thresholds):
+            for error_value in ERROR_VALUES:
+                self.results.add_error(window,
+                                       slope_threshold,
+                                       error_value,
+                                       errors[error_value])
+        if self.cache is not None:
+            self.cache.put(window, slope_threshold, errors)
+        if self.stream is not None:
+            self.stream.write(self.dem, 
+                              window, 
+                              slope_threshold, 
+                              errors, 
+                              seconds)
+
+    def remove_worker_mapsets(self):
+        '''
+        Deletes the temporary mapsets made by sweep() workers, unless maps
+        are to be left in the mapset.
+        '''
+
+        env = grass.gisenv()
+        location = os.path.join(env['GISDBASE'], env['LOCATION_NAME'])
+        for mapset in glob.glob(os.path.join(location, self.prefix + '_*')):
+            if self.leave_maps:
+                grass.message('Maps were left in mapset ' +
+                              os.path.basename(mapset))
+            else:
+                shutil.rmtree(mapset, ignore_errors=True)
+
+    def process_combination(self, window, slope_threshold):
+        '''
+        Finds peaks for a single combination and counts its error values.
+        @return window, slope_threshold, a dictionary of counts keyed by
+                error value and the seconds it took
+        '''
+
+        start = time.time()
+        self.trace_combination(window, slope_threshold)
+        peak_map = self.find_peak_map(window, slope_threshold)
+        errors = self.evaluate_map(peak_map)
+        if not (self.leave_maps or 
+                isinstance(peak_map, (PeakPatches, PatchStitcher))):
+            # The vector map of peak areas is only needed for counting
+            grass.run_command('g.remove', 
+                              flags='f', 
+                              type='vector', 
+                              name=peak_map)
+        self.trace_combination()
+        return window, slope_threshold, errors, time.time() - start
+
+    def dataset_key(self):
+        '''
+        Returns a key identifying the inputs of this analysis for the result
+        cache: a content hash of the elevation model, the region settings,
+        the training peaks and the settings that change the error values.
+        '''
+
+        digest = hashlib.sha1()
+        digest.update(self.dem_key(['engine', 
+                                    'pyramid_window',
+                                    'pyramid_factor',
+                                    'validation', 
+                                    'match_radius', 
+                                    'connectivity',
+                                    'clip_peaks',
+                                    'low_memory']).encode())
+        digest.update(grass.read_command('v.out.ascii',
+                                         input=self.peaks,
+                                         format='point').encode())
+        return digest.hexdigest()
+
+    def dem_key(self, settings):
+        '''
+        Returns a key identifying the elevation model in the current region
+        together with a list of settings of the analyst: a hash of the
+        region settings, the settings and the content of the elevation
+        model. The content is only hashed once.
+        '''
+
+        if self.dem_digest is None:
+            digest = hashlib.sha1()
+            # Stream the elevation model so it never has to fit in memory
+            dem = grass.pipe_command('r.out.bin',
+                                     input=self.dem,
+                                     output='-',
+                                     quiet=True)
+            for chunk in iter(lambda: dem.stdout.read(1 << 20), b''):
+                digest.update(chunk)
+            dem.wait()
+            self.dem_digest = digest.hexdigest()
+        digest = hashlib.sha1()
+        region = grass.region()
+        for key in sorted(region):
+            digest.update((key + '=' + str(region[key]) + '\n').encode())
+        for setting in settings:
+            digest.update((setting + '=' + str(getattr(self, setting)) + 
+                           '\n').encode())
+        digest.update(self.dem_digest.encode())
+        return digest.hexdigest()
+
+    def get_masks(self):
+        '''
+        Returns the mask store of the elevation model, or None if masks are
+        not stored.
+        '''
+
+        if self.masks is None and self.mask_directory:
+            # Only the classification settings change the masks
+            self.masks = MaskStore(self.mask_directory, 
+                                   self.dem_key(['engine', 
+                                                 'pyramid_window',
+                                                 'pyramid_factor',
+                                                 'low_memory']))
+        return self.masks
+
+    def stored(self, tasks):
+        '''
+        Evaluates the combinations whose peak masks are in the mask store
+        against the training peaks and records their error values.
+        @return tasks: The combinations that still have to be classified
+        '''
+
+        masks = self.get_masks()
+        if masks is None:
+            return tasks
+        training = self.get_training_peaks()
+        remaining = []
+        for window, slope_threshold in tasks:
+            start = time.time()
+            with self.stage('read'):
+                mask = masks.get(window, slope_threshold)
+            if mask is None:
+                remaining.append((window, slope_threshold))
+                continue
+            with self.stage('label'):
+                if self.low_memory:
+                    patches = mask.patches(training, 
+                                           connectivity=self.connectivity)
+                else:
+                    patches = PeakPatches(mask.unpack(), 
+                                          training, 
+                                          self.connectivity)
+            with self.stage('evaluate'):
+                errors = patches.errors()
+            self.record(window, slope_threshold, errors, time.time() - start)
+        return remaining
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        '''
+        Adds the time spent in a block to the timing of a processing stage
+        in self.timings.
+        '''
+
+        start = time.time()
+        try:
+            yield
+        finally:
+            end = time.time()
+            self.timings[name] += end - start
+            if isinstance(grass, GrassTracer):
+                grass.record(name, 'stage', start, end)
+
+    def trace_combination(self, window=None, slope_threshold=None):
+        '''
+        Tags the GRASS module calls that follow with a combination, if they
+        are traced.
+        '''
+
+        if isinstance(grass, GrassTracer):
+            grass.tags = {'window': window, 'slope_threshold': slope_threshold}
+
+    def read_dem_block(self, region, row0, row1, col0, col1):
+        '''
+        Reads a block of rows and columns of region from the elevation model.
+        Must be called while a temporary region is in use.
+        '''
+
+        grass.run_command('g.region',
+                          n=region['n'] - row0 * region['nsres'],
+                          s=region['n'] - row1 * region['nsres'],
+                          w=region['w'] + col0 * region['ewres'],
+                          e=region['w'] + col1 * region['ewres'],
+                          nsres=region['nsres'],
+                          ewres=region['ewres'])
+        block = self.read_dem()
+        if block.shape != (row1 - row0, col1 - col0):
+            grass.fatal('Could not align the region to a tile of ' + 
+                        self.dem + '.')
+        return block
+
+    def read_dem(self):
+        '''
+        Reads the elevation model in the current region into a NumPy array.
+        Null cells are returned as NaN.
+        '''
 
-#%Option
-#% key: dem
-#% description: The input elevation map
-#% gisprompt: old,cell,raster
-#% required: yes
-#%End
-#%Option
-#% key: peaks
-#% description: A vector map of training peaks as points
-#% gisprompt: old,vector
-#% required: yes
-#%End
-#%Option
-#% key: window_sizes
-#% type: string
-#% description: A list of integer window sizes separated by commas
-#% required: yes
-#% answer: 3, 5, 9, 19, 39, 69
-#%End
-#%Option
-#% key: slope_thresholds
-#% type: string
-#% description: A list of slope thresholds separated by commas
-#% required: yes
-#% answer: 1, 2, 3, 4, 5, 6, 7, 8, 9, 10
-#%End
-#%Option
-#% key: export_directory
-#% type: string
-#% description: The directory to export CSVs to.
-#% required: yes
-#% gisprompt: old,dbase,dbase
-#%End
+        garray = raster_arrays()
+        with self.stage('read'):
+            dem = garray.array(dtype=self.fit_dtype)
+            # r.out.bin writes null cells as 0 unless told otherwise
+            dem.read(self.dem, null='nan')
+            return numpy.array(dem, dtype=self.fit_dtype)
 
-import os
-import csv
+    def write_features(self, features, feature_map):
+        '''
+        Writes a feature raster from the NumPy engine to a GRASS raster map.
+        Unclassified cells are written as NULL.
+        '''
 
-import grass.script as grass
+        garray = raster_arrays()
+        output = garray.array(dtype=numpy.int32)
+        output[...] = features
+        output.write(feature_map, null=0, overwrite=True)
 
-def parse_error_values(flags):
+    def read_features(self, feature_map):
+        '''
+        Reads a feature map into a NumPy array. NULL cells are read as 0.
+        '''
+
+        garray = raster_arrays()
+        features = garray.array()
+        features.read(feature_map, null=0)
+        return numpy.array(features, dtype=numpy.int32)
+
+    def compare_features(self, features, window, slope_threshold):
+        '''
+        Runs r.param.scale with the same parameters as the NumPy engine and
+        reports how well the two feature maps agree.
+        '''
+
+        reference_map = map_name(self.prefix, 'check', window, slope_threshold)
+        grass.run_command('r.param.scale',
+                          input=self.dem,
+                          output=reference_map,
+                          slope_tolerance=slope_threshold,
+                          size=window,
+                          method='feature')
+        reference = self.read_features(reference_map)
+        grass.run_command('g.remove', 
+                          flags='f', 
+                          type='raster', 
+                          name=reference_map)
+        # Only compare cells that both engines classified
+        classified = (features > 0) & (reference > 0)
+        cells = max(classified.sum(), 1)
+        agreement = (features == reference)[classified].sum() / float(cells)
+        peaks = ((features == PEAK) != (reference == PEAK))[classified].sum()
+        grass.message('Window ' + str(window) + ', slope ' +
+                      str(slope_threshold) + ': ' +
+                      str(round(100 * agreement, 2)) +
+                      '% of features agree with r.param.scale, ' +
+                      str(peaks) + ' peak cells differ')
+    
+    def evaluate_map(self, peak_map):
+        '''
+        Counts true positives, false positives and false negatives of a found
+        peak map in a single pass.
+
+        For a vector map, two selections are needed: the peak areas that
+        contain training peaks and the training peaks inside peak areas. The
+        false positives and false negatives are the remainders of the total
+        number of areas and training peaks.
+        @return errors: Dictionary of counts keyed by error value
+        '''
+
+        with self.stage('evaluate'):
+            if isinstance(peak_map, (PeakPatches, PatchStitcher)):
+                return peak_map.errors()
+            return self.evaluate_map_vectors(peak_map)
+
+    def evaluate_map_vectors(self, peak_map):
+        '''
+        Counts the error values of a vector map of peak areas for
+        evaluate_map().
+        '''
+
+        # Find peak areas containing peak points.
+        true_positives = self.count_selected(peak_map, 
+                                             self.peaks, 
+                                             peak_map + '_tp')
+        # Find training peaks that overlap with peak areas.
+        found = self.count_selected(self.peaks, 
+                                    peak_map, 
+                                    peak_map + '_found')
+        areas = self.count_features(peak_map)
+        return {'true positives': true_positives,
+                'false positives': areas - true_positives,
+                'false negatives': self.count_training_peaks() - found}
+
+    def count_training_peaks(self):
+        '''
+        Counts the training peaks, counting them only the first time.
+        '''
+
+        if self.training_count is None:
+            if self.clip_peaks:
+                self.training_count = len(self.get_training_peaks())
+            else:
+                self.training_count = self.count_features(self.peaks)
+        return self.training_count
+
+    def count_features(self, vector):
+        '''
+        Counts the features of a vector map by their categories.
+        '''
+
+        return len(grass.read_command('v.db.select',
+                                      map=vector,
+                                      columns='cat',
+                                      flags='c').splitlines())
+
+    def count_selected(self, ainput, binput, output, operator='overlap'):
+        '''
+        Selects features of ainput by their spatial relation to binput and
+        counts them. The selection is written to a scratch map named output,
+        which is deleted afterwards.
+        '''
+
+        grass.run_command('v.select',
+                          ainput=ainput,
+                          binput=binput,
+                          output=output,
+                          operator=operator)
+        # Count features in the extracted map
+        count = self.count_features(output)
+        grass.run_command('g.remove',
+                          flags='f',
+                          type='vector',
+                          name=output)
+        return count
+    
+def parse_dems(options):
     '''
-    Parses flag dictionary from GRASS parser into text descriptions
-    @return error_values: A list of error values 
+    Lists the elevation maps given by the dem and dem_pattern options.
+    @return dems: A list of raster map names without duplicates
     '''
-    # Append error flags to error values list
-    error_values = []
-    for error_flag in flags.keys():
-        if flags[error_flag]:
-            error_values.append(error_flag) # Replace error values from flags with readable strings
-    
-    if 't' in error_values:
-        error_values.remove('t')
-        error_values.append('true positives')
-    if 'f' in error_values:
-        error_values.remove('f')
-        error_values.append('false positives')
-    if 'n' in error_values:
-        error_values.remove('n')
-        error_values.append('false negatives')
-    if 's' in error_values:
-        error_values.remove('s')
-        error_values.append('summarize')
-    return error_values
 
-class PeakAnalyst(object):
+    dems = []
+    for dem in options['dem'].split(','):
+        if dem.strip() and dem.strip() not in dems:
+            dems.append(dem.strip())
+    if options['dem_pattern']:
+        for dem in grass.list_strings('raster', 
+                                      pattern=options['dem_pattern']):
+            if dem not in dems:
+                dems.append(dem)
+    if not dems:
+        grass.fatal('No elevation maps match ' + options['dem_pattern'] + '.')
+    return dems
+
+class BatchAnalyst(object):
     '''
-    A geographical object that finds peaks according to specified parameters
-    and compares them with a validation data set.
+    Sweeps the same window sizes and slope thresholds over several elevation
+    models ("tiles") that share one training peak layer, and pools their
+    error values.
+
+    Each tile is analyzed in its own region by a PeakAnalyst that only
+    counts the training peaks inside the tile, so the pooled counts are the
+    sums of the tile counts and every training peak is counted once, as
+    long as the tiles do not overlap.
     '''
-    
-    def __init__(self, 
-                 options,
-                 flags):
+
+    def __init__(self, dems, options, flags):
         '''
-        Initializes peak analyst with the window sizes and slope thresholds to
-        be used in the analysis. Adjusts regional settings to match rasters
-        to be analyzed. Inputs are received and parsed from GUI.
-        
         Inputs:
-            window_sizes: int list
-            slope_thresholds: int list
-            flags: dictionary of binary values.
-                   t - true positives
-                   f - false negatives
-                   n - false negatives
-                   s - summarize
-            dem: string (name of GRASS elevation model to be analyzed. Must be
-                         in same mapset)
-            peaks: string (name of GRASS vector points showing peaks. Later,
-                           this could be expanded to allow the use of polygons
-                           as peaks)
-            results: results container object
+            dems: list of elevation map names
+            options, flags: as for PeakAnalyst
         '''
-        
-        # The input is a string of integers divided by commas. Split it into
-        # a list and convert all values to integers.
-        self.window_sizes = options['window_sizes'].split(',')
-        for i in range(len(self.window_sizes)):
-            self.window_sizes[i] = int(self.window_sizes[i])
-        # Repeat procedure as above.
-        self.slope_thresholds = options['slope_thresholds'].split(',')
-        for i in range(len(self.slope_thresholds)):
-            self.slope_thresholds[i] = int(self.slope_thresholds[i])
-        self.error_values = parse_error_values(flags)
-        self.dem = options['dem']
-        self.peaks = options['peaks']
-        # Set region to raster
-        grass.run_command('g.region', rast=self.dem)
-        # Initialize results container
-        self.results = ResultsContainer(self.window_sizes,
-                                        self.slope_thresholds,
-                                        self.error_values)
-    
 
-    def find_peaks(self):
+        self.dems = dems
+        self.options = options
+        self.flags = flags
+        self.workers = int(options['workers'] or 1)
+        if (options['search'] or 'grid') != 'grid':
+            grass.fatal('Several elevation maps can only be tuned with ' + 
+                        'search=grid.')
+        # Results of each tile, keyed by elevation map
+        self.results = collections.OrderedDict()
+        self.pooled = None
+        # Seconds spent in each processing stage, summed over the tiles
+        self.timings = collections.defaultdict(float)
+
+    def analyst(self, dem):
         '''
-        Performs morphometric analyses for all specified window sizes and slope
-        thresholds, then extracts all areas classified as peaks and converts
-        them into vector areas.
+        Sets up the peak analyst of a tile. This also sets the region to the
+        tile.
         '''
-        
-        def cleanup(feature_map, grass, peak_raster):
-            '''
-            Deletes produced maps if the user has chosen to do so.
-            '''
-            if not flags['l']:
-            # Delete the geomorphometry map and raster peak map.
-                for raster in [peak_raster, feature_map]:
-                    grass.run_command('g.remove', rast=raster)
-        
-        # Make reclass table that eliminates all features except for peaks
-        reclass_rules = '.tmp_reclass.txt'
-        with open(reclass_rules, 'w') as reclass:
-            reclass.write('0 thru 5 = NULL\n' + 
-                          '* = *\n' + 
-                          'end\n')
-        self.found_peaks = []
-        for window in self.window_sizes:
-            for slope_threshold in self.slope_thresholds:
-                # Use r.param.scale to produce peak maps.
-                feature_map = str(window) + '_' + str(slope_threshold)
-                grass.run_command('r.param.scale',
-                                  input=self.dem,
-                                  output=feature_map,
-                                  s_tol=slope_threshold,
-                                  size=window,
-                                  param='feature')
-                # Use r.reclass to extract the peaks as rasters.
-                peak_raster = feature_map + '_peaks'
-                grass.run_command('r.reclass',
-                                  input=feature_map,
-                                  output=peak_raster,
-                                  rules=reclass_rules)
-                # Use r.to.vect to turn the peaks into areas.
-                peak_vectors = 'p_' + peak_raster
-                grass.run_command('r.to.vect',
-                                  input=peak_raster,
-                                  output=peak_vectors,
-                                  feature='area')
-                # Add the window, slope threshold and vector peak map to list 
-                # of found peaks
-                self.found_peaks.append([window, slope_threshold, peak_vectors])
-                
-                cleanup(feature_map, grass, peak_raster)
-        # Delete reclass table
-        os.remove(reclass_rules)
-    
-    def evaluate_peaks(self, error_value):
+
+        options = dict(self.options)
+        options['dem'] = dem
+        return PeakAnalyst(options, self.flags, clip_peaks=True)
+
+    def sweep(self):
         '''
-        Calls an evaluation method that compares training peaks with identified
-        peaks.
+        Finds and evaluates peaks for all combinations on every tile and
+        pools the results.
+
+        With several workers, the tile x combination tasks of all tiles are
+        shared by one pool of worker processes, so that small tiles keep all
+        workers busy. Tiled and incremental sweeps are run tile after tile.
         '''
-        
-        # If-else query to find out which method to call
-        if error_value == 'true positives':
-            self.true_positives()
-        elif error_value == 'false positives':
-            self.false_positives()
-        elif error_value == 'false negatives':
-            self.false_negatives()
-    
-    def true_positives(self):
+
+        # Every combination of every tile is written to one result stream
+        stream = ResultStream(os.path.join(self.options['export_directory'],
+                                           STREAM_FILE))
+        # Analysts of the tiles swept by the pool, by fully qualified name
+        analysts = collections.OrderedDict()
+        names = {}
+        tasks = []
+        try:
+            for dem in self.dems:
+                analyst = self.analyst(dem)
+                analyst.stream = stream
+                parallel = (self.workers > 1 and analyst.tile_size == 0 and
+                            analyst.sweep_mode == 'grid')
+                if not parallel:
+                    grass.message('Sweeping ' + dem + '...')
+                    analyst.sweep()
+                    self.add_tile(dem, analyst)
+                    continue
+                # Workers refer to the tiles by their fully qualified names
+                fullname = grass.find_file(dem, element='cell')['fullname']
+                analysts[fullname] = analyst
+                names[fullname] = dem
+                # Every tile's windows stay together, see window_tasks()
+                tasks.extend((fullname,) + task
+                             for task in analyst.window_tasks(
+                                 analyst.uncached(
+                                     [(window, slope_threshold)
+                                      for window in analyst.window_sizes
+                                      for slope_threshold in 
+                                      analyst.slope_thresholds])))
+            if tasks:
+                for result in analyst.map_workers(batch_task, 
+                                                  tasks, 
+                                                  list(analysts.values())):
+                    analysts[result[0]].record(*result[1:])
+        finally:
+            stream.close()
+        for fullname in analysts:
+            self.add_tile(names[fullname], analysts[fullname])
+
+    def add_tile(self, dem, analyst):
         '''
-        Count classified peak areas that contain a training peak and write 
-        number to results container.
+        Adds the results of a tile's analyst to the pooled results.
         '''
-        
-        true_positives = 'true_positives'
-        
-        # peak_map contains [window, slope, map]
-        for peak_map in self.found_peaks:
-            # Find peak areas containing peak points.
-            grass.run_command('v.select',
-                              ainput=peak_map[2],
-                              binput=self.peaks,
-                              output=true_positives)
-            # Count features in the extracted map and call write_to_results()
-            true_positives_count = len(grass.read_command('v.db.select',
-                                                          map=true_positives,
-                                                          column='cat',
-                                                          flags='c').splitlines())
-            grass.run_command('g.remove',
-                              vect=true_positives)
-            # Send results to results container object
-            self.results.add_error(peak_map[0], 
-                                   peak_map[1],
-                                   'true positives', 
-                                   true_positives_count)
-    
-    def false_positives(self):
+
+        self.results[dem] = analyst.results
+        for name in analyst.timings:
+            self.timings[name] += analyst.timings[name]
+        if self.pooled is None:
+            self.pooled = ResultsContainer(analyst.results.window_sizes,
+                                           analyst.results.slope_thresholds,
+                                           analyst.results.error_values)
+            self.pooled.values[...] = 0
+        self.pooled.values += analyst.results.values
+
+    def export(self):
         '''
-        Count classified peak areas that do not contain a training peak and 
-        write number to results container.
+        Exports the results of every tile to a directory named after the
+        tile in the export directory, and the pooled results to the export
+        directory itself.
         '''
-        
-        false_positives = 'false_positives'
-        for peak_map in self.found_peaks:
-            # Find peak areas that do not contain training peaks
-            grass.run_command('v.select',
-                              ainput=peak_map[2],
-                              binput=self.peaks,
-                              output=false_positives,
-                              operator='disjoint')
-            # Count features in the extracted map and call write_to_results()
-            false_positives_count = len(grass.read_command('v.db.select',
-                                                           map=false_positives,
-                                                           column='cat',
-                                                           flags='c').splitlines())
-            grass.run_command('g.remove',
-                              vect=false_positives)
-            self.results.add_error(peak_map[0], 
-                                   peak_map[1],
-                                   'false positives', 
-                                   false_positives_count)
 
-    def false_negatives(self):
+        for dem in self.results:
+            options = dict(self.options)
+            # Standalone runs name their tiles by file paths
+            options['export_directory'] = os.path.join(
+                self.options['export_directory'], 
+                os.path.basename(dem).replace('@', '_'))
+            if not os.path.isdir(options['export_directory']):
+                os.makedirs(options['export_directory'])
+            Exporter(self.results[dem], self.flags, options, print_table=False)
+        print('Pooled results of ' + str(len(self.results)) + ' tiles:')
+        Exporter(self.pooled, self.flags, self.options)
+
+class ResultCache(object):
+    '''
+    An on-disk cache of the error values of each window size and slope
+    threshold, kept in an SQLite database.
+
+    Entries are keyed by a data set key (see PeakAnalyst.dataset_key()), so
+    repeated or extended sweeps over the same inputs only compute missing
+    combinations, and interrupted sweeps resume where they stopped. The
+    number of entries is bounded; the least recently used entries are
+    evicted first.
+    '''
+
+    def __init__(self, directory, key, max_entries=10000):
         '''
-        Count training peaks that are not contained in a classified peak area
-        and write number to results container.
+        Opens or creates the cache database in directory.
         '''
-        
-        false_negatives = 'false_negatives'
-        for peak_map in self.found_peaks:
-            # Find training peaks that do not overlap with peak areas.
-            grass.run_command('v.select',
-                              ainput=self.peaks,
-                              binput=peak_map[2],
-                              output=false_negatives,
-                              operator='disjoint')
-            # Count features in the extracted map and call write_to_results()
-            false_negatives_count = len(grass.read_command('v.db.select',
-                                                           map=false_negatives,
-                                                           column='cat',
-                                                           flags='c').splitlines())
-            grass.run_command('g.remove',
-                              vect=false_negatives)
-            self.results.add_error(peak_map[0], 
-                                   peak_map[1],
-                                   'false negatives', 
-                                   false_negatives_count)
-    
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.key = key
+        self.max_entries = max_entries
+        self.connection = sqlite3.connect(
+            os.path.join(directory, 'peak_parameters_cache.sqlite'))
+        self.connection.execute('CREATE TABLE IF NOT EXISTS results ('
+                                'dataset TEXT, '
+                                'window INTEGER, '
+                                'slope REAL, '
+                                'true_positives INTEGER, '
+                                'false_positives INTEGER, '
+                                'false_negatives INTEGER, '
+                                'used REAL, '
+                                'PRIMARY KEY (dataset, window, slope))')
+        self.connection.commit()
+
+    def get(self, window, slope_threshold):
+        '''
+        Returns the cached error values of a combination, or None if the
+        combination is not cached.
+        '''
+
+        row = self.connection.execute(
+            'SELECT true_positives, false_positives, false_negatives '
+            'FROM results WHERE dataset = ? AND window = ? AND slope = ?',
+            (self.key, window, slope_threshold)).fetchone()
+        if row is None:
+            return None
+        # Mark the entry as recently used
+        self.connection.execute(
+            'UPDATE results SET used = ? '
+            'WHERE dataset = ? AND window = ? AND slope = ?',
+            (time.time(), self.key, window, slope_threshold))
+        self.connection.commit()
+        return dict(zip(ERROR_VALUES, row))
+
+    def put(self, window, slope_threshold, errors):
+        '''
+        Stores the error values of a combination and evicts the least
+        recently used entries if the cache is full.
+        '''
+
+        self.connection.execute(
+            'INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (self.key, window, slope_threshold) +
+            tuple(errors[error_value] for error_value in ERROR_VALUES) +
+            (time.time(),))
+        self.connection.execute(
+            'DELETE FROM results WHERE rowid IN '
+            '(SELECT rowid FROM results ORDER BY used DESC '
+            'LIMIT -1 OFFSET ?)', (self.max_entries,))
+        self.connection.commit()
+
+    def invalidate(self):
+        '''
+        Deletes all cached entries of the data set.
+        '''
+
+        self.connection.execute('DELETE FROM results WHERE dataset = ?',
+                                (self.key,))
+        self.connection.commit()
+
+class MaskStore(object):
+    '''
+    Keeps the peak masks of an elevation model on disk, one compressed file
+    of the rows of a PackedMask per window size and slope threshold, so
+    that they can be evaluated against new training peaks without
+    classifying the elevation model again. The low-memory mode reads and
+    writes them without ever unpacking a whole mask.
+
+    The masks of each elevation model and classification settings are kept
+    in their own directory, named by their key. Files are written to a
+    temporary name first and then renamed, so that concurrent workers and
+    interrupted runs never leave partial masks.
+    '''
+
+    def __init__(self, directory, key):
+        self.directory = os.path.join(directory, key)
+        try:
+            os.makedirs(self.directory)
+        except OSError:
+            # Made by another process
+            if not os.path.isdir(self.directory):
+                raise
+
+    def path(self, window, slope_threshold):
+        return os.path.join(self.directory,
+                            map_name(window, slope_threshold) + '.npz')
+
+    def get(self, window, slope_threshold):
+        '''
+        Reads the mask of a combination.
+        @return mask: PackedMask, or None if it was not stored
+        '''
+
+        path = self.path(window, slope_threshold)
+        if not os.path.exists(path):
+            return None
+        with numpy.load(path) as stored:
+            return PackedMask(stored['bits'], stored['shape'])
+
+    def put(self, window, slope_threshold, mask):
+        '''
+        Stores the PackedMask of a combination.
+        '''
+
+        with tempfile.NamedTemporaryFile(dir=self.directory,
+                                         suffix='.tmp',
+                                         delete=False) as stored:
+            numpy.savez_compressed(stored,
+                                   bits=mask.bits,
+                                   shape=numpy.array(mask.shape))
+        os.replace(stored.name, self.path(window, slope_threshold))
+
+    def invalidate(self):
+        '''
+        Deletes all stored masks of the elevation model.
+        '''
+
+        for path in glob.glob(os.path.join(self.directory, '*.npz')):
+            os.remove(path)
+
+class ResultStream(object):
+    '''
+    Writes the error values of every combination to a long-format CSV as
+    soon as they are recorded, one row per elevation map and combination.
+    Every row is flushed, so an interrupted sweep keeps all combinations
+    that were done.
+    '''
+
+    columns = ['dem', 
+               'window_size', 
+               'slope_threshold', 
+               'true_positives',
+               'false_positives', 
+               'false_negatives', 
+               'summarize', 
+               'seconds']
+
+    def __init__(self, path):
+        self.file = open(path, 'w', newline='')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(self.columns)
+        self.file.flush()
+
+    def write(self, dem, window, slope_threshold, errors, seconds=None):
+        '''
+        Appends a combination. seconds is left empty if it is None.
+        '''
+
+        tp, fp, fn = [errors[error_value] for error_value in ERROR_VALUES]
+        self.writer.writerow([dem,
+                              window,
+                              slope_threshold,
+                              tp,
+                              fp,
+                              fn,
+                              '%.12g' % summary_index(tp, fp, fn),
+                              '' if seconds is None else '%.3f' % seconds])
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
 class ResultsContainer(object):
     '''
-    A data container with a three dimensional matrix.
+    A data container with a three dimensional matrix, held in a dense NumPy
+    array.
     
     X: Window sizes
     Y: Slope thresholds
     Z: Error values
     
     The matrix is indexed using the following scheme:
-    window[window_size][slope_threshold][error_value]
+    values[window_index, slope_index, error_index]
     
-    Parallel lists (window_sizes, slope_thresholds, error_values) serve as axes.
+    Parallel lists (window_sizes, slope_thresholds, error_values) serve as
+    axes, and dictionaries map their entries to indices. Entries that were
+    never added are NaN.
     '''
     
     def __init__(self,
@@ -326,20 +3573,16 @@ class ResultsContainer(object):
         Initializes axes and data matrix.
         '''
         
-        self.window_sizes = window_sizes
-        self.slope_thresholds = slope_thresholds
-        self.error_values = error_values
-        # Initialize window list
-        self.window = []
-        for i in range(len(self.window_sizes)):
-            # Append slope lists to windows
-            self.window.append([])
-            for j in range(len(slope_thresholds)):
-                # Append error value lists to slope lists
-                self.window[i].append([])
-                for k in range(len(self.error_values)):
-                    # Make entries for error values
-                    self.window[i][j].append([])
+        self.window_sizes = list(window_sizes)
+        self.slope_thresholds = list(slope_thresholds)
+        self.error_values = list(error_values)
+        self.window_index = axis_index(self.window_sizes)
+        self.slope_index = axis_index(self.slope_thresholds)
+        self.error_index = axis_index(self.error_values)
+        self.values = numpy.full((len(self.window_sizes),
+                                  len(self.slope_thresholds),
+                                  len(self.error_values)),
+                                 numpy.nan)
     
     def add_error(self, 
                   window_size, 
@@ -351,13 +3594,33 @@ class ResultsContainer(object):
         structure.
         '''
         
-        # Find indices for window size, slope threshold and error value
-        window_index = self.window_sizes.index(window_size)
-        slope_index = self.slope_thresholds.index(slope_threshold)
-        error_index = self.error_values.index(error_type)
-        # Append error value to correct position in data structure
-        self.window[window_index][slope_index][error_index] = error_value
-    
+        self.values[self.window_index[window_size],
+                    self.slope_index[slope_threshold],
+                    self.error_index[error_type]] = error_value
+
+    def metric(self, name):
+        '''
+        Returns a window x slope threshold matrix of an error value or of a
+        metric derived from the error values: 'summarize', 'precision',
+        'recall' or 'f1'.
+        '''
+
+        if name in self.error_index:
+            return self.values[:, :, self.error_index[name]]
+        tp = self.metric('true positives')
+        fp = self.metric('false positives')
+        fn = self.metric('false negatives')
+        if name == 'summarize':
+            return summary_index(tp, fp, fn)
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            if name == 'precision':
+                return tp / (tp + fp)
+            if name == 'recall':
+                return tp / (tp + fn)
+            if name == 'f1':
+                return 2 * tp / (2 * tp + fp + fn)
+        raise ValueError('Unknown metric: ' + str(name))
+
 class Exporter(object):
     '''
     Summarizes results and exports them to a specified format.
@@ -366,19 +3629,31 @@ class Exporter(object):
     def __init__(self, 
                  container, 
                  flags, 
-                 options):
+                 options,
+                 print_table=True):
         self.container = container
         self.export_directory = options['export_directory']
         if not self.export_directory[-1] == '/':
             self.export_directory += '/'
         self.error_values = parse_error_values(flags)
-        for error_flag in self.error_values:
-            export_path = (self.export_directory + error_flag + 
-                           '.csv').replace(' ', '_')
-            self.exportToCsv(error_flag, export_path)
-        self.stdout()
+        # Summaries come with the derived classification metrics
+        if 'summarize' in self.error_values:
+            self.error_values.extend(DERIVED_METRICS)
+        formats = (options['formats'] or 'csv').split(',')
+        if 'csv' in formats:
+            for error_flag in self.error_values:
+                export_path = (self.export_directory + error_flag + 
+                               '.csv').replace(' ', '_')
+                self.exportToCsv(error_flag, export_path)
+        if 'npz' in formats:
+            self.exportToNpz(self.export_directory + NPZ_FILE)
+        if 'parquet' in formats:
+            self.exportToParquet(self.export_directory + PARQUET_FILE)
+        if print_table:
+            self.stdout()
 
-    def summarize(self, tp, fp, fn):
+    @staticmethod
+    def summarize(tp, fp, fn):
         '''
         Summarizes ResultContainer error values to error index.
         
@@ -390,6 +3665,8 @@ class Exporter(object):
         percentage of falsely classified peaks to all existing peaks is
         subtracted from the sensitivity. Thus the result can become negative.
         
+        Arguments may be numbers or arrays of the same shape.
+        
         Arguments:
             tp: true positive count
             fp: false positive count
@@ -397,15 +3674,7 @@ class Exporter(object):
         Returns:
             error index
         '''
-        if (tp + fn == 0): 
-            sensitivity = tp / 1
-            falsepeaks_ratio =  fp / (1)  
-        else: 
-            sensitivity = tp / (tp + fn)
-            falsepeaks_ratio =  fp / (tp + fn)
-        
-        result = sensitivity - falsepeaks_ratio
-        return result
+        return summary_index(tp, fp, fn)
     
     def exportToCsv(self, errTag, export_path):
         ''' 
@@ -418,66 +3687,92 @@ class Exporter(object):
                     'false positives',
                     'false negatives'
                     'summarize'
+                    'precision'
+                    'recall'
+                    'f1'
             export_path: path where file shall be created, plus FILENAME.csv
         '''
         
-        # Get indices of error values in ResultContainer
-        tp_index = self.container.error_values.index('true positives')
-        fp_index = self.container.error_values.index('false positives')
-        fn_index = self.container.error_values.index('false negatives') 
-        
-        output_file = open(export_path, 'wb')
-        csvWriter = csv.writer(output_file)
-
-        # Copy slope threshold list so that it can be used without modifying
-        # the original.
-        header = list(self.container.slope_thresholds)  
-        # Add 'threshold' to labels
-        for i in range(len(header)):
-            header[i] = 'threshold_' + str(header[i])
-        # Append window size label to front of header list
-        header.reverse()
-        header.append('window_size')
-        header.reverse()
-        # Write header
-        csvWriter.writerow(header)
-        
-        # Loop over each window of ResultContainer
-        for window in range(len(self.container.window)):
-            # Append window size of first row
-            errList = []
-            errList.append(self.container.window_sizes[window])
-            # Loop over each threshold
-            for threshold in range(len(self.container.window[window])):
-                # If summary mode was selected, call summarize()
-                if (errTag == 'summarize'): 
-                    tp = self.container.window[window][threshold][tp_index]
-                    fp = self.container.window[window][threshold][fp_index]
-                    fn = self.container.window[window][threshold][fn_index]
-                    summary = self.summarize(tp, fp, fn)
-                    errList.append(summary)
-                # If not, append error value to error list
-                elif (errTag == 'true positives'): 
-                    errList.append(self.container.window[window][threshold][tp_index])
-                elif (errTag == 'false positives'): 
-                    errList.append(self.container.window[window][threshold][fp_index])
-                elif (errTag == 'false negatives'): 
-                    errList.append(self.container.window[window][threshold][fn_index])
-                else: raise(Exception)                
-                
-            # Write error values for window to file
-            csvWriter.writerow(errList)
-        
-        output_file.close()        
+        # Format the whole matrix at once. Counts are written as integers
+        # and combinations that were not evaluated are left empty.
+        matrix = self.container.metric(errTag)
+        if errTag in ERROR_VALUES:
+            cells = format_matrix(matrix, '%d')
+        else:
+            cells = format_matrix(matrix, '%.12g')
+        header = ['window_size'] + ['threshold_' + str(threshold) 
+                                    for threshold in 
+                                    self.container.slope_thresholds]
+        windows = numpy.array(self.container.window_sizes, dtype=str)
+        rows = numpy.column_stack([windows, cells]) if cells.size else \
+            windows[:, numpy.newaxis]
+        with open(export_path, 'w', newline='') as output_file:
+            csvWriter = csv.writer(output_file)
+            csvWriter.writerow(header)
+            csvWriter.writerows(rows.tolist())
         return
     
     
+    def exportToNpz(self, export_path):
+        '''
+        Exports the axes and all error values and metrics of the container
+        as arrays to a NumPy archive. Combinations that were not evaluated
+        are NaN.
+        '''
+
+        metrics = {}
+        for name in ERROR_VALUES + ['summarize'] + DERIVED_METRICS:
+            metrics[name.replace(' ', '_')] = self.container.metric(name)
+        numpy.savez_compressed(
+            export_path,
+            window_sizes=numpy.array(self.container.window_sizes),
+            slope_thresholds=numpy.array(self.container.slope_thresholds,
+                                         dtype=numpy.float64),
+            **metrics)
+
+    def longTable(self):
+        '''
+        Arranges the evaluated combinations of the container in long format.
+        @return columns: Dictionary of equally long arrays by column name
+        '''
+
+        windows, slopes = numpy.meshgrid(
+            numpy.array(self.container.window_sizes),
+            numpy.array(self.container.slope_thresholds, dtype=numpy.float64),
+            indexing='ij')
+        evaluated = ~numpy.isnan(self.container.metric('true positives'))
+        columns = collections.OrderedDict()
+        columns['window_size'] = windows[evaluated]
+        columns['slope_threshold'] = slopes[evaluated]
+        for name in ERROR_VALUES:
+            columns[name.replace(' ', '_')] = \
+                self.container.metric(name)[evaluated].astype(numpy.int64)
+        for name in ['summarize'] + DERIVED_METRICS:
+            columns[name] = self.container.metric(name)[evaluated]
+        return columns
+
+    def exportToParquet(self, export_path):
+        '''
+        Exports the evaluated combinations in long format to a Parquet file,
+        if PyArrow is installed.
+        '''
+
+        # PyArrow is slow to import and only needed here
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            grass.warning('Parquet export requires PyArrow, skipping ' + 
+                          export_path + '.')
+            return
+        columns = self.longTable()
+        table = pyarrow.Table.from_arrays(list(columns.values()),
+                                          names=list(columns.keys()))
+        pyarrow.parquet.write_table(table, export_path)
+
     def stdout(self):
         '''
-        Sends matrix of error values to standard out.
-        
-        Arguments
-            container: ResultContainer object which shall be exported
+        Sends matrix of summarized error values to standard out.
         '''
 
         def setField(arg, length=7):
@@ -485,39 +3780,23 @@ class Exporter(object):
             Returns a padded, left justified string with a specified length.
             '''
             
-            if(isinstance(arg, float)):
-                # Round float values
-                arg = round(arg, 2)
-                # Truncate string
-                arg = arg[:6] 
-            
-            return str(arg).ljust(length) 
+            return str(arg)[:length - 1].ljust(length) 
 
-          
         xlabel = 't h r e s h o l d'
         ylabel = 'w i n d o w'
 
-        # Get indices of error values in ResultContainer 
-        tp_index = self.container.error_values.index('true positives')
-        fp_index = self.container.error_values.index('false positives')
-        fn_index = self.container.error_values.index('false negatives') 
-
         # Start printing to standard out                        
         # Print x-label in first row
         print('Summarized error values:\n')
         print(xlabel.rjust(36))
-        # Print thresholds in second row as list with fixed spaces
-        thresholds = self.container.slope_thresholds
-        for x in range(len(thresholds)):
-            thresholds[x] = setField(thresholds[x])
-        thresholds.reverse()
-        # Add seven spaces for row of window sizes
-        thresholds.append('       ')
-        # Add three spaces for row of window label
-        thresholds.append('   ')
-        # Reverse back, positioning the space at the front
-        thresholds.reverse()
-        print(''.join(x for x in thresholds))
+        # Print thresholds in second row, after three spaces for the window
+        # label and seven for the window sizes
+        print('   ' + '       ' + ''.join(setField(threshold) for threshold in
+                                          self.container.slope_thresholds))
+        # Round and format all summaries at once. Combinations that were
+        # not evaluated are shown as '-'.
+        summaries = format_matrix(numpy.round(
+            self.container.metric('summarize'), 2), '%.2f', missing='-')
         
         # Prepare y-labels for printing. There will be one letter per row.
         ylabel = ylabel.split()
@@ -525,30 +3804,19 @@ class Exporter(object):
         ylabel.reverse()
         
         # Loop over each window of ResultContainer
-        for window in range(len(self.container.window)):
-            errList = []
+        for window in range(len(self.container.window_sizes)):
             # If ylabels is empty, append y-label letter, spaces
             if(len(ylabel) > 0):
-                errList.append(ylabel.pop().ljust(3))
+                errList = [ylabel.pop().ljust(3)]
             else:
-                errList.append('   ')    
+                errList = ['   ']
             
             # Extract window size
-            window_size = self.container.window_sizes[window]
-            errList.append(setField(str(window_size)))
-            
-            # Loop over each threshold, summarize and append to errList
-            for threshold in range(len(self.container.window[window])):
-                tp = self.container.window[window][threshold][tp_index]
-                fp = self.container.window[window][threshold][fp_index]
-                fn = self.container.window[window][threshold][fn_index]
-                summary = self.summarize(tp, fp, fn)
-                # Format summary to correct length
-                summary = setField(summary)
-                errList.append(summary)
+            errList.append(setField(self.container.window_sizes[window]))
+            errList.extend(setField(summary) for summary in summaries[window])
                                           
             # Print the summarized values for each threshold in current window
-            print(''.join(x for x in errList))
+            print(''.join(errList))
         
         # if there are still some window label letters left, print them
         while (len(ylabel) > 0): 
@@ -557,25 +3825,188 @@ class Exporter(object):
         return
     
 
-def main():
+# Analyst of a sweep() worker process
+worker_analyst = None
+# Scratch files of the elevation models shared with the worker processes,
+# by fully qualified name (see FeatureClassifier.share())
+shared_dems = {}
+
+def init_worker(options, 
+                flags, 
+                workspace, 
+                mapset_prefix, 
+                clip_peaks=False,
+                session=None,
+                shared=None):
+    '''
+    Moves a sweep() worker process into its own temporary mapset and sets
+    up its peak analyst. Workers of a standalone session use that session
+    instead. shared maps elevation models to the scratch files shared by
+    the parent.
+    '''
+
+    global worker_analyst
+    shared_dems.update(shared or {})
+    if session is not None:
+        use_session(session)
+    if flags['p']:
+        install_tracer()
+    if session is not None:
+        worker_analyst = PeakAnalyst(options, flags, clip_peaks)
+        return
+    # Each worker gets its own copy of the GRASS session file, so switching
+    # mapsets does not affect the parent or other workers.
+    gisrc = os.path.join(workspace, str(os.getpid()) + '.gisrc')
+    shutil.copy(os.environ['GISRC'], gisrc)
+    os.environ['GISRC'] = gisrc
+    grass.run_command('g.mapset',
+                      flags='c',
+                      mapset=mapset_prefix + '_' + str(os.getpid()),
+                      quiet=True)
+    worker_analyst = PeakAnalyst(options, flags, clip_peaks)
+
+def sweep_task(task):
+    '''
+    Finds and evaluates peaks for the slope thresholds of a window, given as
+    a (window, slope thresholds) task, in a sweep() worker process.
+    @return results, events, timings: The results of process_combination()
+                                      for each threshold, and the GRASS
+                                      calls traced and the seconds spent in
+                                      each stage meanwhile
+    '''
+
+    window, slope_thresholds = task
+    if worker_analyst.engine == 'numpy':
+        # Evict the window's fit once its thresholds are done
+        worker_analyst.get_fits().expect(window, slope_thresholds)
+    results = [worker_analyst.process_combination(window, slope_threshold)
+               for slope_threshold in slope_thresholds]
+    # Traced GRASS calls and stage timings are sent back to the parent with
+    # the results
+    events = grass.drain() if isinstance(grass, GrassTracer) else None
+    timings = dict(worker_analyst.timings)
+    worker_analyst.timings.clear()
+    return results, events, timings
+
+def batch_task(task):
+    '''
+    Finds and evaluates peaks for an (elevation model, window, slope
+    thresholds) task of a BatchAnalyst in a sweep() worker process.
+    '''
+
+    global worker_analyst
+    dem, window, slope_thresholds = task
+    # Tasks come sorted by elevation model, so workers seldom switch
+    if worker_analyst.dem != dem:
+        worker_options = dict(worker_analyst.options)
+        worker_options['dem'] = dem
+        worker_analyst = PeakAnalyst(worker_options,
+                                     worker_analyst.flags,
+                                     worker_analyst.clip_peaks)
+    results, events, timings = sweep_task((window, slope_thresholds))
+    return [(dem,) + result for result in results], events, timings
+
+def analyze(options, flags):
+    '''
+    Tunes the parameters on a single elevation map and exports the results.
+    @return peak_analyzer: The PeakAnalyst
+    '''
+
     # Initialize peak analyzer object
     peak_analyzer = PeakAnalyst(options, flags)
+    # Write every combination to file as soon as it is done
+    peak_analyzer.stream = ResultStream(
+        os.path.join(options['export_directory'], STREAM_FILE))
     
-    # Find peaks using different windows
-    print('Finding peaks')
-    peak_analyzer.find_peaks()
-    
-    # Extract error values and write them to data container
-    print('Extracting error values...')
-    for error_value in peak_analyzer.error_values:
-        peak_analyzer.evaluate_peaks(error_value)
+    # Find peaks using different windows, extract error values and write 
+    # them to data container
+    print('Finding peaks and extracting error values...')
+    try:
+        if peak_analyzer.search_mode == 'refine':
+            window, slope_threshold, summary = peak_analyzer.search()
+            print('Best parameters: window ' + str(window) + 
+                  ', slope threshold ' + str(slope_threshold) +
+                  ', summary ' + str(round(summary, 4)))
+        else:
+            peak_analyzer.sweep()
+    finally:
+        peak_analyzer.stream.close()
     
     # Output error values
     print('Writing results to file...')
     output_writer = Exporter(peak_analyzer.results, 
                              flags, 
                              options)
+    if flags['r'] and peak_analyzer.pyramid_window > 0:
+        report_pyramid(peak_analyzer, options['export_directory'])
+    return peak_analyzer
+
+def report_pyramid(peak_analyzer, export_directory):
+    '''
+    Prints how the summary index of pyramid windows differs from full
+    resolution and writes the comparison to the export directory.
+    '''
+
+    print('Comparing pyramid windows with full resolution...')
+    rows = peak_analyzer.pyramid_report()
+
+    def seconds(value):
+        return '' if value is None else '%.3f' % value
+
+    with open(os.path.join(export_directory, PYRAMID_FILE), 'w', 
+              newline='') as output_file:
+        csvWriter = csv.writer(output_file)
+        csvWriter.writerow(['window_size', 'slope_threshold', 
+                            'pyramid_summarize', 'full_summarize', 
+                            'difference', 'pyramid_seconds', 'full_seconds'])
+        for window, slope_threshold, pyramid, full, fast, slow in rows:
+            csvWriter.writerow([window, slope_threshold, 
+                                '%.12g' % pyramid, '%.12g' % full,
+                                '%.12g' % (pyramid - full),
+                                seconds(fast), seconds(slow)])
+    print('window'.ljust(8) + 'slope'.rjust(8) + 'pyramid'.rjust(10) + 
+          'full'.rjust(10) + 'diff'.rjust(10))
+    for window, slope_threshold, pyramid, full, fast, slow in rows:
+        print(str(window).ljust(8) + str(slope_threshold).rjust(8) + 
+              ('%.3f' % pyramid).rjust(10) + ('%.3f' % full).rjust(10) + 
+              ('%+.3f' % (pyramid - full)).rjust(10))
+    fast = sum(row[4] or 0.0 for row in rows)
+    slow = sum(row[5] or 0.0 for row in rows)
+    print('Pyramid windows took ' + ('%.1f' % fast) + ' s, ' + 
+          ('%.1f' % slow) + ' s at full resolution')
+
+def main(options, flags):
+    if flags['p']:
+        tracer = install_tracer()
+    dems = parse_dems(options)
+    if len(dems) > 1:
+        # Tune the parameters on all elevation maps together
+        peak_analyzer = BatchAnalyst(dems, options, flags)
+        print('Finding peaks and extracting error values of ' + 
+              str(len(dems)) + ' elevation maps...')
+        peak_analyzer.sweep()
+        print('Writing results to file...')
+        peak_analyzer.export()
+    else:
+        options['dem'] = dems[0]
+        peak_analyzer = analyze(options, flags)
+
+    if flags['p']:
+        trace_path = os.path.join(options['export_directory'], TRACE_FILE)
+        tracer.write(trace_path)
+        print('GRASS module calls (trace written to ' + trace_path + '):')
+        print('module'.ljust(16) + 'calls'.rjust(8) + 'total s'.rjust(12) + 
+              'mean s'.rjust(12) + 'max s'.rjust(12))
+        for module, calls, total, longest in tracer.summary():
+            print(module.ljust(16) + str(calls).rjust(8) + 
+                  ('%.3f' % total).rjust(12) + 
+                  ('%.3f' % (total / calls)).rjust(12) + 
+                  ('%.3f' % longest).rjust(12))
+        print('Processing stages:')
+        for name in sorted(peak_analyzer.timings):
+            print(name.ljust(16) + 
+                  ('%.3f' % peak_analyzer.timings[name]).rjust(12))
 
 if __name__ == '__main__':
     options, flags = grass.parser()
-    main()
+    main(options, flags)
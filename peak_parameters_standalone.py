@@ -0,0 +1,621 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Runs peak_parameters.py on files, without a GRASS session.
+
+The elevation models are read directly from raster files and the training
+peaks from a CSV file of coordinates. The sweep runs with the NumPy engine
+and raster validation, which need nothing from GRASS but rasters and points;
+grass.script is never imported.
+
+Options and flags are given as for the GRASS module, except that dem and
+dem_pattern name raster files and peaks names a CSV file:
+
+    python peak_parameters_standalone.py dem=dem.asc peaks=peaks.csv \\
+        export_directory=results window_sizes=3,5,9 slope_thresholds=1-5:1 -s
+
+Elevation models can be
+
+- ESRI ASCII grids (.asc),
+- raw binary files with an ESRI header next to them (name.hdr for name.bil,
+  name.flt and so on), which are memory-mapped, so only the rows of the
+  current region or tile are ever read,
+- GeoTIFF files (.tif, .tiff), if GDAL's Python bindings are installed.
+
+The peaks file has a column of x and one of y coordinates, named by the
+x_column and y_column options (default x and y). Without a header line, the
+first two columns are used.
+'''
+
+import io
+import os
+import re
+import csv
+import sys
+import glob
+import tempfile as _tempfile
+
+import numpy
+
+import peak_parameters
+
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                      'peak_parameters.py')
+# Options of the standalone entry point that the GRASS module doesn't have
+STANDALONE_OPTIONS = {'x_column': 'x', 'y_column': 'y'}
+# Options that select the in-process path
+IN_PROCESS_OPTIONS = {'engine': 'numpy', 'validation': 'raster'}
+# Flags that need GRASS modules
+GRASS_FLAGS = 'lc'
+
+class RasterFile(object):
+    '''
+    A single band raster file read into NumPy arrays block by block. Null
+    cells are read as NaN.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.nodata = None
+        self.data = None
+        extension = os.path.splitext(path)[1].lower()
+        if not os.path.isfile(path):
+            fatal('Raster file ' + path + ' does not exist.')
+        if extension == '.asc':
+            self.open_ascii()
+        elif extension in ('.tif', '.tiff'):
+            self.open_geotiff()
+        else:
+            self.open_raw()
+
+    def open_ascii(self):
+        '''
+        Reads an ESRI ASCII grid. Its text has to be parsed anyway, so the
+        whole grid is kept in memory.
+        '''
+
+        header = {}
+        with open(self.path) as grid:
+            for line in grid:
+                fields = line.split()
+                if not fields or not re.match(r'[a-zA-Z]', fields[0]):
+                    break
+                header[fields[0].lower()] = float(fields[1])
+        self.set_extent(header)
+        self.nodata = header.get('nodata_value')
+        self.data = numpy.loadtxt(self.path,
+                                  skiprows=len(header),
+                                  dtype=numpy.float64,
+                                  ndmin=2)
+        if self.data.shape != (self.rows, self.cols):
+            fatal(self.path + ' does not have ' + str(self.rows) + ' rows ' +
+                  'of ' + str(self.cols) + ' cells.')
+
+    def open_raw(self):
+        '''
+        Memory-maps a raw binary raster described by an ESRI header. Both
+        BIL headers (nrows, ulxmap, xdim...) and float grid headers (nrows,
+        xllcorner, cellsize...) are understood.
+        '''
+
+        base = os.path.splitext(self.path)[0]
+        header_path = [path for path in (base + '.hdr', self.path + '.hdr')
+                       if os.path.isfile(path)]
+        if not header_path:
+            fatal('Found no header ' + base + '.hdr for ' + self.path + '.')
+        header = {}
+        with open(header_path[0]) as hdr:
+            for line in hdr:
+                fields = line.split()
+                if len(fields) >= 2:
+                    header[fields[0].lower()] = fields[1]
+        if int(header.get('nbands', 1)) != 1:
+            fatal(self.path + ' has more than one band.')
+        # Byte order: I or LSBFIRST for little endian, M or MSBFIRST for big
+        order = header.get('byteorder', 'I').upper()
+        byteorder = '>' if order in ('M', 'MSBFIRST') else '<'
+        if 'ulxmap' in header:
+            # BIL header: coordinates of the center of the upper left cell
+            rows = int(header['nrows'])
+            xdim = float(header.get('xdim', 1))
+            ydim = float(header.get('ydim', 1))
+            self.set_extent({'nrows': rows,
+                             'ncols': float(header['ncols']),
+                             'xllcorner': float(header['ulxmap']) - xdim / 2,
+                             'yllcorner': float(header['ulymap']) + ydim / 2 -
+                                          rows * ydim,
+                             'dx': xdim,
+                             'dy': ydim})
+            bits = int(header.get('nbits', 8))
+            pixeltype = header.get('pixeltype', 'UNSIGNEDINT').upper()
+            kind = {'FLOAT': 'f', 'SIGNEDINT': 'i'}.get(pixeltype, 'u')
+            dtype = numpy.dtype(byteorder + kind + str(bits // 8))
+        else:
+            # Float grid header, as written next to .flt files
+            self.set_extent(dict((key, float(value))
+                                 for key, value in header.items()
+                                 if key != 'byteorder'))
+            dtype = numpy.dtype(byteorder + 'f4')
+        if 'nodata' in header:
+            self.nodata = float(header['nodata'])
+        if 'nodata_value' in header:
+            self.nodata = float(header['nodata_value'])
+        self.data = numpy.memmap(self.path,
+                                 dtype=dtype,
+                                 mode='r',
+                                 offset=int(header.get('skipbytes', 0)),
+                                 shape=(self.rows, self.cols))
+
+    def open_geotiff(self):
+        '''
+        Opens a GeoTIFF file with GDAL, which reads blocks of it on demand.
+        '''
+
+        try:
+            from osgeo import gdal
+        except ImportError:
+            fatal('Reading GeoTIFF files needs the Python bindings of GDAL. ' +
+                  'Convert ' + self.path + ' to an ESRI ASCII grid or a ' +
+                  'raw file with a header, or install GDAL.')
+        self.dataset = gdal.Open(self.path)
+        if self.dataset is None:
+            fatal('Could not open ' + self.path + '.')
+        west, ewres, _, north, _, nsres = self.dataset.GetGeoTransform()
+        self.rows = self.dataset.RasterYSize
+        self.cols = self.dataset.RasterXSize
+        self.set_extent({'nrows': self.rows,
+                         'ncols': self.cols,
+                         'xllcorner': west,
+                         'yllcorner': north + self.rows * nsres,
+                         'dx': ewres,
+                         'dy': -nsres})
+        self.nodata = self.dataset.GetRasterBand(1).GetNoDataValue()
+
+    def set_extent(self, header):
+        '''
+        Sets the extent of the raster from the keys of an ESRI ASCII header.
+        Cell center coordinates (xllcenter, yllcenter) are converted to
+        corner coordinates.
+        '''
+
+        try:
+            self.rows = int(header['nrows'])
+            self.cols = int(header['ncols'])
+            self.ewres = header.get('dx', header.get('cellsize'))
+            self.nsres = header.get('dy', header.get('cellsize'))
+            if 'xllcenter' in header:
+                west = header['xllcenter'] - self.ewres / 2
+                south = header['yllcenter'] - self.nsres / 2
+            else:
+                west = header['xllcorner']
+                south = header['yllcorner']
+        except (KeyError, TypeError):
+            fatal('Could not read the extent of ' + self.path + '.')
+        self.west = west
+        self.north = south + self.rows * self.nsres
+
+    def region(self):
+        '''
+        Returns the extent of the raster as a GRASS region.
+        '''
+
+        return {'n': self.north,
+                's': self.north - self.rows * self.nsres,
+                'w': self.west,
+                'e': self.west + self.cols * self.ewres,
+                'nsres': self.nsres,
+                'ewres': self.ewres,
+                'rows': self.rows,
+                'cols': self.cols}
+
+    def read(self, row0, row1, col0, col1):
+        '''
+        Reads a block of the raster.
+        @return block: 2D float64 array, null cells as NaN
+        '''
+
+        if self.data is None:
+            band = self.dataset.GetRasterBand(1)
+            block = band.ReadAsArray(col0, row0, col1 - col0, row1 - row0)
+        else:
+            block = self.data[row0:row1, col0:col1]
+        block = numpy.array(block, dtype=numpy.float64)
+        if self.nodata is not None:
+            block[block == self.nodata] = numpy.nan
+        return block
+
+    def __getstate__(self):
+        # Worker processes open the file again instead of copying the data
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'])
+
+class RasterArray(numpy.ndarray):
+    '''
+    Stand-in for grass.script.array.array: a NumPy array of the current
+    region of a Session.
+    '''
+
+    def read(self, mapname, null=None):
+        # As r.out.bin, which grass.script.array reads through, null cells
+        # are read as 0 by default
+        data = self.session.read_raster(mapname)
+        data[numpy.isnan(data)] = 0 if null is None else float(null)
+        self[...] = data
+        return 0
+
+    def write(self, mapname, title=None, null=None, overwrite=None):
+        self.session.write_raster(mapname, numpy.array(self))
+        return 0
+
+class RasterArrays(object):
+    '''
+    Stand-in for the grass.script.array module of a Session.
+    '''
+
+    def __init__(self, session):
+        self.session = session
+
+    def array(self, dtype=numpy.double):
+        region = self.session.region()
+        array = numpy.zeros((region['rows'], region['cols']),
+                            dtype=dtype).view(RasterArray)
+        array.session = self.session
+        return array
+
+class FinishedProcess(object):
+    '''
+    A finished process whose output can be read from stdout.
+    '''
+
+    def __init__(self, output):
+        self.stdout = output
+
+    def wait(self):
+        return 0
+
+class Session(object):
+    '''
+    Provides the functions of grass.script that peak_parameters.py uses with
+    the NumPy engine and raster validation, without a GRASS session.
+
+    Subclasses provide the region and the maps by defining three methods:
+
+    - extent(): returns the region as a dictionary like grass.region(),
+      without the selected block,
+    - read_block(name, row0, row1, col0, col1): reads a block of rows and
+      columns of the region from a raster, as a new 2D array with null
+      cells as NaN,
+    - read_points(name): reads the coordinates of a map of points, as a
+      list of (x, y) tuples.
+
+    A block of the region can be selected in a temporary region with
+    g.region n=... s=... w=... e=..., as done for tiles. Any other GRASS
+    module is a fatal error.
+    '''
+
+    standalone = True
+
+    def __init__(self):
+        self.block = None
+        self.temporary_region = False
+        self.array = RasterArrays(self)
+
+    def select_raster(self, name):
+        '''
+        Sets the region to a raster, as g.region raster=name.
+        '''
+
+        pass
+
+    def write_raster(self, name, data):
+        self.fatal('Writing raster maps needs a GRASS session.')
+
+    def remove_rasters(self, names):
+        pass
+
+    def read_raster(self, name):
+        '''
+        Reads the current region, or the selected block of it, from a
+        raster.
+        '''
+
+        extent = self.extent()
+        row0, row1, col0, col1 = self.block or (0, extent['rows'],
+                                                0, extent['cols'])
+        return self.read_block(name, row0, row1, col0, col1)
+
+    def region(self, **kwargs):
+        region = self.extent()
+        if self.block is None:
+            return region
+        row0, row1, col0, col1 = self.block
+        region.update({'n': region['n'] - row0 * region['nsres'],
+                       's': region['n'] - row1 * region['nsres'],
+                       'w': region['w'] + col0 * region['ewres'],
+                       'e': region['w'] + col1 * region['ewres'],
+                       'rows': row1 - row0,
+                       'cols': col1 - col0})
+        return region
+
+    def run_command(self, module, **kwargs):
+        if module == 'g.region' and 'raster' in kwargs:
+            self.select_raster(kwargs['raster'])
+            self.block = None
+            return 0
+        if module == 'g.region' and 'n' in kwargs:
+            if not self.temporary_region:
+                self.fatal('Blocks can only be selected in a temporary ' + 
+                           'region.')
+            region = self.extent()
+            self.block = (
+                int(round((region['n'] - kwargs['n']) / region['nsres'])),
+                int(round((region['n'] - kwargs['s']) / region['nsres'])),
+                int(round((kwargs['w'] - region['w']) / region['ewres'])),
+                int(round((kwargs['e'] - region['w']) / region['ewres'])))
+            return 0
+        if module == 'g.remove':
+            if kwargs.get('type') == 'raster':
+                self.remove_rasters(kwargs['name'].split(','))
+            return 0
+        self.fatal(module + ' needs a GRASS session.')
+
+    def read_command(self, module, **kwargs):
+        if module == 'v.out.ascii':
+            return ''.join(repr(x) + '|' + repr(y) + '|' + str(cat + 1) + '\n'
+                           for cat, (x, y) in
+                           enumerate(self.read_points(kwargs['input'])))
+        self.fatal(module + ' needs a GRASS session.')
+
+    def pipe_command(self, module, **kwargs):
+        if module == 'r.out.bin':
+            # Buffer one row band at a time, like the output of a process
+            output = io.BytesIO()
+            region = self.region()
+            row0, row1, col0, col1 = self.block or (0, region['rows'],
+                                                    0, region['cols'])
+            for row in range(row0, row1, 1024):
+                block = self.read_block(kwargs['input'],
+                                        row,
+                                        min(row + 1024, row1),
+                                        col0,
+                                        col1)
+                output.write(numpy.ascontiguousarray(block).tobytes())
+            output.seek(0)
+            return FinishedProcess(output)
+        self.fatal(module + ' needs a GRASS session.')
+
+    def find_file(self, name, element=None):
+        return {'name': name, 'fullname': name, 'file': name}
+
+    def gisenv(self):
+        # No location has worker mapsets to clean up
+        return {'GISDBASE': _tempfile.gettempdir(),
+                'LOCATION_NAME': 'peak_parameters_standalone',
+                'MAPSET': 'standalone'}
+
+    def tempfile(self, create=True):
+        handle, path = _tempfile.mkstemp()
+        os.close(handle)
+        return path
+
+    def use_temp_region(self):
+        self.temporary_region = True
+
+    def del_temp_region(self):
+        self.temporary_region = False
+        self.block = None
+
+    def message(self, msg, flag=None):
+        message(msg)
+
+    def warning(self, msg):
+        message('WARNING: ' + msg)
+
+    def fatal(self, msg):
+        fatal(msg)
+
+class FileSession(Session):
+    '''
+    A Session on raster files and a CSV file of peaks. Rasters and vector
+    maps are named by their paths, and the region is the extent of the
+    raster last selected with g.region raster=....
+    '''
+
+    def __init__(self, x_column='x', y_column='y'):
+        Session.__init__(self)
+        self.x_column = x_column
+        self.y_column = y_column
+        self.rasters = {}
+        self.points = {}
+        self.current = None
+
+    def raster(self, name):
+        '''
+        Returns the opened raster file called name.
+        '''
+
+        path = os.path.abspath(name)
+        if path not in self.rasters:
+            self.rasters[path] = RasterFile(path)
+        return self.rasters[path]
+
+    def select_raster(self, name):
+        self.current = self.raster(name)
+
+    def extent(self):
+        if self.current is None:
+            fatal('No region is set.')
+        return self.current.region()
+
+    def read_block(self, name, row0, row1, col0, col1):
+        '''
+        Reads a block of a raster, which has to have the extent and
+        resolution of the raster that set the region.
+        '''
+
+        raster = self.raster(name)
+        if raster.region() != self.extent():
+            fatal(name + ' does not cover the region of ' +
+                  self.current.path + '.')
+        return raster.read(row0, row1, col0, col1)
+
+    def read_points(self, name):
+        '''
+        Reads the coordinates of the peaks file called name.
+        @return points: A list of (x, y) tuples
+        '''
+
+        path = os.path.abspath(name)
+        if path in self.points:
+            return self.points[path]
+        if not os.path.isfile(path):
+            fatal('Peaks file ' + name + ' does not exist.')
+        with open(path) as peaks:
+            sample = peaks.read(4096)
+            peaks.seek(0)
+            try:
+                dialect = csv.Sniffer().sniff(sample, delimiters=',;\t| ')
+            except csv.Error:
+                dialect = csv.excel
+            rows = [row for row in csv.reader(peaks, dialect) if row]
+        if not rows:
+            fatal('Peaks file ' + name + ' is empty.')
+        columns = 0, 1
+        try:
+            float(rows[0][0])
+        except ValueError:
+            header = [column.strip().lower() for column in rows.pop(0)]
+            try:
+                columns = (header.index(self.x_column.lower()),
+                           header.index(self.y_column.lower()))
+            except ValueError:
+                fatal('Peaks file ' + name + ' has no columns ' +
+                      self.x_column + ' and ' + self.y_column + '.')
+        points = []
+        for row in rows:
+            try:
+                points.append((float(row[columns[0]]),
+                               float(row[columns[1]])))
+            except (ValueError, IndexError):
+                fatal('Could not read the coordinates of ' + ','.join(row) +
+                      ' in ' + name + '.')
+        self.points[path] = points
+        return points
+
+    def list_strings(self, type, pattern=None, **kwargs):
+        return sorted(glob.glob(pattern))
+
+    def find_file(self, name, element=None):
+        path = os.path.abspath(name)
+        if not os.path.isfile(path):
+            return {'name': '', 'fullname': '', 'file': ''}
+        return {'name': name, 'fullname': path, 'file': path}
+
+    def __getstate__(self):
+        # Worker processes open the files again
+        state = dict(self.__dict__)
+        state.update({'rasters': {}, 'current': None, 'block': None})
+        return state
+
+def message(msg):
+    sys.stderr.write(msg + '\n')
+
+def fatal(msg):
+    message('ERROR: ' + msg)
+    sys.exit(1)
+
+def interface():
+    '''
+    Reads the options and flags of the GRASS header of peak_parameters.py.
+    @return options, flags: Dictionaries of the options and flags, mapping
+                            their keys to dictionaries of their settings
+                            (description, answer, options...)
+    '''
+
+    with open(SCRIPT) as script:
+        header = script.read()
+    options = {}
+    flags = {}
+    for kind, block in re.findall(r'#%(Option|Flag)\n(.*?)#%End', header, re.S):
+        settings = dict(re.findall(r'#% (\w+): (.*)', block))
+        settings = dict((key, value.strip()) for key, value in settings.items())
+        if kind == 'Option':
+            options[settings['key']] = settings
+        else:
+            flags[settings['key']] = settings
+    return options, flags
+
+def usage(interface_options, interface_flags):
+    '''
+    Prints the options and flags of the standalone entry point.
+    '''
+
+    print(__doc__.strip() + '\n')
+    print('Flags:')
+    for key in sorted(interface_flags):
+        if key not in GRASS_FLAGS:
+            print('  -' + key + '  ' + interface_flags[key]['description'])
+    print('\nOptions:')
+    for key in sorted(list(interface_options) + list(STANDALONE_OPTIONS)):
+        if key in STANDALONE_OPTIONS:
+            description = 'Column of the ' + key[0] + ' coordinates of peaks'
+            answer = STANDALONE_OPTIONS[key]
+        else:
+            description = interface_options[key].get('description', '')
+            answer = IN_PROCESS_OPTIONS.get(
+                key, interface_options[key].get('answer', ''))
+        print('  ' + key.ljust(20) + description +
+              (' (default: ' + answer + ')' if answer else ''))
+
+def parse(arguments):
+    '''
+    Parses command line arguments given as for the GRASS module:
+    key=value options and -abc flags.
+    @return options, flags: dictionaries as returned by grass.parser()
+    '''
+
+    interface_options, interface_flags = interface()
+    if not arguments or set(arguments) & set(['-h', '--help', 'help']):
+        usage(interface_options, interface_flags)
+        sys.exit(0)
+    options = dict((key, settings.get('answer', ''))
+                   for key, settings in interface_options.items())
+    options.update(STANDALONE_OPTIONS)
+    # The standalone entry point always runs in process
+    options.update(IN_PROCESS_OPTIONS)
+    flags = dict((key, False) for key in interface_flags)
+    for argument in arguments:
+        if argument.startswith('-'):
+            for key in argument.lstrip('-'):
+                if key not in flags:
+                    fatal('Unknown flag -' + key + '.')
+                if key in GRASS_FLAGS:
+                    fatal('Flag -' + key + ' needs a GRASS session.')
+                flags[key] = True
+            continue
+        key, separator, value = argument.partition('=')
+        if not separator or key not in options:
+            fatal('Unknown option ' + argument + '.')
+        choices = interface_options.get(key, {}).get('options')
+        if choices and set(value.split(',')) - set(choices.split(',')):
+            fatal('Option ' + key + ' must be one of ' + choices + '.')
+        if key in IN_PROCESS_OPTIONS and value != IN_PROCESS_OPTIONS[key]:
+            fatal(key + '=' + value + ' needs a GRASS session.')
+        options[key] = value
+    for key, settings in interface_options.items():
+        if settings.get('required') == 'yes' and not options[key]:
+            fatal('Option ' + key + ' is required.')
+    if not options['dem'] and not options['dem_pattern']:
+        fatal('Option dem or dem_pattern is required.')
+    return options, flags
+
+def main(arguments):
+    options, flags = parse(arguments)
+    peak_parameters.use_session(FileSession(options.pop('x_column'),
+                                            options.pop('y_column')))
+    peak_parameters.main(options, flags)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,145 @@
+'''
+Fixtures for the tests of peak_parameters.py.
+
+GRASS is replaced by the in-memory stand-in of the benchmarks
+(benchmarks/standin), so no GRASS session is needed. The stand-in covers the
+NumPy engine with raster validation, which is what the tests exercise.
+'''
+
+import os
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+REPOSITORY = os.path.dirname(HERE)
+sys.path[:0] = [REPOSITORY,
+                os.path.join(REPOSITORY, 'benchmarks'),
+                os.path.join(REPOSITORY, 'benchmarks', 'standin')]
+
+import numpy
+import pytest
+from grass import script as grass
+
+import peak_parameters
+from bench_peak_parameters import default_options
+
+# Rows and columns of the synthetic terrain
+SIZE = 120
+# Cell size of the synthetic terrain in map units
+RESOLUTION = 10.0
+
+def hills(size, peaks, seed, noise=0.01):
+    '''
+    Generates a square elevation model of Gaussian hills on a plain with a
+    little noise. Unlike the benchmark terrain, the hills are gentle enough
+    for most of their tops to be classified as peaks, while the noise adds
+    false positives for small windows.
+    @return dem, coordinates: The elevations and the (x, y) map coordinates
+                              of the hill tops
+    '''
+
+    random = numpy.random.RandomState(seed)
+    y, x = numpy.mgrid[0:size, 0:size] + 0.5
+    dem = 500 + random.normal(0.0, noise, (size, size))
+    rows = random.uniform(10, size - 10, peaks)
+    cols = random.uniform(10, size - 10, peaks)
+    heights = random.uniform(20, 60, peaks)
+    sigmas = random.uniform(6, 12, peaks)
+    for row, col, height, sigma in zip(rows, cols, heights, sigmas):
+        dem += height * numpy.exp(-((y - row) ** 2 + (x - col) ** 2) /
+                                  (2 * sigma ** 2))
+    coordinates = list(zip((cols * RESOLUTION).tolist(),
+                           ((size - rows) * RESOLUTION).tolist()))
+    return dem, coordinates
+
+@pytest.fixture
+def terrain():
+    '''
+    Loads the synthetic terrain into the stand-in session as the raster map
+    dem and the vector map peaks.
+    @return dem, coordinates: as returned by hills()
+    '''
+
+    dem, coordinates = hills(SIZE, 10, 3)
+    grass.rasters.clear()
+    grass.points.clear()
+    del grass.calls[:]
+    grass.set_region(SIZE, SIZE, RESOLUTION)
+    grass.add_raster('dem', dem)
+    grass.add_points('peaks', coordinates)
+    return dem, coordinates
+
+@pytest.fixture
+def training(terrain):
+    '''
+    Returns a function making the TrainingPeaks of the terrain for a match
+    radius.
+    '''
+
+    x, y = zip(*terrain[1])
+
+    def make(match_radius=0):
+        return peak_parameters.TrainingPeaks(x,
+                                             y,
+                                             grass.region(),
+                                             match_radius)
+    return make
+
+@pytest.fixture
+def files(terrain, tmp_path):
+    '''
+    Writes the terrain to an ESRI ASCII grid and its training peaks to a CSV
+    file, for runs without a GRASS session.
+    @return dem, peaks: Paths of the files
+    '''
+
+    dem = str(tmp_path / 'dem.asc')
+    header = ('ncols %d\nnrows %d\nxllcorner 0\nyllcorner 0\n'
+              'cellsize %r\nNODATA_value -9999' % (SIZE, SIZE, RESOLUTION))
+    numpy.savetxt(dem,
+                  numpy.where(numpy.isnan(terrain[0]), -9999, terrain[0]),
+                  fmt='%.6f',
+                  header=header,
+                  comments='')
+    peaks = str(tmp_path / 'peaks.csv')
+    with open(peaks, 'w') as stream:
+        stream.write('x,y\n')
+        for x, y in terrain[1]:
+            stream.write('%r,%r\n' % (x, y))
+    return dem, peaks
+
+@pytest.fixture
+def analyst(terrain, tmp_path):
+    '''
+    Returns a function making a PeakAnalyst of the terrain. Keyword
+    arguments override the default options, and flags is a string of the
+    flags to set besides -tfns.
+    '''
+
+    def make(flags='', **overrides):
+        options, switches = default_options()
+        options.update(dem='dem',
+                       peaks='peaks',
+                       engine='numpy',
+                       validation='raster',
+                       window_sizes='3,5,9',
+                       slope_thresholds='0.5,2,5',
+                       cache_directory='',
+                       export_directory=str(tmp_path))
+        options.update(overrides)
+        for flag in 'tfns' + flags:
+            switches[flag] = True
+        return peak_parameters.PeakAnalyst(options, switches)
+    return make
+
+@pytest.fixture
+def sweep(analyst):
+    '''
+    Returns a function that sweeps the terrain with a PeakAnalyst made by
+    analyst() and returns its matrix of error values.
+    '''
+
+    def run(flags='', **overrides):
+        peak_analyst = analyst(flags, **overrides)
+        peak_analyst.sweep()
+        return peak_analyst.results.values
+    return run
@@ -0,0 +1,90 @@
+'''
+Tests of the result cache: cached combinations are not computed again, as
+long as the inputs and settings they were computed with stay the same.
+'''
+
+import itertools
+
+import numpy
+import pytest
+from grass import script as grass
+
+import peak_parameters
+from peak_parameters import ResultCache
+
+def errors(count):
+    return {'true positives': count,
+            'false positives': 2 * count,
+            'false negatives': 3 * count}
+
+def test_get_and_put(tmp_path):
+    cache = ResultCache(str(tmp_path), 'a')
+    assert cache.get(3, 0.5) is None
+    cache.put(3, 0.5, errors(1))
+    cache.put(3, 0.5, errors(2))
+    assert cache.get(3, 0.5) == errors(2)
+    # Entries of other data sets are kept apart and survive invalidation
+    other = ResultCache(str(tmp_path), 'b')
+    assert other.get(3, 0.5) is None
+    other.put(3, 0.5, errors(4))
+    cache.invalidate()
+    assert cache.get(3, 0.5) is None
+    assert other.get(3, 0.5) == errors(4)
+
+def test_least_recently_used_are_evicted(tmp_path, monkeypatch):
+    # A clock that never returns the same time twice
+    monkeypatch.setattr(peak_parameters.time,
+                        'time',
+                        itertools.count().__next__)
+    cache = ResultCache(str(tmp_path), 'a', max_entries=3)
+    for count in range(3):
+        cache.put(3, count, errors(count))
+    # Using the oldest entry makes the second one the least recently used
+    assert cache.get(3, 0) == errors(0)
+    cache.put(3, 3, errors(3))
+    assert cache.get(3, 1) is None
+    for count in [0, 2, 3]:
+        assert cache.get(3, count) == errors(count)
+
+@pytest.fixture
+def computed(monkeypatch):
+    '''
+    Records the combinations that PeakAnalyst computes.
+    '''
+
+    combinations = []
+    process_combination = peak_parameters.PeakAnalyst.process_combination
+
+    def record(analyst, window, slope_threshold):
+        combinations.append((window, slope_threshold))
+        return process_combination(analyst, window, slope_threshold)
+    monkeypatch.setattr(peak_parameters.PeakAnalyst,
+                        'process_combination',
+                        record)
+    return combinations
+
+def test_cached_sweep(terrain, sweep, computed, tmp_path):
+    directory = str(tmp_path / 'cache')
+    first = sweep(cache_directory=directory)
+    assert len(computed) == 9
+    del computed[:]
+    # Only new slope thresholds are computed
+    extended = sweep(cache_directory=directory,
+                     slope_thresholds='0.5,2,5,7')
+    numpy.testing.assert_array_equal(extended[:, :3], first)
+    assert sorted(computed) == [(3, 7), (5, 7), (9, 7)]
+    del computed[:]
+    numpy.testing.assert_array_equal(sweep(cache_directory=directory), first)
+    assert computed == []
+    # -x computes everything again
+    sweep('x', cache_directory=directory)
+    assert len(computed) == 9
+    del computed[:]
+    # Other settings or training peaks are other data sets
+    sweep(cache_directory=directory, connectivity='4')
+    assert len(computed) == 9
+    del computed[:]
+    grass.add_points('peaks', terrain[1][:5])
+    fewer = sweep(cache_directory=directory)
+    assert len(computed) == 9
+    assert numpy.nansum(fewer[:, :, 2]) < numpy.nansum(first[:, :, 2])
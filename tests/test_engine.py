@@ -0,0 +1,44 @@
+'''
+Tests of the in-process NumPy engine as driven by PeakAnalyst.
+'''
+
+import numpy
+import pytest
+from grass import script as grass
+
+from peak_parameters import FeatureClassifier, sweep_slope_thresholds
+
+@pytest.fixture
+def nodata(terrain):
+    '''
+    Replaces the elevation model with one whose left edge and a block in the
+    middle are null.
+    @return dem: The elevations, null cells as NaN
+    '''
+
+    dem = terrain[0].copy()
+    dem[:, :10] = numpy.nan
+    dem[50:60, 50:60] = numpy.nan
+    grass.add_raster('dem', dem)
+    return dem
+
+def test_null_cells_are_nan(nodata, analyst):
+    numpy.testing.assert_array_equal(numpy.isnan(analyst().read_dem()),
+                                     numpy.isnan(nodata))
+
+@pytest.mark.parametrize('tile_size', ['', '32'])
+def test_null_cells_stay_unclassified(nodata, analyst, training, tile_size):
+    peak_analyst = analyst(tile_size=tile_size)
+    peak_analyst.sweep()
+    classifier = FeatureClassifier(nodata, grass.region()['ewres'])
+    results = peak_analyst.results
+    for window in results.window_sizes:
+        errors = sweep_slope_thresholds(classifier.fit(window),
+                                        results.slope_thresholds,
+                                        training())
+        for slope_threshold, expected in errors.items():
+            for error_value, count in expected.items():
+                assert results.values[
+                    results.window_index[window],
+                    results.slope_index[slope_threshold],
+                    results.error_index[error_value]] == count
@@ -0,0 +1,89 @@
+'''
+Tests of the long-format result stream and of the NumPy export.
+'''
+
+import csv
+
+import numpy
+import pytest
+
+from peak_parameters import (DERIVED_METRICS, ERROR_VALUES, NPZ_FILE,
+                             STREAM_FILE, Exporter, ResultsContainer,
+                             ResultStream, summary_index)
+
+def test_npz(tmp_path):
+    container = ResultsContainer([3, 5, 9], [0.5, 2.0], ERROR_VALUES)
+    for error_value, count in zip(ERROR_VALUES, (4, 2, 1)):
+        container.add_error(5, 2.0, error_value, count)
+    Exporter(container,
+             {'t': True},
+             {'export_directory': str(tmp_path), 'formats': 'npz'},
+             print_table=False)
+    assert not list(tmp_path.glob('*.csv'))
+    with numpy.load(str(tmp_path / NPZ_FILE)) as archive:
+        assert sorted(archive.files) == sorted(
+            ['window_sizes', 'slope_thresholds', 'summarize'] +
+            [name.replace(' ', '_') for name in ERROR_VALUES] +
+            DERIVED_METRICS)
+        numpy.testing.assert_array_equal(archive['window_sizes'], [3, 5, 9])
+        numpy.testing.assert_array_equal(archive['slope_thresholds'],
+                                         [0.5, 2.0])
+        for name in archive.files:
+            if name in ('window_sizes', 'slope_thresholds'):
+                continue
+            assert archive[name].shape == (3, 2)
+            # Only one combination was evaluated
+            assert numpy.isnan(archive[name]).sum() == 5
+        assert archive['true_positives'][1, 1] == 4
+        assert archive['summarize'][1, 1] == summary_index(4, 2, 1)
+        assert archive['precision'][1, 1] == 4 / 6.0
+
+def read_stream(path):
+    with open(path, newline='') as stream:
+        return list(csv.reader(stream))
+
+def test_stream_rows(tmp_path):
+    path = str(tmp_path / STREAM_FILE)
+    stream = ResultStream(path)
+    # The header is written before any combination
+    assert read_stream(path) == [ResultStream.columns]
+    stream.write('dem', 3, 0.5, {'true positives': 4,
+                                 'false positives': 6,
+                                 'false negatives': 1}, 1.23456)
+    # Every row is flushed as it is written
+    assert len(read_stream(path)) == 2
+    stream.write('dem', 5, 2.0, {'true positives': 3,
+                                 'false positives': 0,
+                                 'false negatives': 2})
+    stream.close()
+    assert read_stream(path)[1:] == [['dem', '3', '0.5', '4', '6', '1',
+                                      '-0.4', '1.235'],
+                                     ['dem', '5', '2.0', '3', '0', '2',
+                                      '0.6', '']]
+
+def test_sweep_stream(analyst, tmp_path):
+    peak_analyst = analyst()
+    peak_analyst.stream = ResultStream(str(tmp_path / STREAM_FILE))
+    try:
+        peak_analyst.sweep()
+    finally:
+        peak_analyst.stream.close()
+    rows = read_stream(str(tmp_path / STREAM_FILE))
+    assert rows[0] == ResultStream.columns
+    results = peak_analyst.results
+    # One row per combination, matching the results container
+    assert len(rows) - 1 == (len(results.window_sizes) *
+                             len(results.slope_thresholds))
+    combinations = set()
+    for row in rows[1:]:
+        assert row[0] == 'dem'
+        window, slope_threshold = int(row[1]), float(row[2])
+        combinations.add((window, slope_threshold))
+        counts = [int(value) for value in row[3:6]]
+        numpy.testing.assert_array_equal(
+            counts,
+            results.values[results.window_index[window],
+                           results.slope_index[slope_threshold]])
+        assert float(row[6]) == pytest.approx(summary_index(*counts))
+        assert float(row[7]) >= 0
+    assert len(combinations) == len(rows) - 1
@@ -0,0 +1,102 @@
+'''
+Tests of the low-memory mode: bit-packed peak masks must have the error
+values of boolean masks, and single precision fits must stay within their
+rounding bounds of double precision fits.
+'''
+
+import numpy
+import pytest
+from grass import script as grass
+
+from peak_parameters import (PEAK, FIT_PARAMETERS, FeatureClassifier,
+                             PackedMask, PeakPatches)
+
+@pytest.mark.parametrize('columns', [1, 8, 13, 120])
+def test_pack_round_trip(columns):
+    random = numpy.random.RandomState(columns)
+    mask = random.random_sample((17, columns)) < 0.5
+    packed = PackedMask.pack(mask)
+    assert packed.bits.shape == (17, -(-columns // 8))
+    numpy.testing.assert_array_equal(packed.unpack(), mask)
+    numpy.testing.assert_array_equal(packed.rows(3, 11), mask[3:11])
+
+@pytest.mark.parametrize('connectivity', [4, 8])
+@pytest.mark.parametrize('match_radius', [0, 25])
+@pytest.mark.parametrize('band_rows', [1, 7, None])
+def test_packed_patches(terrain, training, connectivity, match_radius,
+                        band_rows):
+    training_peaks = training(match_radius)
+    random = numpy.random.RandomState(connectivity)
+    mask = random.random_sample(terrain[0].shape) < 0.4
+    mask[training_peaks.cell_rows[::2], training_peaks.cell_cols[::2]] = True
+    stitcher = PackedMask.pack(mask).patches(training_peaks,
+                                             band_rows,
+                                             connectivity)
+    assert (stitcher.errors() ==
+            PeakPatches(mask, training_peaks, connectivity).errors())
+
+def test_packed_peaks(terrain):
+    classifier = FeatureClassifier(terrain[0],
+                                   grass.region()['ewres'],
+                                   dtype=numpy.float32,
+                                   band_cells=1000)
+    parameters = classifier.fit(5)
+    for slope_threshold in [0.5, 2, 5]:
+        numpy.testing.assert_array_equal(
+            classifier.packed_peaks(parameters, slope_threshold).unpack(),
+            classifier.classify(parameters, slope_threshold) == PEAK)
+
+@pytest.mark.parametrize('scale', [1, 100])
+@pytest.mark.parametrize('window', [3, 5, 9, 19])
+def test_rounding_bounds(terrain, scale, window):
+    resolution = grass.region()['ewres']
+    dem = terrain[0] * scale
+    exact = FeatureClassifier(dem, resolution).fit(window)
+    classifier = FeatureClassifier(dem,
+                                   resolution,
+                                   dtype=numpy.float32,
+                                   band_cells=1000)
+    single = classifier.fit(window)
+    assert set(single) == set(FIT_PARAMETERS)
+    slope_bound, curvature_bound = classifier.rounding_bounds(window)
+    # Besides the bounds, the float32 results themselves are rounded
+    rounded = numpy.finfo(numpy.float32).eps
+    for name, bound in [('slope', slope_bound),
+                        ('maxic', curvature_bound),
+                        ('minic', curvature_bound)]:
+        difference = numpy.abs(single[name] - exact[name])
+        limit = bound + rounded * numpy.abs(exact[name])
+        assert numpy.all(difference[numpy.isfinite(exact[name])] <=
+                         limit[numpy.isfinite(exact[name])])
+
+def test_share_keeps_rounding(terrain, tmp_path):
+    classifier = FeatureClassifier(terrain[0],
+                                   grass.region()['ewres'],
+                                   dtype=numpy.float32)
+    path = str(tmp_path / 'dem')
+    classifier.share(path)
+    attached = FeatureClassifier.attach(path, grass.region()['ewres'])
+    assert attached.rounding == classifier.rounding > 0
+    assert attached.rounding_bounds(3) == classifier.rounding_bounds(3)
+    for name in FIT_PARAMETERS:
+        numpy.testing.assert_array_equal(attached.fit(5)[name],
+                                         classifier.fit(5)[name])
+
+@pytest.mark.parametrize('overrides', [{},
+                                       {'match_radius': '25'},
+                                       {'connectivity': '4'},
+                                       {'tile_size': '32'}])
+def test_low_memory_sweep_matches_default(sweep, overrides):
+    numpy.testing.assert_array_equal(sweep('m', **overrides),
+                                     sweep(**overrides))
+
+def test_low_memory_refuses_large_rounding(terrain, sweep):
+    # A relief of several kilometres at 10 m cells rounds curvatures of
+    # small windows by more than the curvature tolerance
+    grass.add_raster('dem', terrain[0] * 100)
+    with pytest.raises(SystemExit):
+        sweep('m')
+    with pytest.raises(SystemExit):
+        sweep('m', tile_size='32')
+    # Larger windows average the rounding away
+    sweep('m', window_sizes='19')
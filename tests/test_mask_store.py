@@ -0,0 +1,72 @@
+'''
+Tests of the mask store: stored peak masks are evaluated against new
+training peaks without classifying the elevation model again.
+'''
+
+import os
+
+import numpy
+import pytest
+from grass import script as grass
+
+import peak_parameters
+from peak_parameters import MaskStore, PackedMask
+
+@pytest.mark.parametrize('shape', [(1, 1), (5, 13), (120, 121)])
+def test_round_trip(tmp_path, shape):
+    store = MaskStore(str(tmp_path), 'key')
+    assert store.get(3, 0.5) is None
+    mask = numpy.random.RandomState(shape[1]).random_sample(shape) < 0.3
+    store.put(3, 0.5, PackedMask.pack(mask))
+    stored = store.get(3, 0.5)
+    assert stored.shape == shape
+    numpy.testing.assert_array_equal(stored.bits,
+                                     numpy.packbits(mask, axis=1))
+    numpy.testing.assert_array_equal(stored.unpack(), mask)
+    # Only the renamed mask is left behind
+    assert os.listdir(store.directory) == [os.path.basename(
+        store.path(3, 0.5))]
+    store.invalidate()
+    assert store.get(3, 0.5) is None
+
+@pytest.fixture
+def fitted(monkeypatch):
+    '''
+    Records the window sizes that FeatureClassifier fits.
+    '''
+
+    windows = []
+    fit = peak_parameters.FeatureClassifier.fit
+
+    def record(classifier, window):
+        windows.append(window)
+        return fit(classifier, window)
+    monkeypatch.setattr(peak_parameters.FeatureClassifier, 'fit', record)
+    return windows
+
+@pytest.mark.parametrize('flags', ['', 'm'])
+def test_new_training_peaks(terrain, sweep, fitted, tmp_path, monkeypatch,
+                            flags):
+    if flags == 'm':
+        # The low-memory mode never unpacks a whole mask
+        def unpack(mask):
+            raise AssertionError('A whole mask was unpacked.')
+        monkeypatch.setattr(PackedMask, 'unpack', unpack)
+    directory = str(tmp_path / 'masks')
+    first = sweep(flags, mask_directory=directory)
+    assert fitted
+    del fitted[:]
+    numpy.testing.assert_array_equal(sweep(flags, mask_directory=directory),
+                                     first)
+    assert fitted == []
+    # New training peaks are evaluated on the stored masks
+    grass.add_points('peaks', terrain[1][:5])
+    stored = sweep(flags, mask_directory=directory, match_radius='25')
+    assert fitted == []
+    numpy.testing.assert_array_equal(stored,
+                                     sweep(flags, match_radius='25'))
+    assert fitted
+    # Other classification settings have their own masks
+    del fitted[:]
+    sweep(flags, mask_directory=directory, pyramid_window='5')
+    assert fitted
@@ -0,0 +1,63 @@
+'''
+Tests of tolerance-radius matching: a training peak matches a patch if any
+cell of the patch lies within the match radius of the peak's cell.
+'''
+
+import numpy
+import pytest
+from grass import script as grass
+
+from peak_parameters import PeakPatches, label_patches
+
+def distances(training_peaks, shape):
+    '''
+    Computes the distance in map units from every cell to the cell of every
+    training peak by brute force.
+    @return distances: Array of shape + (number of occupied cells,)
+    '''
+
+    nsres, ewres = training_peaks.resolution
+    rows, cols = numpy.mgrid[0:shape[0], 0:shape[1]]
+    return numpy.hypot(
+        (rows[..., None] - training_peaks.cell_rows) * nsres,
+        (cols[..., None] - training_peaks.cell_cols) * ewres)
+
+@pytest.mark.parametrize('match_radius', [10, 25, 42])
+def test_near(terrain, training, match_radius):
+    training_peaks = training(match_radius)
+    shape = terrain[0].shape
+    near = (distances(training_peaks, shape) <= match_radius).any(axis=-1)
+    numpy.testing.assert_array_equal(training_peaks.near(), near)
+    # Blocks of the raster see the peaks within reach outside of them
+    numpy.testing.assert_array_equal(training_peaks.near(30, 64, 7, 90),
+                                     near[30:64, 7:90])
+
+@pytest.mark.parametrize('connectivity', [4, 8])
+@pytest.mark.parametrize('match_radius', [10, 25])
+def test_patches_within_radius(terrain, training, connectivity, match_radius):
+    training_peaks = training(match_radius)
+    random = numpy.random.RandomState(connectivity)
+    mask = random.random_sample(terrain[0].shape) < 0.05
+    within = distances(training_peaks, mask.shape) <= match_radius
+    labels, patches = label_patches(mask, connectivity)
+    found = numpy.unique(labels[within.any(axis=-1) & mask])
+    covered = (within & mask[..., None]).any(axis=(0, 1))
+    errors = PeakPatches(mask, training_peaks, connectivity).errors()
+    assert errors['true positives'] == len(found) > 0
+    assert errors['false positives'] == patches - len(found)
+    assert errors['false negatives'] == int(
+        training_peaks.counts[~covered].sum())
+
+@pytest.mark.parametrize('connectivity', ['4', '8'])
+def test_radius_sweeps_agree(sweep, connectivity):
+    whole = sweep(match_radius='25', connectivity=connectivity)
+    # The radius covers peaks that exact matching misses
+    assert (numpy.nansum(whole[:, :, 2]) <
+            numpy.nansum(sweep(connectivity=connectivity)[:, :, 2]))
+    numpy.testing.assert_array_equal(
+        sweep(match_radius='25', tile_size='32', connectivity=connectivity),
+        whole)
+    numpy.testing.assert_array_equal(
+        sweep(match_radius='25', sweep='incremental',
+              connectivity=connectivity),
+        whole)
@@ -0,0 +1,52 @@
+'''
+Tests of the window moment sums: summed-area tables must give the sums of
+the direct window convolutions, also around null cells.
+'''
+
+import numpy
+import pytest
+from grass import script as grass
+
+from peak_parameters import FIT_PARAMETERS, FeatureClassifier
+
+def classifiers(dem):
+    resolution = grass.region()['ewres']
+    return (FeatureClassifier(dem, resolution, moments='sat'),
+            FeatureClassifier(dem, resolution, moments='convolve'))
+
+@pytest.fixture
+def holes(terrain):
+    '''
+    The terrain with blocks and single cells of nulls.
+    '''
+
+    dem = terrain[0].copy()
+    dem[40:46, 50:53] = numpy.nan
+    dem[90, 10] = numpy.nan
+    dem[:, -1] = numpy.nan
+    return dem
+
+@pytest.mark.parametrize('window', [3, 5, 15, 31])
+def test_summed_moments(holes, window):
+    summed, convolved = classifiers(holes)
+    expected = convolved.window_moments(window)
+    moments = summed.window_moments(window, 10, 70)
+    for name in expected:
+        numpy.testing.assert_allclose(moments[name],
+                                      expected[name][10:70 - window + 1],
+                                      rtol=1e-9,
+                                      atol=1e-6)
+
+@pytest.mark.parametrize('window', [3, 15, 31])
+def test_summed_fits(holes, window):
+    summed, convolved = classifiers(holes)
+    fitted = summed.fit(window)
+    expected = convolved.fit(window)
+    for name in FIT_PARAMETERS:
+        # Cells next to the nulls stay unclassified
+        numpy.testing.assert_array_equal(numpy.isnan(fitted[name]),
+                                         numpy.isnan(expected[name]))
+        numpy.testing.assert_allclose(fitted[name],
+                                      expected[name],
+                                      rtol=1e-6,
+                                      atol=1e-9)
@@ -0,0 +1,85 @@
+'''
+Tests of ResultsContainer and of the CSV export of its matrices.
+'''
+
+import csv
+
+import numpy
+import pytest
+
+from peak_parameters import (ERROR_VALUES, Exporter, ResultsContainer,
+                             summary_index)
+
+# Error values by (window, slope threshold); (5, 2.0) is never evaluated
+ERRORS = {(3, 0.5): (4, 6, 1),
+          (3, 2.0): (3, 0, 2),
+          (5, 0.5): (5, 1, 0)}
+
+@pytest.fixture
+def container():
+    results = ResultsContainer([3, 5], [0.5, 2.0], ERROR_VALUES)
+    for (window, slope_threshold), errors in ERRORS.items():
+        for error_value, count in zip(ERROR_VALUES, errors):
+            results.add_error(window, slope_threshold, error_value, count)
+    return results
+
+def test_metric(container):
+    tp, fp, fn = [container.metric(name) for name in ERROR_VALUES]
+    assert tp.shape == (2, 2)
+    numpy.testing.assert_array_equal(tp, [[4, 3], [5, numpy.nan]])
+    numpy.testing.assert_array_equal(fp, [[6, 0], [1, numpy.nan]])
+    numpy.testing.assert_array_equal(fn, [[1, 2], [0, numpy.nan]])
+    numpy.testing.assert_allclose(container.metric('summarize'),
+                                  [[-2 / 5.0, 3 / 5.0], [4 / 5.0, numpy.nan]])
+    numpy.testing.assert_allclose(container.metric('precision'),
+                                  [[0.4, 1.0], [5 / 6.0, numpy.nan]])
+    numpy.testing.assert_allclose(container.metric('recall'),
+                                  [[0.8, 0.6], [1.0, numpy.nan]])
+    numpy.testing.assert_allclose(container.metric('f1'),
+                                  [[8 / 15.0, 0.75], [10 / 11.0, numpy.nan]])
+    with pytest.raises(ValueError):
+        container.metric('accuracy')
+
+def test_metric_without_detections():
+    container = ResultsContainer([3], [1.0], ERROR_VALUES)
+    for error_value, count in zip(ERROR_VALUES, (0, 0, 4)):
+        container.add_error(3, 1.0, error_value, count)
+    # No detections leave the precision undefined
+    assert numpy.isnan(container.metric('precision')[0, 0])
+    assert container.metric('recall')[0, 0] == 0
+    assert container.metric('f1')[0, 0] == 0
+
+def read_csv(path):
+    with open(path, newline='') as stream:
+        return list(csv.reader(stream))
+
+def test_export_csv(container, tmp_path):
+    flags = dict((flag, True) for flag in 'tfns')
+    Exporter(container,
+             flags,
+             {'export_directory': str(tmp_path), 'formats': 'csv'},
+             print_table=False)
+    header = ['window_size', 'threshold_0.5', 'threshold_2.0']
+    for name in ERROR_VALUES:
+        table = read_csv(str(tmp_path / (name.replace(' ', '_') + '.csv')))
+        assert table[0] == header
+        column = ERROR_VALUES.index(name)
+        # Counts are integers, the combination that was never evaluated is
+        # left empty
+        assert table[1:] == [['3',
+                              str(ERRORS[(3, 0.5)][column]),
+                              str(ERRORS[(3, 2.0)][column])],
+                             ['5', str(ERRORS[(5, 0.5)][column]), '']]
+    for name in ['summarize', 'precision', 'recall', 'f1']:
+        table = read_csv(str(tmp_path / (name + '.csv')))
+        assert table[0] == header
+        assert [row[0] for row in table[1:]] == ['3', '5']
+        assert table[2][2] == ''
+        expected = container.metric(name)
+        for row in range(2):
+            for column in range(2):
+                if (row, column) != (1, 1):
+                    assert float(table[row + 1][column + 1]) == \
+                        pytest.approx(expected[row, column], rel=1e-11)
+    table = read_csv(str(tmp_path / 'summarize.csv'))
+    assert float(table[1][1]) == pytest.approx(summary_index(4, 6, 1))
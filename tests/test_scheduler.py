@@ -0,0 +1,161 @@
+'''
+Tests of the ModuleScheduler and of the concurrent module chains of the GRASS
+engine. grass.make_command() is replaced by a command running a stand-in
+module, a Python snippet that logs its start and end and prints a given
+number of lines, so no GRASS modules are run.
+'''
+
+import asyncio
+import sys
+
+import pytest
+from grass import script as grass
+
+from peak_parameters import ModuleScheduler, map_name
+
+MODULE = '''
+import sys, time
+log, label, lines = sys.argv[1:]
+with open(log, 'a') as stream:
+    stream.write('start ' + label + '\\n')
+time.sleep(0.05)
+sys.stdout.write('x\\n' * int(lines))
+with open(log, 'a') as stream:
+    stream.write('end ' + label + '\\n')
+'''
+
+@pytest.fixture
+def modules(monkeypatch, tmp_path):
+    '''
+    Replaces grass.make_command() with one making stand-in modules.
+    @return log, lines: The path of the log of the started and ended
+                        modules, and a function that returns the number of
+                        lines a module prints for its name and parameters
+    '''
+
+    log = str(tmp_path / 'modules.log')
+    settings = {'lines': lambda module, kwargs: 0}
+
+    def make_command(module, **kwargs):
+        label = kwargs.pop('label', module)
+        kwargs.pop('quiet', None)
+        return [sys.executable, '-S', '-c', MODULE, log, label,
+                str(settings['lines'](module, kwargs))]
+    monkeypatch.setattr(grass, 'make_command', make_command, raising=False)
+
+    def set_lines(function):
+        settings['lines'] = function
+    return log, set_lines
+
+def read_log(log):
+    with open(log) as stream:
+        return [line.split() for line in stream.read().splitlines()]
+
+def most_in_flight(events):
+    '''
+    Returns the largest number of modules that were started and had not
+    ended yet.
+    '''
+
+    running = most = 0
+    for event, label in events:
+        running += 1 if event == 'start' else -1
+        most = max(most, running)
+    return most
+
+def test_priority(modules):
+    log = modules[0]
+    scheduler = ModuleScheduler(1)
+
+    async def run():
+        # The first module takes the slot, the others wait for it
+        await asyncio.gather(scheduler.run((3, 1.0), 0, 'm', label='first'),
+                             scheduler.run((5, 1.0), 0, 'm', label='new'),
+                             scheduler.run((9, 1.0), 2, 'm', label='later'),
+                             scheduler.run((3, 2.0), 2, 'm', label='lower'),
+                             scheduler.run((5, 1.0), 1, 'm', label='next'))
+    asyncio.run(run())
+    events = read_log(log)
+    assert most_in_flight(events) == 1
+    # Later stages go first, then lower combinations
+    assert [label for event, label in events if event == 'start'] == \
+        ['first', 'lower', 'later', 'next', 'new']
+    assert scheduler.running == 0
+
+@pytest.mark.parametrize('limit', [1, 3])
+def test_limit(modules, limit):
+    log = modules[0]
+    scheduler = ModuleScheduler(limit)
+
+    async def run():
+        return await asyncio.gather(*[scheduler.run((3, 1.0),
+                                                    index % 3,
+                                                    'm',
+                                                    label=str(index))
+                                      for index in range(12)])
+    assert asyncio.run(run()) == [''] * 12
+    events = read_log(log)
+    assert len(events) == 24
+    assert most_in_flight(events) == limit
+    assert scheduler.running == 0
+
+def test_failure(modules):
+    modules[1](lambda module, kwargs: 'x')
+    scheduler = ModuleScheduler(1)
+    with pytest.raises(SystemExit):
+        asyncio.run(scheduler.run((3, 1.0), 0, 'm'))
+
+# Training peaks of the evaluation
+TRAINING = 10
+# Counts of true positives, found training peaks and peak areas of
+# combinations above (summary index 0.7) and below (0.2) the floor
+GOOD = (8, 8, 9)
+BAD = (2, 2, 2)
+
+def counts(analyst, tasks, bad):
+    '''
+    Returns a function that prints the lines of v.db.select for the
+    combinations, so that those in bad have the BAD counts and the others
+    the GOOD ones.
+    '''
+
+    names = dict(('p_' + map_name(analyst.prefix, *task) + '_peaks', task)
+                 for task in tasks)
+
+    def lines(module, kwargs):
+        if module != 'v.db.select':
+            return 0
+        name = kwargs['map']
+        for suffix, column in [('_tp', 0), ('_found', 1), ('', 2)]:
+            if name.endswith('_peaks' + suffix):
+                task = names[name[:len(name) - len(suffix)]]
+                return (BAD if task in bad else GOOD)[column]
+    return lines
+
+def test_summary_floor(modules, analyst):
+    log, set_lines = modules
+    peak_analyst = analyst(engine='grass',
+                           validation='vector',
+                           concurrent_modules='2',
+                           min_summary='0.5')
+    # Counted by sweep_async() before the chains start
+    peak_analyst.training_count = TRAINING
+    tasks = [(window, slope_threshold) for window in [3, 5]
+             for slope_threshold in [1.0, 2.0, 3.0, 4.0, 5.0]]
+    set_lines(counts(peak_analyst, tasks, [(5, 2.0)]))
+    skipped, cancelled = asyncio.run(peak_analyst.evaluate_async(tasks))
+    # The window's thresholds above the first one below the floor are left
+    # out, and at most one of them was classified in vain
+    assert skipped == [(5, 3.0), (5, 4.0), (5, 5.0)]
+    assert len(cancelled) <= 1
+    assert set(cancelled) <= set(skipped)
+    assert sorted(peak_analyst.evaluated) == tasks[:7]
+    assert peak_analyst.evaluated[(3, 1.0)] == {'true positives': 8,
+                                                'false positives': 1,
+                                                'false negatives': 2}
+    assert peak_analyst.evaluated[(5, 2.0)] == {'true positives': 2,
+                                                'false positives': 0,
+                                                'false negatives': 8}
+    classified = [label for event, label in read_log(log)
+                  if event == 'start' and label == 'r.param.scale']
+    assert len(classified) <= 8
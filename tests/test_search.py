@@ -0,0 +1,31 @@
+'''
+Tests of the coarse-to-fine search of the parameter range.
+'''
+
+import pytest
+
+from peak_parameters import SEARCH_SLOPE_STEP
+
+@pytest.mark.parametrize('slope_thresholds', ['0.5,5', '0.25,4.33'])
+def test_search(analyst, slope_thresholds):
+    peak_analyst = analyst(search='refine',
+                           budget='20',
+                           window_sizes='3,9',
+                           slope_thresholds=slope_thresholds)
+    window, slope_threshold, summary = peak_analyst.search()
+    bounds = [float(bound) for bound in slope_thresholds.split(',')]
+    assert len(peak_analyst.evaluated) <= 20
+    for window_size, threshold in peak_analyst.evaluated:
+        assert window_size in (3, 5, 7, 9)
+        assert bounds[0] <= threshold <= bounds[1]
+        # Slope thresholds are on the step or at the bounds of the range
+        steps = threshold / SEARCH_SLOPE_STEP
+        assert threshold in bounds or steps == pytest.approx(round(steps))
+    # The best combination is one of those evaluated, and the results hold
+    # them all
+    results = peak_analyst.results
+    assert (window, slope_threshold) in peak_analyst.evaluated
+    assert summary == max(
+        results.metric('summarize')[results.window_index[window_size],
+                                    results.slope_index[threshold]]
+        for window_size, threshold in peak_analyst.evaluated)
@@ -0,0 +1,59 @@
+'''
+Tests of the standalone entry point, which runs peak_parameters.py on files
+without a GRASS session.
+'''
+
+import csv
+
+import numpy
+import pytest
+from grass import script as grass
+
+import peak_parameters
+import peak_parameters_standalone
+from peak_parameters import (ERROR_VALUES, FeatureClassifier, summary_index,
+                             sweep_slope_thresholds)
+
+def read_csv(path):
+    with open(path, newline='') as stream:
+        return list(csv.reader(stream))
+
+def test_main(files, training, tmp_path, monkeypatch):
+    # main() switches peak_parameters to a file session, which is undone
+    # after the test
+    monkeypatch.setattr(peak_parameters, 'grass', peak_parameters.grass)
+    dem, peaks = files
+    export_directory = tmp_path / 'results'
+    export_directory.mkdir()
+    peak_parameters_standalone.main(['dem=' + dem,
+                                     'peaks=' + peaks,
+                                     'export_directory=' +
+                                     str(export_directory),
+                                     'window_sizes=3,5',
+                                     'slope_thresholds=1-3:1',
+                                     '-tfns'])
+    assert isinstance(peak_parameters.grass,
+                      peak_parameters_standalone.FileSession)
+    # The elevations as written to the grid
+    classifier = FeatureClassifier(numpy.loadtxt(dem, skiprows=6),
+                                   grass.region()['ewres'])
+    expected = dict((window, sweep_slope_thresholds(classifier.fit(window),
+                                                    [1, 2, 3],
+                                                    training()))
+                    for window in [3, 5])
+    tables = dict((name, read_csv(str(export_directory /
+                                      (name.replace(' ', '_') + '.csv'))))
+                  for name in ERROR_VALUES + ['summarize'])
+    for table in tables.values():
+        assert table[0] == ['window_size', 'threshold_1', 'threshold_2',
+                            'threshold_3']
+        assert [row[0] for row in table[1:]] == ['3', '5']
+    for row, window in enumerate([3, 5], 1):
+        for column, slope_threshold in enumerate([1, 2, 3], 1):
+            errors = expected[window][slope_threshold]
+            for name in ERROR_VALUES:
+                assert int(tables[name][row][column]) == errors[name]
+            assert float(tables['summarize'][row][column]) == pytest.approx(
+                summary_index(*[errors[name] for name in ERROR_VALUES]))
+    assert sum(int(value) for row in tables['true positives'][1:]
+               for value in row[1:]) > 0
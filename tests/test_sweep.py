@@ -0,0 +1,54 @@
+'''
+Tests of the slope threshold parsing and of the incremental sweep, which
+must count the same error values as labeling the peak mask of every slope
+threshold on its own.
+'''
+
+import numpy
+import pytest
+from grass import script as grass
+
+from peak_parameters import (PEAK, FeatureClassifier, PeakPatches,
+                             parse_slope_thresholds, sweep_slope_thresholds)
+
+THRESHOLDS = [0, 0.5, 1, 2, 3.5, 5, 10]
+
+def test_parse_slope_thresholds():
+    assert parse_slope_thresholds('1-3:1,4.5') == [1, 2, 3, 4.5]
+    assert parse_slope_thresholds('0-1:0.25') == [0, 0.25, 0.5, 0.75, 1]
+    assert parse_slope_thresholds(' 2 , 0.1-0.3:0.1') == [2, 0.1, 0.2, 0.3]
+    # Exponents are numbers, not ranges
+    assert parse_slope_thresholds('1e-3,2E-1') == [0.001, 0.2]
+    assert parse_slope_thresholds('1e-3-3e-3:1e-3') == [0.001, 0.002, 0.003]
+    assert parse_slope_thresholds('0-2e-1:1e-1') == [0, 0.1, 0.2]
+
+@pytest.mark.parametrize('thresholds', ['a', '1-3', '1-x:1', '1-3:0',
+                                        '1-3:-1', '3-1:1', '-1', 'nan',
+                                        '3:1', '-1-3:1', '1e-3:1'])
+def test_parse_slope_thresholds_rejects(thresholds):
+    with pytest.raises(SystemExit):
+        parse_slope_thresholds(thresholds)
+
+@pytest.mark.parametrize('connectivity', [4, 8])
+@pytest.mark.parametrize('match_radius', [0, 25])
+def test_sweep_matches_patches(terrain, training, connectivity, match_radius):
+    classifier = FeatureClassifier(terrain[0], grass.region()['ewres'])
+    training_peaks = training(match_radius)
+    for window in [3, 5, 9]:
+        parameters = classifier.fit(window)
+        errors = sweep_slope_thresholds(parameters,
+                                        THRESHOLDS,
+                                        training_peaks,
+                                        connectivity=connectivity)
+        for slope_threshold in THRESHOLDS:
+            mask = classifier.classify(parameters, slope_threshold) == PEAK
+            patches = PeakPatches(mask, training_peaks, connectivity)
+            assert errors[slope_threshold] == patches.errors()
+
+@pytest.mark.parametrize('connectivity', ['4', '8'])
+def test_incremental_sweep_matches_grid(sweep, connectivity):
+    grid = sweep(connectivity=connectivity)
+    # Some true positives, so that the sweeps are compared on found peaks
+    assert numpy.nansum(grid[:, :, 0]) > 0
+    numpy.testing.assert_array_equal(
+        sweep(sweep='incremental', connectivity=connectivity), grid)
@@ -0,0 +1,58 @@
+'''
+Tests of tiled processing: a peak mask stitched together tile by tile must
+have the error values of the whole mask.
+'''
+
+import numpy
+import pytest
+
+from peak_parameters import PatchStitcher, PeakPatches
+
+def stitch(mask, training_peaks, tile_rows, tile_cols, connectivity):
+    '''
+    Counts the error values of mask with a PatchStitcher, adding it in tiles
+    of tile_rows by tile_cols cells, as PeakAnalyst.sweep_tiled() does.
+    '''
+
+    rows, columns = mask.shape
+    stitcher = PatchStitcher(columns, training_peaks, connectivity)
+    for row0 in range(0, rows, tile_rows):
+        row1 = min(row0 + tile_rows, rows)
+        for col0 in range(0, columns, tile_cols):
+            col1 = min(col0 + tile_cols, columns)
+            tile = mask[row0:row1, col0:col1]
+            point_rows, point_cols, point_counts = training_peaks.in_block(
+                row0, row1, col0, col1)
+            covered = tile[point_rows, point_cols]
+            stitcher.add_tile(tile,
+                              col0,
+                              training_peaks.near(row0, row1, col0, col1),
+                              int(point_counts[~covered].sum()))
+        stitcher.end_band()
+    return stitcher.errors()
+
+@pytest.mark.parametrize('connectivity', [4, 8])
+@pytest.mark.parametrize('density', [0.3, 0.6])
+@pytest.mark.parametrize('tile_rows, tile_cols', [(1, 1), (7, 13),
+                                                   (32, 32), (120, 5)])
+def test_stitched_patches(terrain, training, connectivity, density,
+                          tile_rows, tile_cols):
+    training_peaks = training()
+    random = numpy.random.RandomState(int(density * 10) + connectivity)
+    mask = random.random_sample(terrain[0].shape) < density
+    # Cover some training peaks, so that true positives are counted
+    mask[training_peaks.cell_rows[::2], training_peaks.cell_cols[::2]] = True
+    whole = PeakPatches(mask, training_peaks, connectivity).errors()
+    assert whole['true positives'] > 0
+    assert stitch(mask,
+                  training_peaks,
+                  tile_rows,
+                  tile_cols,
+                  connectivity) == whole
+
+@pytest.mark.parametrize('connectivity', ['4', '8'])
+def test_tiled_sweep_matches_whole(sweep, connectivity):
+    whole = sweep(connectivity=connectivity)
+    for tile_size in ['16', '50']:
+        numpy.testing.assert_array_equal(
+            sweep(tile_size=tile_size, connectivity=connectivity), whole)
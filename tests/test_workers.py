@@ -0,0 +1,23 @@
+'''
+Tests of sweeps in pools of worker processes. Workers need a session they
+can set up on their own, so these run on files in a standalone session.
+'''
+
+import numpy
+
+import peak_parameters
+from peak_parameters_standalone import FileSession
+
+def test_worker_timings(files, analyst, monkeypatch):
+    monkeypatch.setattr(peak_parameters, 'grass', FileSession('x', 'y'))
+    dem, peaks = files
+    serial = analyst(dem=dem, peaks=peaks)
+    serial.sweep()
+    parallel = analyst(dem=dem, peaks=peaks, workers='2')
+    parallel.sweep()
+    numpy.testing.assert_array_equal(parallel.results.values,
+                                     serial.results.values)
+    # The stages timed in the workers are added to the parent's timings
+    assert set(serial.timings) >= set(['fit', 'classify', 'label',
+                                       'evaluate'])
+    assert set(parallel.timings) == set(serial.timings)